@@ -0,0 +1,67 @@
+"""
+Índice en memoria id_mesa -> id de la comanda pendiente (ticket abierto) de esa mesa.
+
+Se reconstruye al iniciar el servicio y lo mantienen los handlers de creación,
+modificación y cambio de estado. Ante cualquier duda (otro proceso modificó
+la comanda, se borró la base en tests, etc.) se vuelve a consultar la base
+usando el índice parcial `ix_comandas_id_mesa_pendiente`.
+"""
+import threading
+
+from sqlalchemy import func, select, text
+from sqlalchemy.orm import Session
+
+from . import models
+
+# Debe coincidir literalmente con el WHERE del índice parcial para que SQLite lo use
+PENDIENTE_SQL = text("comandas.estado = 'pendiente'")
+
+
+class IndiceComandasAbiertas:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._por_mesa: dict[int, int] = {}
+
+    def reconstruir(self, db: Session) -> None:
+        """Carga todas las comandas pendientes (la más reciente por mesa)"""
+        filas = db.execute(
+            select(models.Comanda.id_mesa, func.max(models.Comanda.id))
+            .where(PENDIENTE_SQL)
+            .group_by(models.Comanda.id_mesa)
+        ).all()
+        with self._lock:
+            self._por_mesa = {id_mesa: id_comanda for id_mesa, id_comanda in filas}
+
+    def actualizar_mesa(self, db: Session, id_mesa: int) -> int | None:
+        """Vuelve a calcular la comanda abierta de una mesa desde la base"""
+        id_comanda = db.scalar(
+            select(func.max(models.Comanda.id))
+            .where(models.Comanda.id_mesa == id_mesa, PENDIENTE_SQL)
+        )
+        with self._lock:
+            if id_comanda is None:
+                self._por_mesa.pop(id_mesa, None)
+            else:
+                self._por_mesa[id_mesa] = id_comanda
+        return id_comanda
+
+    def registrar(self, id_mesa: int, id_comanda: int) -> None:
+        with self._lock:
+            actual = self._por_mesa.get(id_mesa)
+            if actual is None or id_comanda > actual:
+                self._por_mesa[id_mesa] = id_comanda
+
+    def obtener(self, db: Session, id_mesa: int) -> models.Comanda | None:
+        """Devuelve la comanda pendiente de la mesa, validando la entrada del índice"""
+        with self._lock:
+            id_comanda = self._por_mesa.get(id_mesa)
+        if id_comanda is not None:
+            comanda = db.get(models.Comanda, id_comanda)
+            if comanda is not None and comanda.id_mesa == id_mesa and comanda.estado == models.EstadoComanda.pendiente:
+                return comanda
+
+        id_comanda = self.actualizar_mesa(db, id_mesa)
+        return db.get(models.Comanda, id_comanda) if id_comanda is not None else None
+
+
+indice_abiertas = IndiceComandasAbiertas()
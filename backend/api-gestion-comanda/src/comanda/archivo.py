@@ -0,0 +1,182 @@
+"""
+Archivo frío de comandas cerradas.
+
+Las comandas `pagada`/`anulada` con fecha anterior a N días se mueven, junto
+con sus detalles, a las tablas `comandas_archivo` y `detalle_comandas_archivo`.
+El movimiento se hace en lotes chicos con un commit por lote para no retener
+el lock de escritura de SQLite durante mucho tiempo.
+
+Las tablas activas usan AUTOINCREMENT: sin eso SQLite vuelve a entregar el id
+de la última comanda si se archivó, y el siguiente archivado choca con la
+copia que ya está en el archivo. `asegurar_autoincrement` migra bases
+creadas antes.
+
+Las lecturas siguen siendo transparentes: `GET /comanda/{id}` busca también
+en el archivo y `GET /comanda/?include_archived=true` une ambas tablas.
+
+Uso (desde la carpeta del servicio):
+
+    python -m src.comanda.archivo --dias 30 --lote 500
+"""
+import argparse
+import time
+from datetime import date, timedelta
+
+from sqlalchemy import MetaData, delete, func, insert, select, text, union_all
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+from sqlalchemy.schema import CreateTable
+
+from . import models
+from .filters import ComandaFilter, ComandaArchivadaFilter
+
+ESTADOS_CERRADOS = (models.EstadoComanda.pagada, models.EstadoComanda.anulada)
+
+COLUMNAS_COMANDA = ["id", "id_mesa", "id_mozo", "id_reserva", "fecha", "estado", "created_at", "total", "items_count"]
+COLUMNAS_DETALLE = ["id", "id_comanda", "id_producto", "cantidad", "precio_unitario"]
+
+
+def _columnas(modelo, nombres: list[str]) -> list:
+    return [getattr(modelo, nombre) for nombre in nombres]
+
+
+def archivar_comandas(db: Session, dias: int, lote: int = 500, pausa: float = 0.0) -> int:
+    """
+    Mueve al archivo las comandas cerradas con fecha anterior a hoy - dias.
+    Devuelve la cantidad de comandas archivadas.
+    """
+    limite = date.today() - timedelta(days=dias)
+    archivadas = 0
+    while True:
+        ids = db.scalars(
+            select(models.Comanda.id)
+            .where(models.Comanda.estado.in_(ESTADOS_CERRADOS), models.Comanda.fecha < limite)
+            .order_by(models.Comanda.id)
+            .limit(lote)
+        ).all()
+        if not ids:
+            break
+
+        db.execute(
+            insert(models.ComandaArchivada).from_select(
+                COLUMNAS_COMANDA,
+                select(*_columnas(models.Comanda, COLUMNAS_COMANDA)).where(models.Comanda.id.in_(ids)),
+            )
+        )
+        db.execute(
+            insert(models.DetalleComandaArchivada).from_select(
+                COLUMNAS_DETALLE,
+                select(*_columnas(models.DetalleComanda, COLUMNAS_DETALLE)).where(models.DetalleComanda.id_comanda.in_(ids)),
+            )
+        )
+        db.execute(
+            delete(models.DetalleComanda)
+            .where(models.DetalleComanda.id_comanda.in_(ids))
+            .execution_options(synchronize_session=False)
+        )
+        db.execute(
+            delete(models.Comanda)
+            .where(models.Comanda.id.in_(ids))
+            .execution_options(synchronize_session=False)
+        )
+        db.commit()
+        archivadas += len(ids)
+
+        if pausa:
+            # Deja pasar otras escrituras entre lotes
+            time.sleep(pausa)
+    return archivadas
+
+
+def asegurar_autoincrement(engine: Engine) -> None:
+    """
+    Reconstruye con AUTOINCREMENT las tablas activas creadas sin él y deja la
+    secuencia de ids después del más alto, activo o archivado.
+    """
+    if engine.dialect.name != "sqlite":
+        return
+    pares = ((models.Comanda, models.ComandaArchivada), (models.DetalleComanda, models.DetalleComandaArchivada))
+    with engine.begin() as conn:
+        for modelo, archivo in pares:
+            tabla = modelo.__table__
+            ddl = conn.scalar(
+                text("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = :nombre"),
+                {"nombre": tabla.name},
+            )
+            if "AUTOINCREMENT" not in ddl.upper():
+                # SQLite no permite agregarlo con ALTER: tabla nueva, copia y renombre
+                metadata = MetaData()
+                models.Comanda.__table__.to_metadata(metadata)  # para resolver la FK de los detalles
+                nueva = tabla.to_metadata(metadata, name=f"{tabla.name}_nueva")
+                columnas = ", ".join(c.name for c in tabla.columns)
+                conn.execute(CreateTable(nueva))
+                conn.exec_driver_sql(f"INSERT INTO {nueva.name} ({columnas}) SELECT {columnas} FROM {tabla.name}")
+                conn.exec_driver_sql(f"DROP TABLE {tabla.name}")
+                conn.exec_driver_sql(f"ALTER TABLE {nueva.name} RENAME TO {tabla.name}")
+                for index in tabla.indexes:
+                    index.create(bind=conn)
+
+            maximo = max(
+                conn.scalar(select(func.max(tabla.c.id))) or 0,
+                conn.scalar(select(func.max(archivo.__table__.c.id))) or 0,
+            )
+            actual = conn.scalar(text("SELECT seq FROM sqlite_sequence WHERE name = :nombre"), {"nombre": tabla.name})
+            if actual is None:
+                conn.execute(
+                    text("INSERT INTO sqlite_sequence (name, seq) VALUES (:nombre, :seq)"),
+                    {"nombre": tabla.name, "seq": maximo},
+                )
+            elif actual < maximo:
+                conn.execute(
+                    text("UPDATE sqlite_sequence SET seq = :seq WHERE name = :nombre"),
+                    {"nombre": tabla.name, "seq": maximo},
+                )
+
+
+def query_con_archivo(filtro: ComandaFilter):
+    """Arma un SELECT que une comandas activas y archivadas aplicando el mismo filtro y orden"""
+    filtro_archivo = ComandaArchivadaFilter.model_validate(filtro.model_dump())
+    activas = filtro.filter(select(*_columnas(models.Comanda, COLUMNAS_COMANDA)))
+    archivadas = filtro_archivo.filter(select(*_columnas(models.ComandaArchivada, COLUMNAS_COMANDA)))
+    union = union_all(activas, archivadas).subquery()
+
+    query = select(union)
+    for campo in filtro.ordering_values or []:
+        descendente = campo.startswith("-")
+        columna = union.c[campo.lstrip("+-")]
+        query = query.order_by(columna.desc() if descendente else columna.asc())
+    return query
+
+
+def cargar_detalles(db: Session, filas) -> list[dict]:
+    """Transformer de paginación: agrega los detalles a cada fila con una consulta por tabla"""
+    comandas = [dict(fila._mapping) for fila in filas]
+    ids = [c["id"] for c in comandas]
+    detalles_por_comanda: dict[int, list] = {id_: [] for id_ in ids}
+    for modelo in (models.DetalleComanda, models.DetalleComandaArchivada):
+        for detalle in db.scalars(select(modelo).where(modelo.id_comanda.in_(ids))):
+            detalles_por_comanda[detalle.id_comanda].append(detalle)
+    for comanda in comandas:
+        comanda["detalles_comanda"] = detalles_por_comanda[comanda["id"]]
+    return comandas
+
+
+if __name__ == "__main__":
+    from ..database import SessionLocal, engine
+    from .totales import asegurar_columnas_totales
+
+    parser = argparse.ArgumentParser(description="Archiva comandas cerradas hace más de N días")
+    parser.add_argument("--dias", type=int, default=30)
+    parser.add_argument("--lote", type=int, default=500)
+    parser.add_argument("--pausa", type=float, default=0.05, help="Segundos de espera entre lotes")
+    args = parser.parse_args()
+
+    models.Base.metadata.create_all(bind=engine)
+    asegurar_columnas_totales(engine)
+    asegurar_autoincrement(engine)
+    db = SessionLocal()
+    try:
+        cantidad = archivar_comandas(db, args.dias, args.lote, args.pausa)
+        print(f"{cantidad} comandas archivadas")
+    finally:
+        db.close()
@@ -0,0 +1,56 @@
+from collections import defaultdict
+
+from sqlalchemy import delete, insert, update
+from sqlalchemy.orm import Session
+
+from . import models, schemas
+
+
+def sincronizar_detalles(db: Session, comanda: models.Comanda, nuevos: list[schemas.DetalleComandaCreate]) -> dict:
+    """
+    Reemplaza los detalles de la comanda por `nuevos` emparejando por id_producto.
+    Solo se emiten los UPDATE, INSERT y DELETE necesarios, cada uno en bulk.
+    Devuelve la cantidad de filas insertadas, actualizadas y eliminadas.
+    """
+    existentes_por_producto: dict[int, list[models.DetalleComanda]] = defaultdict(list)
+    for detalle in comanda.detalles_comanda:
+        existentes_por_producto[detalle.id_producto].append(detalle)
+
+    a_actualizar, a_insertar = [], []
+    for nuevo in nuevos:
+        candidatos = existentes_por_producto.get(nuevo.id_producto)
+        if not candidatos:
+            a_insertar.append({"id_comanda": comanda.id, **nuevo.model_dump()})
+            continue
+
+        # Preferir una línea idéntica para no generar un UPDATE innecesario
+        existente = next(
+            (d for d in candidatos if d.cantidad == nuevo.cantidad and d.precio_unitario == nuevo.precio_unitario),
+            candidatos[0],
+        )
+        candidatos.remove(existente)
+        if existente.cantidad != nuevo.cantidad or existente.precio_unitario != nuevo.precio_unitario:
+            a_actualizar.append({
+                "id": existente.id,
+                "cantidad": nuevo.cantidad,
+                "precio_unitario": nuevo.precio_unitario,
+            })
+
+    a_eliminar = [d.id for restantes in existentes_por_producto.values() for d in restantes]
+
+    if a_actualizar:
+        db.execute(update(models.DetalleComanda), a_actualizar)
+    if a_insertar:
+        db.execute(insert(models.DetalleComanda), a_insertar)
+    if a_eliminar:
+        db.execute(
+            delete(models.DetalleComanda)
+            .where(models.DetalleComanda.id.in_(a_eliminar))
+            .execution_options(synchronize_session=False)
+        )
+
+    return {
+        "insertados": len(a_insertar),
+        "actualizados": len(a_actualizar),
+        "eliminados": len(a_eliminar),
+    }
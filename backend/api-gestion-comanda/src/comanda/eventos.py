@@ -0,0 +1,136 @@
+"""
+Bus de eventos en memoria para el stream SSE de comandas (GET /comanda/stream).
+
+Los handlers publican después de hacer commit. Cada evento recibe un id
+incremental y se guarda en un buffer acotado para que los clientes que se
+reconectan con `Last-Event-ID` puedan recuperar lo que se perdieron.
+"""
+import asyncio
+import json
+import threading
+from collections import deque
+from dataclasses import dataclass, field
+from typing import AsyncIterator
+
+from ..config import settings
+
+# Intervalo para enviar comentarios keep-alive cuando no hay eventos
+KEEPALIVE_SEGUNDOS = 15
+
+
+@dataclass
+class Evento:
+    id: int
+    tipo: str
+    estado: str
+    datos: dict = field(default_factory=dict)
+
+    def formato_sse(self) -> str:
+        """Serializa el evento en el formato text/event-stream"""
+        payload = json.dumps(self.datos, default=str)
+        return f"id: {self.id}\nevent: {self.tipo}\ndata: {payload}\n\n"
+
+
+class BusEventos:
+    def __init__(self, capacidad: int = 1000):
+        self._lock = threading.Lock()
+        self._buffer: deque[Evento] = deque(maxlen=capacidad)
+        self._ultimo_id = 0
+        self._suscriptores: dict[asyncio.Queue, asyncio.AbstractEventLoop] = {}
+
+    @property
+    def ultimo_id(self) -> int:
+        return self._ultimo_id
+
+    def publicar(self, tipo: str, estado: str, datos: dict) -> Evento:
+        """Registra un evento y lo entrega a los suscriptores (seguro desde cualquier hilo)"""
+        with self._lock:
+            self._ultimo_id += 1
+            evento = Evento(id=self._ultimo_id, tipo=tipo, estado=estado, datos=datos)
+            self._buffer.append(evento)
+            suscriptores = list(self._suscriptores.items())
+
+        for cola, loop in suscriptores:
+            try:
+                loop.call_soon_threadsafe(cola.put_nowait, evento)
+            except RuntimeError:
+                # El loop del suscriptor ya se cerró
+                self.desuscribir(cola)
+        return evento
+
+    def eventos_desde(self, ultimo_id: int) -> tuple[list[Evento], bool]:
+        """
+        Devuelve los eventos con id > ultimo_id que siguen en el buffer y si
+        el buffer alcanza para cubrir el hueco completo.
+        """
+        with self._lock:
+            eventos = [e for e in self._buffer if e.id > ultimo_id]
+            primero = self._buffer[0].id if self._buffer else self._ultimo_id + 1
+        completo = ultimo_id >= primero - 1
+        return eventos, completo
+
+    def suscribir(self) -> tuple[asyncio.Queue, int]:
+        """
+        Crea una cola para el loop actual y devuelve también el último id
+        publicado al momento de suscribirse. Debe llamarse desde una corrutina.
+        """
+        cola: asyncio.Queue = asyncio.Queue()
+        with self._lock:
+            self._suscriptores[cola] = asyncio.get_running_loop()
+            return cola, self._ultimo_id
+
+    def desuscribir(self, cola: asyncio.Queue) -> None:
+        with self._lock:
+            self._suscriptores.pop(cola, None)
+
+
+bus = BusEventos(capacidad=settings.eventos_buffer_size)
+
+
+def publicar_comanda(tipo: str, comanda, **extra) -> Evento:
+    """Publica un evento con los datos básicos de la comanda"""
+    estado = comanda.estado.value if hasattr(comanda.estado, "value") else str(comanda.estado)
+    datos = {
+        "id_comanda": comanda.id,
+        "id_mesa": comanda.id_mesa,
+        "id_mozo": comanda.id_mozo,
+        "estado": estado,
+        **extra,
+    }
+    return bus.publicar(tipo, estado, datos)
+
+
+async def generar_stream(request, estados: set[str] | None, last_event_id: int | None) -> AsyncIterator[str]:
+    """Generador SSE: reenvía lo perdido desde Last-Event-ID y luego los eventos en vivo"""
+    # Suscribirse antes de leer el buffer para no perder eventos entre ambos pasos
+    cola, ultimo = bus.suscribir()
+    try:
+        yield "retry: 3000\n\n"
+
+        if last_event_id is not None and last_event_id > ultimo:
+            # Id de un proceso anterior (los ids se reinician al reiniciar el servicio)
+            yield "event: resync\ndata: {}\n\n"
+        elif last_event_id is not None:
+            pendientes, completo = bus.eventos_desde(last_event_id)
+            if not completo:
+                # El buffer ya descartó eventos: el cliente debe recargar su estado
+                yield "event: resync\ndata: {}\n\n"
+            ultimo = last_event_id
+            for evento in pendientes:
+                ultimo = evento.id
+                if estados is None or evento.estado in estados:
+                    yield evento.formato_sse()
+
+        while not await request.is_disconnected():
+            try:
+                evento = await asyncio.wait_for(cola.get(), timeout=KEEPALIVE_SEGUNDOS)
+            except asyncio.TimeoutError:
+                yield ": keepalive\n\n"
+                continue
+            if evento.id <= ultimo:
+                continue  # ya enviado durante el replay
+            ultimo = evento.id
+            if estados is None or evento.estado in estados:
+                yield evento.formato_sse()
+    finally:
+        bus.desuscribir(cola)
@@ -1,18 +1,33 @@
+from datetime import date
+
 from fastapi_filter.contrib.sqlalchemy import Filter
-from .models import Comanda
+from .models import Comanda, ComandaArchivada
 
 class ComandaFilter(Filter):
     # ejemplos típicos (extensible según tu modelo):
     id : int | None = None              # ?id=1
     id__neq: int | None = None              # ?id__neq=1
+    id__gt: int | None = None               # ?id__gt=100 (sincronización incremental de reporte)
     id_mesa: int | None = None          # ?id_mesa=1
     estado: str | None = None           # ?estado=pendiente
     estado__in: list[str] | None = None       # ?estado__in=pendiente,facturada
+    fecha__gte: date | None = None         # ?fecha__gte=2025-01-01
+    fecha__lte: date | None = None         # ?fecha__lte=2025-01-31
     created_at__gte: str | None = None     # ?created_at__gte=2025-01-01
     created_at__lte: str | None = None     # ?created_at__lte=2025-12-31
+    total__gte: float | None = None        # ?total__gte=1000
+    total__lte: float | None = None        # ?total__lte=5000
+    items_count__gte: int | None = None    # ?items_count__gte=2
+    items_count__lte: int | None = None    # ?items_count__lte=10
 
-    # orden: ?order_by=-created_at&order_by=nombre
+    # orden: ?order_by=-created_at&order_by=-total
     order_by: list[str] | None = None
 
     class Constants(Filter.Constants):
         model = Comanda
+
+
+class ComandaArchivadaFilter(ComandaFilter):
+    # mismos filtros, aplicados sobre la tabla de archivo
+    class Constants(Filter.Constants):
+        model = ComandaArchivada
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, Float, String, Date, func, DateTime, Boolean, ForeignKey, Enum
+from sqlalchemy import Column, Integer, Float, String, Date, func, DateTime, Boolean, ForeignKey, Enum, Index, text
 from sqlalchemy.orm import relationship
 from ..database import Base
 import enum
@@ -20,6 +20,9 @@ class Comanda(Base):
     fecha = Column(Date, index=True, nullable=False)
     estado = Column(Enum(EstadoComanda), default=EstadoComanda.pendiente, nullable=False)
     created_at = Column(DateTime, server_default=func.now(), index=True)
+    # Totales persistidos, se recalculan al escribir detalles (ver totales.py)
+    total = Column(Float, default=0.0, server_default="0", index=True, nullable=False)
+    items_count = Column(Integer, default=0, server_default="0", nullable=False)
     
     # Relación con detalles
     detalles_comanda = relationship(
@@ -28,6 +31,20 @@ class Comanda(Base):
     cascade="all, delete-orphan"
 )
 
+    __table_args__ = (
+        # Chequeos de referencias (GET /comanda/references)
+        Index("ix_comandas_id_mesa_estado", "id_mesa", "estado"),
+        Index("ix_comandas_id_mozo_estado", "id_mozo", "estado"),
+        # Ticket abierto por mesa (GET /comanda/abierta/{id_mesa}), solo filas pendientes
+        Index(
+            "ix_comandas_id_mesa_pendiente", "id_mesa",
+            sqlite_where=text("estado = 'pendiente'"),
+            postgresql_where=text("estado = 'pendiente'"),
+        ),
+        # Sin AUTOINCREMENT SQLite reutiliza el id más alto si se archiva esa fila
+        {"sqlite_autoincrement": True},
+    )
+
 ##Detalle Comanda
 
 class DetalleComanda(Base):
@@ -41,3 +58,54 @@ class DetalleComanda(Base):
 
     #Relacion Comanda
     comanda = relationship("Comanda", back_populates="detalles_comanda")
+
+    __table_args__ = (
+        # Los detalles también se archivan con su id (ver Comanda)
+        {"sqlite_autoincrement": True},
+    )
+
+
+##Archivo de comandas cerradas (ver archivo.py)
+
+class ComandaArchivada(Base):
+    __tablename__ = "comandas_archivo" # Nombre de la tabla
+
+    # Conserva el mismo id que tenía en "comandas"
+    id = Column(Integer, primary_key=True, index=True)
+    id_mesa = Column(Integer, nullable=False)
+    id_mozo = Column(Integer, nullable=False)
+    id_reserva = Column(Integer, nullable=True)
+    fecha = Column(Date, index=True, nullable=False)
+    estado = Column(Enum(EstadoComanda), nullable=False)
+    created_at = Column(DateTime)
+    total = Column(Float, default=0.0, nullable=False)
+    items_count = Column(Integer, default=0, nullable=False)
+    archivada_at = Column(DateTime, server_default=func.now())
+
+    detalles_comanda = relationship(
+    "DetalleComandaArchivada",
+    back_populates="comanda",
+    cascade="all, delete-orphan"
+)
+
+class DetalleComandaArchivada(Base):
+    __tablename__ = "detalle_comandas_archivo" # Nombre de la tabla
+
+    id = Column(Integer, primary_key=True, index=True)
+    id_comanda = Column(Integer, ForeignKey("comandas_archivo.id"), index=True, nullable=False)
+    id_producto = Column(Integer, nullable=False)
+    cantidad = Column(Integer, nullable=False)
+    precio_unitario = Column(Float, nullable=False)
+
+    comanda = relationship("ComandaArchivada", back_populates="detalles_comanda")
+
+
+##Contadores de ventas por día y producto (ver ventas.py)
+
+class VentaProductoDiaria(Base):
+    __tablename__ = "ventas_producto_diarias" # Nombre de la tabla
+
+    fecha = Column(Date, primary_key=True)
+    id_producto = Column(Integer, primary_key=True, index=True)
+    cantidad = Column(Integer, default=0, nullable=False)
+    importe = Column(Float, default=0.0, nullable=False)
@@ -0,0 +1,25 @@
+from sqlalchemy import exists, select
+from sqlalchemy.orm import Session
+
+from . import models, schemas
+
+
+def _existe(entidad: schemas.EntidadReferencia, id_entidad: int, estado: models.EstadoComanda):
+    """EXISTS indexado para una entidad referenciada por comandas en un estado"""
+    comanda = models.Comanda
+    if entidad == schemas.EntidadReferencia.producto:
+        detalle = models.DetalleComanda
+        return exists().where(
+            detalle.id_producto == id_entidad,
+            detalle.id_comanda == comanda.id,
+            comanda.estado == estado,
+        )
+    columna = comanda.id_mesa if entidad == schemas.EntidadReferencia.mesa else comanda.id_mozo
+    return exists().where(columna == id_entidad, comanda.estado == estado)
+
+
+def buscar_referencias(db: Session, entidad: schemas.EntidadReferencia, id_entidad: int, estados: list[models.EstadoComanda]) -> dict[str, bool]:
+    """Resuelve todos los estados pedidos en un único SELECT de EXISTS"""
+    query = select(*[_existe(entidad, id_entidad, estado).label(estado.value) for estado in estados])
+    fila = db.execute(query).one()
+    return dict(fila._mapping)
@@ -1,4 +1,6 @@
-from fastapi import APIRouter, HTTPException, Depends, status
+from fastapi import APIRouter, HTTPException, Depends, status, Request, Query, Header
+from fastapi.responses import StreamingResponse
+from datetime import date
 from sqlalchemy.orm import Session
 from sqlalchemy import select
 
@@ -6,6 +8,13 @@ from ..database import get_db
 from . import models, schemas
 from .filters import ComandaFilter
 from .validator import ComandaValidator
+from .totales import recalcular_totales
+from .detalles import sincronizar_detalles
+from .eventos import publicar_comanda, generar_stream
+from .archivo import query_con_archivo, cargar_detalles
+from .referencias import buscar_referencias
+from .abiertas import indice_abiertas
+from . import ventas
 
 from fastapi_filter import FilterDepends
 from fastapi_pagination import Page
@@ -36,12 +45,33 @@ def create(payload: schemas.ComandaCreate, db: Session = Depends(get_db)):
         )
         db.add(db_detalle)
 
+    recalcular_totales(db, db_comanda.id)
     db.commit()
     db.refresh(db_comanda)
+    indice_abiertas.registrar(db_comanda.id_mesa, db_comanda.id)
+    publicar_comanda("comanda_creada", db_comanda)
     return db_comanda
 
+@router.put("/estado", response_model=schemas.CambioEstadoLoteOut)
+def cambiar_estado_lote(payload: schemas.CambioEstadoLote, db: Session = Depends(get_db)):
+    """Cambia el estado de varias comandas en una sola transacción (todo o nada)"""
+    ids = list(dict.fromkeys(payload.ids))
+    comandas = db.scalars(select(models.Comanda).where(models.Comanda.id.in_(ids))).all()
+    encontradas = {c.id for c in comandas}
+    faltantes = [id_ for id_ in ids if id_ not in encontradas]
+    if faltantes:
+        raise HTTPException(status_code=404, detail=f"Comandas no encontradas: {faltantes}")
+
+    estado = models.EstadoComanda(payload.estado.value)
+    for obj in comandas:
+        _aplicar_estado(db, obj, estado)
+    db.commit()
+    for obj in comandas:
+        _notificar_estado(db, obj)
+    return {"estado": payload.estado, "actualizadas": len(comandas)}
+
 ##Modificacion Comanda no Detalles
-@router.put("/{id_}", response_model=schemas.ComandaOut)
+@router.put("/{id_}", response_model=schemas.ComandaModificadaOut)
 def modify(id_: int, payload: schemas.ComandaCreate, db: Session = Depends(get_db)):
     validator = ComandaValidator(db)
     validator.validar_modificacion_comanda(id_, payload) 
@@ -49,6 +79,8 @@ def modify(id_: int, payload: schemas.ComandaCreate, db: Session = Depends(get_d
     obj = db.get(models.Comanda, id_)
     if obj is None:
         raise HTTPException(status_code=404, detail="Comanda no encontrado")
+    mesa_anterior = obj.id_mesa
+    ventas_antes = ventas.contribucion(db, obj)
     
     # 1) Actualizar solo campos de la comanda principal
     update_data = payload.model_dump(
@@ -59,88 +91,143 @@ def modify(id_: int, payload: schemas.ComandaCreate, db: Session = Depends(get_d
         setattr(obj, key, value)
 
     # 2) Actualizar detalles si vinieron en el payload
-    #    (reemplazo total de la lista)
+    #    (reemplazo de la lista, aplicando solo las diferencias por id_producto)
+    cambios = None
     if "detalles_comanda" in payload.model_fields_set:
-        # Vaciar detalles actuales
-        obj.detalles_comanda.clear()
-
-        # Crear nuevos detalles desde el schema
-        for det_schema in payload.detalles_comanda:
-            det_data = det_schema.model_dump(exclude_unset=True)
-            nuevo_detalle = models.DetalleComanda(
-                id_comanda=obj.id,  # FK
-                **det_data
-            )
-            obj.detalles_comanda.append(nuevo_detalle)
+        cambios = sincronizar_detalles(db, obj, payload.detalles_comanda)
+        if any(cambios.values()):
+            recalcular_totales(db, obj.id)
 
+    ventas.aplicar_diferencia(db, ventas_antes, ventas.contribucion(db, obj))
     db.commit()
     db.refresh(obj)
-    return obj
+    # El PUT puede cambiar la mesa o el estado
+    for id_mesa in {mesa_anterior, obj.id_mesa}:
+        indice_abiertas.actualizar_mesa(db, id_mesa)
+    publicar_comanda("comanda_modificada", obj)
+
+    respuesta = schemas.ComandaModificadaOut.model_validate(obj)
+    if cambios is not None:
+        respuesta.cambios_detalles = schemas.CambiosDetalles(**cambios)
+    return respuesta
 
 @router.get("/", response_model=Page[schemas.ComandaOut])
 def list_all(
     filtro: ComandaFilter = FilterDepends(ComandaFilter),
+    include_archived: bool = Query(False, description="Incluir comandas archivadas"),
     db: Session = Depends(get_db),
 ):
+    if include_archived:
+        return paginate(db, query_con_archivo(filtro), transformer=lambda filas: cargar_detalles(db, filas))
+
     query = filtro.filter(select(models.Comanda))
     query = filtro.sort(query)
     return paginate(db, query)
 
+@router.get("/abierta/{id_mesa}", response_model=schemas.ComandaOut)
+def get_abierta(id_mesa: int, db: Session = Depends(get_db)):
+    """Devuelve la comanda pendiente (ticket abierto) de una mesa"""
+    obj = indice_abiertas.obtener(db, id_mesa)
+    if obj is None:
+        raise HTTPException(status_code=404, detail="La mesa no tiene una comanda abierta")
+    return obj
+
+@router.get("/ventas/top-productos", response_model=list[schemas.VentaProductoOut])
+def top_productos(
+    desde: date = Query(..., description="Fecha de inicio (inclusive)"),
+    hasta: date = Query(..., description="Fecha de fin (inclusive)"),
+    limite: int = Query(5, ge=1, le=100),
+    db: Session = Depends(get_db),
+):
+    """Top N productos vendidos (comandas pagadas/facturadas) leyendo los contadores diarios"""
+    return ventas.top_productos(db, desde, hasta, limite)
+
+@router.get("/references", response_model=schemas.ReferenciasOut)
+def references(
+    entidad: schemas.EntidadReferencia,
+    id_: int = Query(..., alias="id", gt=0),
+    estados: str = Query(..., description="Estados separados por coma, ej: pendiente,facturada"),
+    db: Session = Depends(get_db),
+):
+    """Indica, por estado, si existe alguna comanda que referencie a la mesa, mozo o producto"""
+    try:
+        estados_enum = [models.EstadoComanda(e.strip()) for e in estados.split(",") if e.strip()]
+    except ValueError:
+        raise HTTPException(status_code=422, detail=f"Estado inválido en '{estados}'")
+    if not estados_enum:
+        raise HTTPException(status_code=422, detail="Debe indicar al menos un estado")
+
+    return {
+        "entidad": entidad,
+        "id": id_,
+        "estados": buscar_referencias(db, entidad, id_, estados_enum),
+    }
+
+@router.get("/stream")
+async def stream(
+    request: Request,
+    estado: list[schemas.EstadoComanda] | None = Query(default=None),
+    last_event_id: int | None = Header(default=None),
+):
+    """Stream SSE de comandas creadas, detalles agregados/modificados y cambios de estado"""
+    estados = {e.value for e in estado} if estado else None
+    return StreamingResponse(
+        generar_stream(request, estados, last_event_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
 @router.get("/{id_}", response_model=schemas.ComandaOut)
 def get_one(id_: int, db: Session = Depends(get_db)):
     obj = db.get(models.Comanda, id_)
+    if obj is None:
+        # Puede haber sido movida al archivo
+        obj = db.get(models.ComandaArchivada, id_)
     if obj is None:
         raise HTTPException(status_code=404, detail="Comanda no encontrado")
     return obj
 
-@router.delete("/{id_}", status_code=status.HTTP_204_NO_CONTENT)
-def delete(id_: int, db: Session = Depends(get_db)):
+def _aplicar_estado(db: Session, obj: models.Comanda, estado: models.EstadoComanda):
+    ventas_antes = ventas.contribucion(db, obj)
+    obj.estado = estado
+    db.add(obj)
+    ventas.aplicar_diferencia(db, ventas_antes, ventas.contribucion(db, obj))
+
+def _notificar_estado(db: Session, obj: models.Comanda):
+    indice_abiertas.actualizar_mesa(db, obj.id_mesa)
+    publicar_comanda("estado_actualizado", obj)
+
+def _cambiar_estado(db: Session, id_: int, estado: models.EstadoComanda):
     obj = db.get(models.Comanda, id_)
     if obj is None:
         raise HTTPException(status_code=404, detail="Comanda no encontrado")
-    obj.estado = models.EstadoComanda.anulada
-    db.add(obj)
+    _aplicar_estado(db, obj, estado)
     db.commit()
+    _notificar_estado(db, obj)
+
+@router.delete("/{id_}", status_code=status.HTTP_204_NO_CONTENT)
+def delete(id_: int, db: Session = Depends(get_db)):
+    _cambiar_estado(db, id_, models.EstadoComanda.anulada)
     return
 
 @router.put("/{id_}/facturar", status_code=status.HTTP_204_NO_CONTENT)
 def facturar(id_: int, db: Session = Depends(get_db)):
-    obj = db.get(models.Comanda, id_)
-    if obj is None:
-        raise HTTPException(status_code=404, detail="Comanda no encontrado")
-    obj.estado = models.EstadoComanda.facturada
-    db.add(obj)
-    db.commit()
+    _cambiar_estado(db, id_, models.EstadoComanda.facturada)
     return
 
 @router.put("/{id_}/pendiente", status_code=status.HTTP_204_NO_CONTENT)
 def pendiente(id_: int, db: Session = Depends(get_db)):
-    obj = db.get(models.Comanda, id_)
-    if obj is None:
-        raise HTTPException(status_code=404, detail="Comanda no encontrado")
-    obj.estado = models.EstadoComanda.pendiente
-    db.add(obj)
-    db.commit()
+    _cambiar_estado(db, id_, models.EstadoComanda.pendiente)
     return
 
 @router.put("/{id_}/pagada", status_code=status.HTTP_204_NO_CONTENT)
 def pagada(id_: int, db: Session = Depends(get_db)):
-    obj = db.get(models.Comanda, id_)
-    if obj is None:
-        raise HTTPException(status_code=404, detail="Comanda no encontrado")
-    obj.estado = models.EstadoComanda.pagada
-    db.add(obj)
-    db.commit()
+    _cambiar_estado(db, id_, models.EstadoComanda.pagada)
     return
 
 @router.put("/{id_}/anulada", status_code=status.HTTP_204_NO_CONTENT)
 def anulada(id_: int, db: Session = Depends(get_db)):
-    obj = db.get(models.Comanda, id_)
-    if obj is None:
-        raise HTTPException(status_code=404, detail="Comanda no encontrado")
-    obj.estado = models.EstadoComanda.anulada
-    db.add(obj)
-    db.commit()
+    _cambiar_estado(db, id_, models.EstadoComanda.anulada)
     return
 
 @router.get("/{id_comanda}/detalles", response_model=Page[schemas.DetalleComandaOut])
@@ -158,12 +245,16 @@ def update_detalle_comanda(id_comanda:int, id_detalle:int, payload: schemas.Deta
     if detalle is None or detalle.id_comanda != id_comanda:
         raise HTTPException(status_code=404, detail="Detalle de comanda no encontrado")
     
+    ventas_antes = ventas.contribucion(db, comanda)
     update_data = payload.model_dump(exclude_unset=True)
     for key, value in update_data.items():
         setattr(detalle, key, value)
-    
+
+    recalcular_totales(db, id_comanda)
+    ventas.aplicar_diferencia(db, ventas_antes, ventas.contribucion(db, comanda))
     db.commit()
     db.refresh(detalle)
+    publicar_comanda("detalle_actualizado", comanda, detalle=schemas.DetalleComandaOut.model_validate(detalle).model_dump())
     return detalle
 
 @router.post("/{id_comanda}/detalles", response_model=schemas.DetalleComandaOut, status_code=status.HTTP_201_CREATED)
@@ -171,7 +262,8 @@ def add_detalle_comanda(id_comanda:int, payload: schemas.DetalleComandaCreate, d
     comanda = db.get(models.Comanda, id_comanda)
     if comanda is None:
         raise HTTPException(status_code=404, detail="Comanda no encontrada")
-    
+
+    ventas_antes = ventas.contribucion(db, comanda)
     nuevo_detalle = models.DetalleComanda(
         id_comanda=id_comanda,
         id_producto=payload.id_producto,
@@ -179,6 +271,9 @@ def add_detalle_comanda(id_comanda:int, payload: schemas.DetalleComandaCreate, d
         precio_unitario=payload.precio_unitario,
     )
     db.add(nuevo_detalle)
+    recalcular_totales(db, id_comanda)
+    ventas.aplicar_diferencia(db, ventas_antes, ventas.contribucion(db, comanda))
     db.commit()
     db.refresh(nuevo_detalle)
+    publicar_comanda("detalle_agregado", comanda, detalle=schemas.DetalleComandaOut.model_validate(nuevo_detalle).model_dump())
     return nuevo_detalle
\ No newline at end of file
@@ -38,5 +38,42 @@ class ComandaCreate(ComandaBase):
 
 class ComandaOut(ComandaBase):
     id: int
+    total: float = 0.0
+    items_count: int = 0
     detalles_comanda: List[DetalleComandaOut] = []
     model_config = ConfigDict(from_attributes=True) # Permite que Pydantic lea desde objetos ORM
+
+class CambiosDetalles(BaseModel):
+    insertados: int = 0
+    actualizados: int = 0
+    eliminados: int = 0
+
+class ComandaModificadaOut(ComandaOut):
+    # Filas de detalle efectivamente modificadas por el PUT (None si no se enviaron detalles)
+    cambios_detalles: CambiosDetalles | None = None
+
+#Schemas para chequeo de referencias
+class EntidadReferencia(str, Enum):
+    mesa = "mesa"
+    mozo = "mozo"
+    producto = "producto"
+
+class ReferenciasOut(BaseModel):
+    entidad: EntidadReferencia
+    id: int
+    estados: dict[str, bool]
+
+#Schema para el ranking de ventas por producto
+class VentaProductoOut(BaseModel):
+    id_producto: int
+    cantidad: int
+    importe: float
+
+#Schemas para cambio de estado en lote
+class CambioEstadoLote(BaseModel):
+    ids: List[int] = Field(..., min_length=1)
+    estado: EstadoComanda
+
+class CambioEstadoLoteOut(BaseModel):
+    estado: EstadoComanda
+    actualizadas: int
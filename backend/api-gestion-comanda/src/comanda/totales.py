@@ -0,0 +1,76 @@
+"""
+Mantenimiento de los totales persistidos de cada comanda (`total` e `items_count`).
+
+Los totales se recalculan con una única sentencia UPDATE dentro de la misma
+transacción que modifica los detalles, de modo que nunca quedan desfasados.
+
+Backfill de filas existentes (desde la carpeta del servicio):
+
+    python -m src.comanda.totales
+"""
+from sqlalchemy import func, inspect, select, text, update
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+from . import models
+
+
+def _valores_totales() -> dict:
+    """Subconsultas correlacionadas que calculan los totales a partir de los detalles"""
+    detalle = models.DetalleComanda
+    total = (
+        select(func.coalesce(func.sum(detalle.cantidad * detalle.precio_unitario), 0.0))
+        .where(detalle.id_comanda == models.Comanda.id)
+        .scalar_subquery()
+    )
+    items_count = (
+        select(func.count(detalle.id))
+        .where(detalle.id_comanda == models.Comanda.id)
+        .scalar_subquery()
+    )
+    return {"total": total, "items_count": items_count}
+
+
+def recalcular_totales(db: Session, id_comanda: int) -> None:
+    """Recalcula total e items_count de una comanda sin hacer commit"""
+    db.flush()
+    db.execute(
+        update(models.Comanda)
+        .where(models.Comanda.id == id_comanda)
+        .values(**_valores_totales())
+        .execution_options(synchronize_session="fetch")
+    )
+
+
+def recalcular_todas(db: Session) -> int:
+    """Recalcula los totales de todas las comandas. Devuelve la cantidad de filas afectadas"""
+    result = db.execute(
+        update(models.Comanda)
+        .values(**_valores_totales())
+        .execution_options(synchronize_session=False)
+    )
+    db.commit()
+    return result.rowcount
+
+
+def asegurar_columnas_totales(engine: Engine) -> None:
+    """Agrega las columnas de totales a bases existentes creadas antes de que existieran"""
+    columnas = {c["name"] for c in inspect(engine).get_columns(models.Comanda.__tablename__)}
+    with engine.begin() as conn:
+        if "total" not in columnas:
+            conn.execute(text("ALTER TABLE comandas ADD COLUMN total FLOAT NOT NULL DEFAULT 0"))
+        if "items_count" not in columnas:
+            conn.execute(text("ALTER TABLE comandas ADD COLUMN items_count INTEGER NOT NULL DEFAULT 0"))
+
+
+if __name__ == "__main__":
+    from ..database import SessionLocal, engine
+
+    models.Base.metadata.create_all(bind=engine)
+    asegurar_columnas_totales(engine)
+    db = SessionLocal()
+    try:
+        filas = recalcular_todas(db)
+        print(f"Totales recalculados para {filas} comandas")
+    finally:
+        db.close()
@@ -0,0 +1,129 @@
+"""
+Contadores de ventas por día y producto (`ventas_producto_diarias`).
+
+Solo cuentan las comandas en estado `pagada` o `facturada`. Cada handler que
+modifica detalles o el estado de una comanda toma la contribución de la
+comanda antes y después del cambio y aplica la diferencia en la misma
+transacción, así el ranking de productos no necesita recorrer los detalles.
+
+Reconstrucción completa (desde la carpeta del servicio):
+
+    python -m src.comanda.ventas
+"""
+from datetime import date
+
+from sqlalchemy import delete, func, insert, select, union_all
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+
+from . import models
+
+ESTADOS_VENTA = (models.EstadoComanda.pagada, models.EstadoComanda.facturada)
+
+Contribucion = dict[tuple[date, int], tuple[int, float]]
+
+
+def contribucion(db: Session, comanda: models.Comanda) -> Contribucion:
+    """Cantidad e importe por (fecha, id_producto) que la comanda aporta hoy a los contadores"""
+    # En el PUT el estado puede venir como el enum del schema
+    estado = models.EstadoComanda(getattr(comanda.estado, "value", comanda.estado))
+    if estado not in ESTADOS_VENTA:
+        return {}
+    db.flush()
+    detalle = models.DetalleComanda
+    filas = db.execute(
+        select(
+            detalle.id_producto,
+            func.sum(detalle.cantidad),
+            func.sum(detalle.cantidad * detalle.precio_unitario),
+        )
+        .where(detalle.id_comanda == comanda.id)
+        .group_by(detalle.id_producto)
+    ).all()
+    return {(comanda.fecha, id_producto): (cantidad, importe) for id_producto, cantidad, importe in filas}
+
+
+def aplicar_diferencia(db: Session, antes: Contribucion, despues: Contribucion) -> None:
+    """Suma a los contadores la diferencia entre dos contribuciones, sin hacer commit"""
+    filas = []
+    for clave in antes.keys() | despues.keys():
+        cantidad_antes, importe_antes = antes.get(clave, (0, 0.0))
+        cantidad_despues, importe_despues = despues.get(clave, (0, 0.0))
+        if cantidad_antes == cantidad_despues and importe_antes == importe_despues:
+            continue
+        fecha, id_producto = clave
+        filas.append({
+            "fecha": fecha,
+            "id_producto": id_producto,
+            "cantidad": cantidad_despues - cantidad_antes,
+            "importe": importe_despues - importe_antes,
+        })
+    if not filas:
+        return
+
+    stmt = sqlite_insert(models.VentaProductoDiaria)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["fecha", "id_producto"],
+        set_={
+            "cantidad": models.VentaProductoDiaria.cantidad + stmt.excluded.cantidad,
+            "importe": models.VentaProductoDiaria.importe + stmt.excluded.importe,
+        },
+    )
+    db.execute(stmt, filas)
+
+
+def top_productos(db: Session, desde: date, hasta: date, limite: int) -> list[dict]:
+    """Ranking de productos por cantidad vendida en el rango, leyendo solo los contadores"""
+    venta = models.VentaProductoDiaria
+    cantidad = func.sum(venta.cantidad).label("cantidad")
+    filas = db.execute(
+        select(venta.id_producto, cantidad, func.sum(venta.importe).label("importe"))
+        .where(venta.fecha >= desde, venta.fecha <= hasta)
+        .group_by(venta.id_producto)
+        .having(cantidad > 0)
+        .order_by(cantidad.desc(), venta.id_producto)
+        .limit(limite)
+    ).all()
+    return [dict(fila._mapping) for fila in filas]
+
+
+def reconstruir(db: Session) -> int:
+    """Recalcula todos los contadores desde los detalles (incluye comandas archivadas)"""
+    fuentes = []
+    for comanda, detalle in (
+        (models.Comanda, models.DetalleComanda),
+        (models.ComandaArchivada, models.DetalleComandaArchivada),
+    ):
+        fuentes.append(
+            select(
+                comanda.fecha.label("fecha"),
+                detalle.id_producto.label("id_producto"),
+                detalle.cantidad.label("cantidad"),
+                (detalle.cantidad * detalle.precio_unitario).label("importe"),
+            )
+            .join(comanda, comanda.id == detalle.id_comanda)
+            .where(comanda.estado.in_(ESTADOS_VENTA))
+        )
+    lineas = union_all(*fuentes).subquery()
+
+    db.execute(delete(models.VentaProductoDiaria))
+    db.execute(
+        insert(models.VentaProductoDiaria).from_select(
+            ["fecha", "id_producto", "cantidad", "importe"],
+            select(lineas.c.fecha, lineas.c.id_producto, func.sum(lineas.c.cantidad), func.sum(lineas.c.importe))
+            .group_by(lineas.c.fecha, lineas.c.id_producto),
+        )
+    )
+    db.commit()
+    return db.scalar(select(func.count()).select_from(models.VentaProductoDiaria))
+
+
+if __name__ == "__main__":
+    from ..database import SessionLocal, engine
+    from .totales import asegurar_columnas_totales
+
+    models.Base.metadata.create_all(bind=engine)
+    asegurar_columnas_totales(engine)
+    with SessionLocal() as db:
+        filas = reconstruir(db)
+        print(f"ventas_producto_diarias reconstruida con {filas} filas")
@@ -2,6 +2,7 @@ from pydantic_settings import BaseSettings, SettingsConfigDict
 
 class Settings(BaseSettings):
     database_url: str
+    eventos_buffer_size: int = 1000  # eventos retenidos para reconexión SSE (Last-Event-ID)
     model_config = SettingsConfigDict(env_file=".env")
 
 settings = Settings()
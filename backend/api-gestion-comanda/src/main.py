@@ -1,10 +1,23 @@
 from fastapi import FastAPI
-from .database import engine
+from .database import engine, SessionLocal
 from .comanda import models as comanda_models
 from .comanda.router import router as comanda_router
+from .comanda.totales import asegurar_columnas_totales
+from .comanda.abiertas import indice_abiertas
+from .comanda.archivo import asegurar_autoincrement
 
 # Crea las tablas en la base de datos (si no existen)
 comanda_models.Base.metadata.create_all(bind=engine)
+asegurar_columnas_totales(engine)
+# Bases creadas sin AUTOINCREMENT reutilizaban ids de comandas archivadas
+asegurar_autoincrement(engine)
+# create_all no agrega índices nuevos a tablas existentes
+for index in comanda_models.Comanda.__table__.indexes:
+    index.create(bind=engine, checkfirst=True)
+
+# Reconstruye el índice en memoria de comandas abiertas por mesa
+with SessionLocal() as db:
+    indice_abiertas.reconstruir(db)
 
 from fastapi_pagination import add_pagination
 
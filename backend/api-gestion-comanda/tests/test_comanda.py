@@ -1,6 +1,7 @@
 import pytest
+import asyncio
 from fastapi.testclient import TestClient
-from datetime import date
+from datetime import date, timedelta
 
 # --- Solución al problema de importación ---
 import sys
@@ -13,6 +14,8 @@ from sqlalchemy.pool import StaticPool
 
 from src.main import app
 from src.database import Base, get_db
+from src.comanda import eventos
+from src.comanda.archivo import archivar_comandas, asegurar_autoincrement
 
 # --- Configuración de la Base de Datos de Prueba ---
 # Usamos una base de datos SQLite en memoria para los tests
@@ -315,3 +318,376 @@ def test_modificar_comanda(client):
     data = response.json()
     assert data["id_mesa"] == 9
     assert data["id_mozo"] == 3
+
+def test_totales_persistidos_al_crear_y_modificar(client):
+    """
+    Test para verificar que total e items_count se mantienen al escribir detalles.
+    """
+    response_creacion = client.post("/comanda/", json={
+        "id_mesa": 10,
+        "id_mozo": 1,
+        "fecha": str(date.today()),
+        "detalles_comanda": [
+            {"id_producto": 1, "cantidad": 2, "precio_unitario": 100.0},
+            {"id_producto": 2, "cantidad": 1, "precio_unitario": 50.0}
+        ]
+    })
+    assert response_creacion.status_code == 201
+    data = response_creacion.json()
+    comanda_id = data["id"]
+    assert data["total"] == 250.0
+    assert data["items_count"] == 2
+
+    # Agregar un detalle
+    client.post(f"/comanda/{comanda_id}/detalles", json={"id_producto": 3, "cantidad": 3, "precio_unitario": 10.0})
+    data = client.get(f"/comanda/{comanda_id}").json()
+    assert data["total"] == 280.0
+    assert data["items_count"] == 3
+
+    # Modificar un detalle
+    detalle_id = data["detalles_comanda"][0]["id"]
+    client.put(f"/comanda/{comanda_id}/detalles/{detalle_id}", json={"id_producto": 1, "cantidad": 1, "precio_unitario": 100.0})
+    data = client.get(f"/comanda/{comanda_id}").json()
+    assert data["total"] == 180.0
+
+    # Reemplazar detalles con PUT
+    response = client.put(f"/comanda/{comanda_id}", json={
+        "id_mesa": 10,
+        "id_mozo": 1,
+        "fecha": str(date.today()),
+        "detalles_comanda": [{"id_producto": 5, "cantidad": 4, "precio_unitario": 25.0}]
+    })
+    assert response.status_code == 200
+    assert response.json()["total"] == 100.0
+    assert response.json()["items_count"] == 1
+
+def test_filtrar_y_ordenar_comandas_por_total(client):
+    """
+    Test para verificar el filtrado y ordenamiento por total.
+    """
+    for precio in (10.0, 500.0, 100.0):
+        client.post("/comanda/", json={
+            "id_mesa": 1,
+            "id_mozo": 1,
+            "fecha": str(date.today()),
+            "detalles_comanda": [{"id_producto": 1, "cantidad": 1, "precio_unitario": precio}]
+        })
+
+    response = client.get("/comanda/?total__gte=100&order_by=-total")
+    assert response.status_code == 200
+    data = response.json()
+    assert data["total"] == 2
+    assert [c["total"] for c in data["items"]] == [500.0, 100.0]
+
+    # Rango de fechas (lo usa reporte para pedir solo el período)
+    hoy = date.today()
+    assert client.get(f"/comanda/?fecha__gte={hoy}&fecha__lte={hoy}").json()["total"] == 3
+    assert client.get(f"/comanda/?fecha__gte={hoy + timedelta(days=1)}").json()["total"] == 0
+
+def test_eventos_publicados_y_replay_con_last_event_id(client):
+    """
+    Test para verificar que los cambios publican eventos y que el stream SSE
+    reenvía los eventos posteriores a Last-Event-ID filtrando por estado.
+    """
+    ultimo_id = eventos.bus.ultimo_id
+
+    response_creacion = client.post("/comanda/", json={
+        "id_mesa": 11,
+        "id_mozo": 1,
+        "fecha": str(date.today()),
+        "detalles_comanda": [{"id_producto": 1, "cantidad": 1, "precio_unitario": 10.0}]
+    })
+    comanda_id = response_creacion.json()["id"]
+    client.post(f"/comanda/{comanda_id}/detalles", json={"id_producto": 2, "cantidad": 1, "precio_unitario": 5.0})
+    client.put(f"/comanda/{comanda_id}/pagada")
+
+    publicados, completo = eventos.bus.eventos_desde(ultimo_id)
+    assert completo
+    assert [e.tipo for e in publicados] == ["comanda_creada", "detalle_agregado", "estado_actualizado"]
+    assert publicados[1].datos["detalle"]["id_producto"] == 2
+
+    class RequestDesconectado:
+        async def is_disconnected(self):
+            return True
+
+    async def consumir():
+        return [chunk async for chunk in eventos.generar_stream(RequestDesconectado(), {"pendiente"}, ultimo_id)]
+
+    chunks = asyncio.run(consumir())
+    assert chunks[0].startswith("retry:")
+    assert len(chunks) == 3  # retry + 2 eventos en estado pendiente
+    assert "event: comanda_creada" in chunks[1]
+    assert f"id: {publicados[1].id}" in chunks[2]
+
+def test_archivar_comandas_cerradas(client):
+    """
+    Test para verificar que las comandas cerradas antiguas se archivan y
+    siguen siendo consultables por ID y con include_archived=true.
+    """
+    vieja = client.post("/comanda/", json={
+        "id_mesa": 12,
+        "id_mozo": 1,
+        "fecha": "2020-01-10",
+        "detalles_comanda": [{"id_producto": 1, "cantidad": 2, "precio_unitario": 10.0}]
+    }).json()
+    client.put(f"/comanda/{vieja['id']}/pagada")
+
+    # Comanda antigua pero todavía pendiente: no se archiva
+    client.post("/comanda/", json={
+        "id_mesa": 12,
+        "id_mozo": 1,
+        "fecha": "2020-01-10",
+        "detalles_comanda": [{"id_producto": 1, "cantidad": 1, "precio_unitario": 10.0}]
+    })
+
+    db = TestingSessionLocal()
+    try:
+        assert archivar_comandas(db, dias=30, lote=1) == 1
+    finally:
+        db.close()
+
+    assert client.get("/comanda/").json()["total"] == 1
+
+    response = client.get(f"/comanda/{vieja['id']}")
+    assert response.status_code == 200
+    data = response.json()
+    assert data["estado"] == "pagada"
+    assert data["total"] == 20.0
+    assert len(data["detalles_comanda"]) == 1
+
+    response = client.get("/comanda/?include_archived=true&order_by=id")
+    data = response.json()
+    assert data["total"] == 2
+    assert data["items"][0]["id"] == vieja["id"]
+    assert data["items"][0]["detalles_comanda"][0]["cantidad"] == 2
+
+    response = client.get("/comanda/?include_archived=true&estado=pagada")
+    assert response.json()["total"] == 1
+
+def test_archivar_la_ultima_comanda_no_reutiliza_su_id(client):
+    """
+    Test para verificar que al archivar la comanda con el id más alto la
+    siguiente comanda recibe un id nuevo y el próximo archivado no choca.
+    """
+    def crear_pagada():
+        comanda = client.post("/comanda/", json={
+            "id_mesa": 14,
+            "id_mozo": 1,
+            "fecha": "2020-01-10",
+            "detalles_comanda": [{"id_producto": 1, "cantidad": 1, "precio_unitario": 10.0}]
+        }).json()
+        client.put(f"/comanda/{comanda['id']}/pagada")
+        return comanda
+
+    archivada = crear_pagada()
+    db = TestingSessionLocal()
+    try:
+        assert archivar_comandas(db, dias=30) == 1
+    finally:
+        db.close()
+
+    nueva = crear_pagada()
+    assert nueva["id"] > archivada["id"]
+    assert nueva["detalles_comanda"][0]["id"] > archivada["detalles_comanda"][0]["id"]
+
+    db = TestingSessionLocal()
+    try:
+        assert archivar_comandas(db, dias=30) == 1
+    finally:
+        db.close()
+    assert client.get(f"/comanda/{archivada['id']}").json()["id_mesa"] == 14
+    assert client.get("/comanda/?include_archived=true").json()["total"] == 2
+
+def test_migracion_autoincrement_de_bases_existentes():
+    """
+    Test para verificar que una base creada sin AUTOINCREMENT se migra
+    conservando las filas y sin reutilizar ids ya archivados.
+    """
+    from sqlalchemy import inspect, text
+    from src.comanda import models
+
+    engine_viejo = create_engine("sqlite://", poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine_viejo)
+    with engine_viejo.begin() as conn:
+        for tabla in ("detalle_comandas", "comandas"):
+            conn.exec_driver_sql(f"DROP TABLE {tabla}")
+        # Esquema anterior: sin AUTOINCREMENT
+        conn.exec_driver_sql(
+            "CREATE TABLE comandas (id INTEGER PRIMARY KEY, id_mesa INTEGER NOT NULL, id_mozo INTEGER NOT NULL, "
+            "id_reserva INTEGER, fecha DATE NOT NULL, estado VARCHAR(9) NOT NULL, created_at DATETIME, "
+            "total FLOAT DEFAULT 0 NOT NULL, items_count INTEGER DEFAULT 0 NOT NULL)"
+        )
+        conn.exec_driver_sql(
+            "CREATE TABLE detalle_comandas (id INTEGER PRIMARY KEY, id_comanda INTEGER NOT NULL REFERENCES comandas (id), "
+            "id_producto INTEGER NOT NULL, cantidad INTEGER NOT NULL, precio_unitario FLOAT NOT NULL)"
+        )
+        conn.exec_driver_sql("INSERT INTO comandas (id, id_mesa, id_mozo, fecha, estado) VALUES (1, 1, 1, '2024-01-01', 'pendiente')")
+        conn.exec_driver_sql("INSERT INTO detalle_comandas VALUES (1, 1, 5, 2, 10.0)")
+        conn.exec_driver_sql("INSERT INTO comandas_archivo (id, id_mesa, id_mozo, fecha, estado, total, items_count) "
+                             "VALUES (7, 1, 1, '2020-01-01', 'pagada', 0, 0)")
+
+    asegurar_autoincrement(engine_viejo)
+    asegurar_autoincrement(engine_viejo)  # idempotente
+
+    with engine_viejo.begin() as conn:
+        ddl = conn.scalar(text("SELECT sql FROM sqlite_master WHERE name = 'comandas'"))
+        assert "AUTOINCREMENT" in ddl
+        assert conn.scalar(text("SELECT count(*) FROM detalle_comandas WHERE id_comanda = 1")) == 1
+        conn.exec_driver_sql("INSERT INTO comandas (id_mesa, id_mozo, fecha, estado) VALUES (1, 1, '2024-01-02', 'pendiente')")
+        assert conn.scalar(text("SELECT max(id) FROM comandas")) == 8  # después del archivado
+    indices = {i["name"] for i in inspect(engine_viejo).get_indexes("comandas")}
+    assert {index.name for index in models.Comanda.__table__.indexes} <= indices
+
+def test_modificar_comanda_aplica_solo_diferencias_de_detalles(client):
+    """
+    Test para verificar que el PUT solo actualiza, inserta o elimina los detalles
+    que cambiaron (emparejando por id_producto) y reporta los cambios.
+    """
+    response_creacion = client.post("/comanda/", json={
+        "id_mesa": 13,
+        "id_mozo": 1,
+        "fecha": str(date.today()),
+        "detalles_comanda": [
+            {"id_producto": 1, "cantidad": 1, "precio_unitario": 10.0},
+            {"id_producto": 2, "cantidad": 1, "precio_unitario": 20.0},
+            {"id_producto": 3, "cantidad": 1, "precio_unitario": 30.0}
+        ]
+    })
+    comanda_id = response_creacion.json()["id"]
+    ids_originales = {d["id_producto"]: d["id"] for d in response_creacion.json()["detalles_comanda"]}
+
+    response = client.put(f"/comanda/{comanda_id}", json={
+        "id_mesa": 13,
+        "id_mozo": 1,
+        "fecha": str(date.today()),
+        "detalles_comanda": [
+            {"id_producto": 1, "cantidad": 1, "precio_unitario": 10.0},  # sin cambios
+            {"id_producto": 2, "cantidad": 4, "precio_unitario": 20.0},  # cambia cantidad
+            {"id_producto": 4, "cantidad": 1, "precio_unitario": 5.0}    # nuevo
+        ]                                                                # producto 3 eliminado
+    })
+    assert response.status_code == 200
+    data = response.json()
+    assert data["cambios_detalles"] == {"insertados": 1, "actualizados": 1, "eliminados": 1}
+    assert data["total"] == 95.0
+
+    detalles = {d["id_producto"]: d for d in data["detalles_comanda"]}
+    assert set(detalles) == {1, 2, 4}
+    assert detalles[1]["id"] == ids_originales[1]  # se conservan las filas existentes
+    assert detalles[2]["id"] == ids_originales[2]
+    assert detalles[2]["cantidad"] == 4
+
+def test_referencias_por_estado(client):
+    """
+    Test para verificar el chequeo de referencias de mesa, mozo y producto por estado.
+    """
+    response_creacion = client.post("/comanda/", json={
+        "id_mesa": 14,
+        "id_mozo": 7,
+        "fecha": str(date.today()),
+        "detalles_comanda": [{"id_producto": 99, "cantidad": 1, "precio_unitario": 10.0}]
+    })
+    comanda_id = response_creacion.json()["id"]
+    client.put(f"/comanda/{comanda_id}/facturar")
+
+    response = client.get("/comanda/references?entidad=mesa&id=14&estados=pendiente,facturada")
+    assert response.status_code == 200
+    assert response.json()["estados"] == {"pendiente": False, "facturada": True}
+
+    response = client.get("/comanda/references?entidad=producto&id=99&estados=facturada")
+    assert response.json()["estados"] == {"facturada": True}
+
+    response = client.get("/comanda/references?entidad=mozo&id=8&estados=pendiente,facturada")
+    assert response.json()["estados"] == {"pendiente": False, "facturada": False}
+
+    response = client.get("/comanda/references?entidad=mesa&id=14&estados=inexistente")
+    assert response.status_code == 422
+
+def test_obtener_comanda_abierta_de_mesa(client):
+    """
+    Test para verificar la consulta del ticket abierto (comanda pendiente) de una mesa.
+    """
+    response = client.get("/comanda/abierta/15")
+    assert response.status_code == 404
+
+    response_creacion = client.post("/comanda/", json={
+        "id_mesa": 15,
+        "id_mozo": 1,
+        "fecha": str(date.today()),
+        "detalles_comanda": [{"id_producto": 1, "cantidad": 1, "precio_unitario": 10.0}]
+    })
+    comanda_id = response_creacion.json()["id"]
+
+    response = client.get("/comanda/abierta/15")
+    assert response.status_code == 200
+    assert response.json()["id"] == comanda_id
+
+    # Al pasar a pagada la mesa deja de tener ticket abierto
+    client.put(f"/comanda/{comanda_id}/pagada")
+    assert client.get("/comanda/abierta/15").status_code == 404
+
+    # Volver a pendiente la reabre
+    client.put(f"/comanda/{comanda_id}/pendiente")
+    assert client.get("/comanda/abierta/15").json()["id"] == comanda_id
+
+def test_contadores_de_ventas_por_producto(client):
+    """
+    Test para verificar que los contadores diarios de ventas se mantienen con
+    los cambios de estado y de detalles, y que el top de productos los usa.
+    """
+    hoy = str(date.today())
+    response_creacion = client.post("/comanda/", json={
+        "id_mesa": 16,
+        "id_mozo": 1,
+        "fecha": hoy,
+        "detalles_comanda": [
+            {"id_producto": 1, "cantidad": 2, "precio_unitario": 10.0},
+            {"id_producto": 2, "cantidad": 5, "precio_unitario": 1.0}
+        ]
+    })
+    comanda_id = response_creacion.json()["id"]
+    url_top = f"/comanda/ventas/top-productos?desde={hoy}&hasta={hoy}"
+
+    # Pendiente: todavía no cuenta como venta
+    assert client.get(url_top).json() == []
+
+    client.put(f"/comanda/{comanda_id}/pagada")
+    data = client.get(url_top).json()
+    assert data == [
+        {"id_producto": 2, "cantidad": 5, "importe": 5.0},
+        {"id_producto": 1, "cantidad": 2, "importe": 20.0},
+    ]
+
+    # Agregar un detalle a una comanda pagada actualiza los contadores
+    client.post(f"/comanda/{comanda_id}/detalles", json={"id_producto": 1, "cantidad": 4, "precio_unitario": 10.0})
+    data = client.get(url_top + "&limite=1").json()
+    assert data == [{"id_producto": 1, "cantidad": 6, "importe": 60.0}]
+
+    # Anularla descuenta todo
+    client.put(f"/comanda/{comanda_id}/anulada")
+    assert client.get(url_top).json() == []
+
+def test_cambiar_estado_en_lote(client):
+    """
+    Test para verificar el cambio de estado de varias comandas en una sola llamada.
+    """
+    ids = []
+    for mesa in (17, 18):
+        response_creacion = client.post("/comanda/", json={
+            "id_mesa": mesa,
+            "id_mozo": 1,
+            "fecha": str(date.today()),
+            "detalles_comanda": [{"id_producto": 1, "cantidad": 1, "precio_unitario": 10.0}]
+        })
+        ids.append(response_creacion.json()["id"])
+
+    response = client.put("/comanda/estado", json={"ids": ids, "estado": "facturada"})
+    assert response.status_code == 200
+    assert response.json()["actualizadas"] == 2
+    for id_ in ids:
+        assert client.get(f"/comanda/{id_}").json()["estado"] == "facturada"
+
+    # Si alguna no existe no se modifica ninguna
+    response = client.put("/comanda/estado", json={"ids": [ids[0], 999], "estado": "pagada"})
+    assert response.status_code == 404
+    assert client.get(f"/comanda/{ids[0]}").json()["estado"] == "facturada"
@@ -3,6 +3,11 @@ from pydantic_settings import BaseSettings, SettingsConfigDict
 class Settings(BaseSettings):
     database_url: str
     COMANDA_API_BASE_URL: str = "http://gestion-comanda:8000"
+    FACTURA_BATCH_CONCURRENCIA: int = 10  # consultas simultáneas a otros servicios en POST /factura/batch
+    FACTURA_PDF_DIR: str = "./pdf-cache"  # caché en disco de PDFs, una entrada por hash del contenido
+    FACTURA_PDF_MAX_ARCHIVOS: int = 1000  # PDFs en la caché en disco; se borran los usados hace más tiempo
+    FACTURA_PDF_WORKERS: int = 2  # procesos del pool de renderizado
+    IDEMPOTENCIA_TTL_HORAS: int = 24  # tiempo que se guarda la respuesta de cada Idempotency-Key
     model_config = SettingsConfigDict(env_file=".env")
 
 settings = Settings()
@@ -1,4 +1,4 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
 from .config import settings
@@ -8,6 +8,27 @@ engine = create_engine(
     connect_args={"check_same_thread": False}, # Necesario para SQLite
 )
 
+
+def habilitar_savepoints(engine):
+    """
+    pysqlite abre la transacción recién en el primer INSERT/UPDATE, y el RELEASE de
+    un SAVEPOINT sin transacción abierta hace commit. Con el BEGIN a cargo de
+    SQLAlchemy, `Session.begin_nested()` se comporta como en el resto de las bases.
+    """
+    if engine.dialect.name != "sqlite":
+        return
+
+    @event.listens_for(engine, "connect")
+    def _sin_begin_implicito(dbapi_connection, connection_record):
+        dbapi_connection.isolation_level = None
+
+    @event.listens_for(engine, "begin")
+    def _begin(conn):
+        conn.exec_driver_sql("BEGIN")
+
+
+habilitar_savepoints(engine)
+
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 Base = declarative_base()
@@ -0,0 +1,105 @@
+"""
+Rollup diario para el cierre de caja (`cierre_diario`).
+
+Cada fila acumula cantidad, total y monto_seña de las facturas de un día por
+medio de pago y estado. Los handlers que crean facturas o cambian su estado
+aplican la diferencia en la misma transacción, así `GET /factura/cierre` lee
+solo filas del rollup sin importar el tamaño del historial.
+
+Al arrancar, si el rollup está vacío pero hay facturas (bases anteriores al
+rollup) se reconstruye solo. Reconstrucción completa (desde la carpeta del servicio):
+
+    python -m src.factura.cierre
+"""
+from datetime import date
+
+from sqlalchemy import delete, func, insert, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+
+from . import models
+
+
+def _sumar(db: Session, factura: models.Factura, estado: models.EstadoFactura, signo: int) -> None:
+    """Suma (o resta, con signo -1) la factura en la fila de su día, medio de pago y estado"""
+    fila = {
+        "fecha": factura.fecha_emision.date(),
+        "medio_pago": models.MedioPago(getattr(factura.medio_pago, "value", factura.medio_pago)),
+        "estado": models.EstadoFactura(getattr(estado, "value", estado)),
+        "cantidad": signo,
+        "total": signo * factura.total,
+        "monto_seña": signo * (factura.monto_seña or 0.0),
+    }
+    stmt = sqlite_insert(models.CierreDiario)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["fecha", "medio_pago", "estado"],
+        set_={
+            "cantidad": models.CierreDiario.cantidad + stmt.excluded.cantidad,
+            "total": models.CierreDiario.total + stmt.excluded.total,
+            "monto_seña": models.CierreDiario.monto_seña + stmt.excluded.monto_seña,
+        },
+    )
+    db.execute(stmt, fila)
+
+
+def registrar_facturas(db: Session, facturas: list[models.Factura]) -> None:
+    """Suma facturas recién creadas (deben estar flusheadas para tener fecha_emision), sin hacer commit"""
+    for factura in facturas:
+        _sumar(db, factura, factura.estado, 1)
+
+
+def cambiar_estado(db: Session, factura: models.Factura, nuevo_estado: models.EstadoFactura) -> None:
+    """Mueve la factura de la fila de su estado actual a la del nuevo estado, sin hacer commit"""
+    _sumar(db, factura, factura.estado, -1)
+    _sumar(db, factura, nuevo_estado, 1)
+
+
+def consultar(db: Session, desde: date, hasta: date) -> list[models.CierreDiario]:
+    """Filas del rollup en el rango (inclusive), sin las que quedaron en cero"""
+    cierre = models.CierreDiario
+    return db.scalars(
+        select(cierre)
+        .where(cierre.fecha >= desde, cierre.fecha <= hasta, cierre.cantidad != 0)
+        .order_by(cierre.fecha, cierre.medio_pago, cierre.estado)
+    ).all()
+
+
+def reconstruir(db: Session) -> int:
+    """Recalcula todo el rollup desde `facturas`"""
+    factura = models.Factura
+    fecha = func.date(factura.fecha_emision)
+    db.execute(delete(models.CierreDiario))
+    db.execute(
+        insert(models.CierreDiario).from_select(
+            ["fecha", "medio_pago", "estado", "cantidad", "total", "monto_seña"],
+            select(
+                fecha,
+                factura.medio_pago,
+                factura.estado,
+                func.count(factura.id),
+                func.sum(factura.total),
+                func.sum(factura.monto_seña),
+            ).group_by(fecha, factura.medio_pago, factura.estado),
+        )
+    )
+    db.commit()
+    return db.scalar(select(func.count()).select_from(models.CierreDiario))
+
+
+def reconstruir_si_falta(db: Session) -> bool:
+    """Reconstruye el rollup si está vacío y hay facturas. Devuelve si lo reconstruyó"""
+    if db.scalar(select(models.CierreDiario.fecha).limit(1)) is not None:
+        return False
+    if db.scalar(select(models.Factura.id).limit(1)) is None:
+        return False
+    reconstruir(db)
+    return True
+
+
+if __name__ == "__main__":
+    from ..database import SessionLocal, engine
+
+    models.Base.metadata.create_all(bind=engine)
+    with SessionLocal() as db:
+        filas = reconstruir(db)
+        print(f"cierre_diario reconstruida con {filas} filas")
@@ -0,0 +1,99 @@
+"""
+Exportación masiva de facturas para contabilidad (GET /factura/export).
+
+Las filas se leen con un cursor del lado del servidor (`yield_per`) y se
+escriben en bloques directamente a la respuesta, sin paginar ni validar cada
+factura con Pydantic. La memoria usada no depende de la cantidad de facturas.
+"""
+import csv
+import io
+import json
+from datetime import date, datetime, time, timedelta
+from typing import Iterator
+
+from sqlalchemy import Engine, select
+from sqlalchemy.orm import Session
+
+from . import models
+
+FILAS_POR_LOTE = 1000
+
+COLUMNAS_FACTURA = ["id", "id_comanda", "fecha_emision", "total", "monto_seña", "medio_pago", "estado"]
+COLUMNAS_DETALLE = ["id_detalle", "id_producto", "cantidad", "precio_unitario", "subtotal"]
+
+
+def _query(desde: date | None, hasta: date | None, incluir_detalles: bool):
+    factura, detalle = models.Factura, models.DetalleFactura
+    columnas = [getattr(factura, nombre) for nombre in COLUMNAS_FACTURA]
+    if incluir_detalles:
+        columnas += [
+            detalle.id.label("id_detalle"),
+            detalle.id_producto,
+            detalle.cantidad,
+            detalle.precio_unitario,
+            detalle.subtotal,
+        ]
+    query = select(*columnas)
+    if incluir_detalles:
+        query = query.outerjoin(detalle, detalle.id_factura == factura.id)
+    if desde is not None:
+        query = query.where(factura.fecha_emision >= datetime.combine(desde, time.min))
+    if hasta is not None:
+        query = query.where(factura.fecha_emision < datetime.combine(hasta + timedelta(days=1), time.min))
+    orden = [factura.id] + ([detalle.id] if incluir_detalles else [])
+    return query.order_by(*orden).execution_options(yield_per=FILAS_POR_LOTE)
+
+
+def _valor(valor):
+    if hasattr(valor, "value"):
+        return valor.value
+    if isinstance(valor, (date, datetime)):
+        return valor.isoformat()
+    return valor
+
+
+def _filas(engine: Engine, desde: date | None, hasta: date | None, incluir_detalles: bool) -> Iterator[list]:
+    # Sesión propia: la del request puede cerrarse antes de terminar el stream
+    with Session(bind=engine) as db:
+        for particion in db.execute(_query(desde, hasta, incluir_detalles)).partitions():
+            yield [[_valor(v) for v in fila] for fila in particion]
+
+
+def exportar_csv(engine: Engine, desde: date | None, hasta: date | None, incluir_detalles: bool) -> Iterator[bytes]:
+    """Una fila por factura, o una por línea de detalle si se incluyen los detalles"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(COLUMNAS_FACTURA + (COLUMNAS_DETALLE if incluir_detalles else []))
+    for lote in _filas(engine, desde, hasta, incluir_detalles):
+        writer.writerows(lote)
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+def exportar_ndjson(engine: Engine, desde: date | None, hasta: date | None, incluir_detalles: bool) -> Iterator[bytes]:
+    """Un objeto JSON por línea y por factura, con sus detalles anidados si se piden"""
+    cantidad = len(COLUMNAS_FACTURA)
+    actual: dict | None = None
+    for lote in _filas(engine, desde, hasta, incluir_detalles):
+        lineas = []
+        for fila in lote:
+            if not incluir_detalles:
+                lineas.append(json.dumps(dict(zip(COLUMNAS_FACTURA, fila)), ensure_ascii=False))
+                continue
+            # El join trae las líneas de cada factura consecutivas (orden por id)
+            if actual is None or actual["id"] != fila[0]:
+                if actual is not None:
+                    lineas.append(json.dumps(actual, ensure_ascii=False))
+                actual = dict(zip(COLUMNAS_FACTURA, fila[:cantidad]))
+                actual["detalles"] = []
+            if fila[cantidad] is not None:
+                detalle = dict(zip(COLUMNAS_DETALLE, fila[cantidad:]))
+                detalle["id"] = detalle.pop("id_detalle")
+                actual["detalles"].append(detalle)
+        if lineas:
+            yield ("\n".join(lineas) + "\n").encode()
+    if actual is not None:
+        yield (json.dumps(actual, ensure_ascii=False) + "\n").encode()
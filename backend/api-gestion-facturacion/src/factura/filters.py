@@ -5,6 +5,7 @@ class FacturaFilter(Filter):
     # Filtros básicos
     id: int | None = None                    # ?id=1
     id__neq: int | None = None               # ?id__neq=1
+    id__gt: int | None = None                # ?id__gt=100 (sincronización incremental de reporte)
     id_comanda: int | None = None            # ?id_comanda=123
     id_comanda__neq: int | None = None       # ?id_comanda__neq=123
 
@@ -14,6 +14,16 @@ class ComandaClient:
             resp.raise_for_status()
             return None
         
+    async def marcar_comandas_facturadas(self, ids_comanda: list[int]):
+        """Marca varias comandas como facturadas en una sola llamada"""
+        async with httpx.AsyncClient(base_url=self.base_url, timeout=10) as client:
+            resp = await client.put(
+                "/comanda/estado",
+                json={"ids": ids_comanda, "estado": "facturada"},
+            )
+            resp.raise_for_status()
+            return None
+
     async def marcar_comanda_pendiente(self, id_comanda: int):
         async with httpx.AsyncClient(base_url=self.base_url, timeout=5) as client:
             resp = await client.put(
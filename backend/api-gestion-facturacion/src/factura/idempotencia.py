@@ -0,0 +1,131 @@
+"""
+Soporte del header `Idempotency-Key` en las rutas de escritura de facturas.
+
+La primera vez que llega una clave se reserva (fila `completada=0`) y, si el
+handler termina bien, se guarda su status y cuerpo. Un reintento con la misma
+clave y el mismo request recibe la respuesta guardada sin volver a consultar
+comandas ni reservas. Si el handler falla la reserva se libera, así el
+reintento se procesa de nuevo. Las claves vencen a las IDEMPOTENCIA_TTL_HORAS.
+"""
+import hashlib
+import json
+from datetime import datetime, timedelta, timezone
+
+from fastapi import Depends, Header, HTTPException, Request, status
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from sqlalchemy import delete
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from ..config import settings
+from ..database import get_db
+from . import models
+
+
+def _ahora() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def limpiar_vencidas(db: Session) -> int:
+    """Borra las claves más viejas que el TTL, sin hacer commit"""
+    limite = _ahora() - timedelta(hours=settings.IDEMPOTENCIA_TTL_HORAS)
+    resultado = db.execute(
+        delete(models.ClaveIdempotencia)
+        .where(models.ClaveIdempotencia.created_at < limite)
+        .execution_options(synchronize_session=False)
+    )
+    return resultado.rowcount
+
+
+class Idempotencia:
+    def __init__(self, db: Session, clave: str | None, hash_request: str):
+        self.db = db
+        self.clave = clave
+        self.hash_request = hash_request
+        # Respuesta guardada de un request anterior con la misma clave
+        self.respuesta: JSONResponse | None = None
+        self._reservada = False
+
+    def reservar(self) -> None:
+        if self.clave is None:
+            return
+        limpiar_vencidas(self.db)
+        registro = self.db.get(models.ClaveIdempotencia, self.clave)
+        if registro is not None:
+            self._validar_registro(registro)
+            return
+
+        self.db.add(models.ClaveIdempotencia(
+            clave=self.clave, hash_request=self.hash_request, completada=0, created_at=_ahora(),
+        ))
+        try:
+            self.db.commit()
+        except IntegrityError:
+            # Otro request con la misma clave la reservó primero
+            self.db.rollback()
+            self._validar_registro(self.db.get(models.ClaveIdempotencia, self.clave))
+            return
+        self._reservada = True
+
+    def _validar_registro(self, registro: models.ClaveIdempotencia) -> None:
+        if registro.hash_request != self.hash_request:
+            raise HTTPException(
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                detail="La Idempotency-Key ya se usó con un request distinto",
+            )
+        if not registro.completada:
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail="Hay un request con la misma Idempotency-Key en curso",
+            )
+        self.respuesta = JSONResponse(
+            status_code=registro.status_code,
+            content=json.loads(registro.respuesta),
+            headers={"Idempotent-Replayed": "true"},
+        )
+
+    def completar(self, status_code: int, contenido) -> None:
+        """Guarda la respuesta del handler para los reintentos con la misma clave"""
+        if not self._reservada:
+            return
+        registro = self.db.get(models.ClaveIdempotencia, self.clave)
+        registro.completada = 1
+        registro.status_code = status_code
+        registro.respuesta = json.dumps(jsonable_encoder(contenido))
+        self.db.commit()
+        self._reservada = False
+
+    def liberar(self) -> None:
+        """Descarta la reserva de un request que falló para que pueda reintentarse"""
+        if not self._reservada:
+            return
+        self.db.rollback()
+        self.db.execute(
+            delete(models.ClaveIdempotencia)
+            .where(models.ClaveIdempotencia.clave == self.clave, models.ClaveIdempotencia.completada == 0)
+            .execution_options(synchronize_session=False)
+        )
+        self.db.commit()
+        self._reservada = False
+
+
+async def control_idempotencia(
+    request: Request,
+    idempotency_key: str | None = Header(None, alias="Idempotency-Key", max_length=255),
+    db: Session = Depends(get_db),
+):
+    cuerpo = await request.body()
+    hash_request = hashlib.sha256(
+        f"{request.method} {request.url.path}?{request.url.query}\n".encode() + cuerpo
+    ).hexdigest()
+
+    control = Idempotencia(db, idempotency_key, hash_request)
+    control.reservar()
+    try:
+        yield control
+    except Exception:
+        control.liberar()
+        raise
+    # Si el handler no guardó respuesta (no debería pasar), no dejar la clave bloqueada
+    control.liberar()
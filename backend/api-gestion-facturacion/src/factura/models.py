@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, Float, String, DateTime, func, ForeignKey, Enum
+from sqlalchemy import Column, Integer, Float, String, Text, Date, DateTime, func, ForeignKey, Enum, Index, text
 from sqlalchemy.orm import relationship
 from ..database import Base
 import enum
@@ -30,6 +30,22 @@ class Factura(Base):
     # Relación con detalles
     detalles_factura = relationship("DetalleFactura", back_populates="factura")
 
+    # fecha_emision y created_at vuelven en el RETURNING del INSERT (el rollup de cierre
+    # lee fecha_emision tras el flush); sin esto se recargan con un SELECT por factura
+    __mapper_args__ = {"eager_defaults": True}
+
+    __table_args__ = (
+        # Agregaciones de ingresos por período (GET /factura/stats/ingresos)
+        Index("ix_facturas_estado_fecha_emision", "estado", "fecha_emision"),
+        # Una sola factura activa por comanda; la base lo garantiza aun con requests concurrentes
+        Index(
+            "ux_facturas_id_comanda_activa", "id_comanda",
+            unique=True,
+            sqlite_where=text("estado NOT IN ('anulada', 'cancelada')"),
+            postgresql_where=text("estado NOT IN ('anulada', 'cancelada')"),
+        ),
+    )
+
 class DetalleFactura(Base):
     __tablename__ = "detalle_facturas"  
 
@@ -42,3 +58,25 @@ class DetalleFactura(Base):
 
     # Relación con Factura
     factura = relationship("Factura", back_populates="detalles_factura")
+
+class CierreDiario(Base):
+    """Acumulados por día, medio de pago y estado (cierre de caja), mantenidos al crear o cambiar facturas"""
+    __tablename__ = "cierre_diario"
+
+    fecha = Column(Date, primary_key=True)
+    medio_pago = Column(Enum(MedioPago), primary_key=True)
+    estado = Column(Enum(EstadoFactura), primary_key=True)
+    cantidad = Column(Integer, default=0, nullable=False)
+    total = Column(Float, default=0.0, nullable=False)
+    monto_seña = Column(Float, default=0.0, nullable=False)
+
+class ClaveIdempotencia(Base):
+    """Resultado guardado de un request de escritura con header Idempotency-Key"""
+    __tablename__ = "claves_idempotencia"
+
+    clave = Column(String, primary_key=True)
+    hash_request = Column(String, nullable=False)  # método, ruta y cuerpo del request original
+    completada = Column(Integer, default=0, nullable=False)
+    status_code = Column(Integer, nullable=True)
+    respuesta = Column(Text, nullable=True)  # cuerpo JSON de la respuesta
+    created_at = Column(DateTime, nullable=False, index=True)
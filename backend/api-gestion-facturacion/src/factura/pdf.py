@@ -0,0 +1,218 @@
+"""
+Generación de PDFs de facturas (GET /factura/{id}/pdf).
+
+El HTML se arma con jinja2 y se convierte con weasyprint dentro de un
+ProcessPoolExecutor, así el renderizado (cientos de ms) no bloquea el event
+loop. Cada PDF se guarda en disco con el hash de su contenido como nombre:
+si la factura no cambió, la descarga es una lectura de archivo. Al pagar una
+factura se encola su renderizado para que la primera descarga ya esté lista.
+La caché guarda hasta FACTURA_PDF_MAX_ARCHIVOS archivos: cada descarga renueva
+la fecha del suyo y al escribir uno nuevo se borran los usados hace más tiempo
+(p. ej. las versiones viejas de una factura que cambió).
+"""
+import asyncio
+import hashlib
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import lru_cache
+from pathlib import Path
+
+from fastapi import BackgroundTasks
+
+from ..config import settings
+from . import models
+
+DIRECTORIO_PLANTILLAS = Path(__file__).parent / "templates"
+PLANTILLA = "factura.html"
+
+
+def datos_factura(factura: models.Factura) -> dict:
+    """Contenido de la factura que aparece en el PDF, serializable y determinístico"""
+    return {
+        "id": factura.id,
+        "id_comanda": factura.id_comanda,
+        "fecha_emision": factura.fecha_emision.isoformat(sep=" ", timespec="seconds"),
+        "medio_pago": factura.medio_pago.value,
+        "estado": factura.estado.value,
+        "total": factura.total,
+        "monto_seña": factura.monto_seña,
+        "detalles": [
+            {
+                "id_producto": d.id_producto,
+                "cantidad": d.cantidad,
+                "precio_unitario": d.precio_unitario,
+                "subtotal": d.subtotal,
+            }
+            for d in sorted(factura.detalles_factura, key=lambda d: d.id)
+        ],
+    }
+
+
+@lru_cache(maxsize=1)
+def _version_plantilla() -> str:
+    return hashlib.sha256((DIRECTORIO_PLANTILLAS / PLANTILLA).read_bytes()).hexdigest()
+
+
+def clave_cache(datos: dict) -> str:
+    """Hash del contenido de la factura y de la plantilla (si cambia cualquiera, cambia el PDF)"""
+    contenido = json.dumps(datos, sort_keys=True, ensure_ascii=False) + _version_plantilla()
+    return hashlib.sha256(contenido.encode()).hexdigest()
+
+
+@lru_cache(maxsize=1)
+def _entorno():
+    from jinja2 import Environment, FileSystemLoader, select_autoescape
+
+    return Environment(loader=FileSystemLoader(DIRECTORIO_PLANTILLAS), autoescape=select_autoescape())
+
+
+def renderizar_html(datos: dict) -> str:
+    return _entorno().get_template(PLANTILLA).render(factura=datos)
+
+
+def renderizar_pdf(datos: dict) -> tuple[bytes, float]:
+    """Corre en un proceso del pool. Devuelve el PDF y los segundos que tardó"""
+    from weasyprint import HTML
+
+    inicio = time.perf_counter()
+    pdf = HTML(string=renderizar_html(datos)).write_pdf()
+    return pdf, time.perf_counter() - inicio
+
+
+class RenderizadorPDF:
+    def __init__(self, directorio: str, workers: int, max_archivos: int):
+        self.directorio = Path(directorio)
+        self.workers = workers
+        self.max_archivos = max_archivos
+        self._pool: ProcessPoolExecutor | None = None
+        self._en_curso: dict[str, asyncio.Future] = {}
+        self._en_cola = 0
+        self._renderizados = 0
+        self._errores = 0
+        self._cache_hits = 0
+        self._cache_misses = 0
+        self._segundos_total = 0.0
+        self._segundos_max = 0.0
+        self._segundos_ultimo = 0.0
+
+    def ruta(self, clave: str) -> Path:
+        return self.directorio / f"{clave}.pdf"
+
+    async def obtener(self, datos: dict) -> Path:
+        """Devuelve la ruta del PDF, renderizándolo solo si no está en la caché"""
+        clave = clave_cache(datos)
+        ruta = self.ruta(clave)
+        try:
+            os.utime(ruta)  # último uso, para el barrido de la caché
+        except FileNotFoundError:
+            self._cache_misses += 1
+        else:
+            self._cache_hits += 1
+            return ruta
+        return await self._renderizar_una_vez(clave, datos)
+
+    def encolar(self, background_tasks: BackgroundTasks, datos: dict) -> None:
+        """Agenda el pre-renderizado para después de enviar la respuesta"""
+        self._en_cola += 1
+        background_tasks.add_task(self._prerenderizar, datos)
+
+    async def _prerenderizar(self, datos: dict) -> None:
+        try:
+            clave = clave_cache(datos)
+            if not self.ruta(clave).exists():
+                await self._renderizar_una_vez(clave, datos)
+        except Exception:
+            # Ya contado en errores; la descarga volverá a intentarlo
+            pass
+        finally:
+            self._en_cola -= 1
+
+    async def _renderizar_una_vez(self, clave: str, datos: dict) -> Path:
+        # Pedidos simultáneos del mismo PDF comparten un único renderizado
+        tarea = self._en_curso.get(clave)
+        if tarea is None:
+            tarea = asyncio.ensure_future(self._renderizar(clave, datos))
+            self._en_curso[clave] = tarea
+            tarea.add_done_callback(lambda _: self._en_curso.pop(clave, None))
+        return await asyncio.shield(tarea)
+
+    async def _renderizar(self, clave: str, datos: dict) -> Path:
+        try:
+            pdf, segundos = await self._ejecutar(datos)
+        except Exception:
+            self._errores += 1
+            raise
+        self._renderizados += 1
+        self._segundos_total += segundos
+        self._segundos_ultimo = segundos
+        self._segundos_max = max(self._segundos_max, segundos)
+
+        # Escritura atómica: nunca se sirve un PDF a medio escribir
+        self.directorio.mkdir(parents=True, exist_ok=True)
+        ruta = self.ruta(clave)
+        temporal = ruta.with_suffix(f".{os.getpid()}.tmp")
+        temporal.write_bytes(pdf)
+        os.replace(temporal, ruta)
+        self._barrer(conservar=ruta)
+        return ruta
+
+    def _barrer(self, conservar: Path) -> None:
+        """Borra los PDFs usados hace más tiempo hasta quedar en `max_archivos`"""
+        archivos = []
+        for archivo in self.directorio.glob("*.pdf"):
+            try:
+                archivos.append((archivo.stat().st_mtime, archivo))
+            except FileNotFoundError:
+                pass  # lo borró otro worker
+        sobrantes = len(archivos) - self.max_archivos
+        if sobrantes <= 0:
+            return
+        for _, archivo in sorted(archivos)[:sobrantes]:
+            if archivo != conservar:
+                archivo.unlink(missing_ok=True)
+
+    def _obtener_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            # spawn: el hijo no hereda el event loop, los threads ni las conexiones del proceso padre
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return self._pool
+
+    async def _ejecutar(self, datos: dict) -> tuple[bytes, float]:
+        loop = asyncio.get_running_loop()
+        try:
+            return await loop.run_in_executor(self._obtener_pool(), renderizar_pdf, datos)
+        except BrokenProcessPool:
+            # Un proceso murió (p. ej. por memoria): se arma otro pool en el próximo renderizado
+            self.cerrar()
+            raise
+
+    def cerrar(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    def metricas(self) -> dict:
+        promedio = self._segundos_total / self._renderizados if self._renderizados else 0.0
+        return {
+            "en_cola": self._en_cola,
+            "renderizando": len(self._en_curso),
+            "renderizados": self._renderizados,
+            "errores": self._errores,
+            "cache_hits": self._cache_hits,
+            "cache_misses": self._cache_misses,
+            "render_ms_promedio": round(promedio * 1000, 1),
+            "render_ms_max": round(self._segundos_max * 1000, 1),
+            "render_ms_ultimo": round(self._segundos_ultimo * 1000, 1),
+        }
+
+
+renderizador = RenderizadorPDF(
+    settings.FACTURA_PDF_DIR, settings.FACTURA_PDF_WORKERS, settings.FACTURA_PDF_MAX_ARCHIVOS
+)
@@ -1,11 +1,24 @@
-from fastapi import APIRouter, HTTPException, Depends, status
-from sqlalchemy.orm import Session
+import asyncio
+
+from concurrent.futures.process import BrokenProcessPool
+from datetime import date
+
+from fastapi import APIRouter, HTTPException, Depends, status, Query, BackgroundTasks
+from fastapi.responses import FileResponse, StreamingResponse
+from sqlalchemy.orm import Session, selectinload
 from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
 
+from ..config import settings
 from ..database import get_db
 from . import models, schemas
 from .filters import FacturaFilter
 from .validator import FacturaValidator
+from .stats import ingresos
+from . import cierre
+from .pdf import datos_factura, renderizador
+from .exportar import exportar_csv, exportar_ndjson
+from .idempotencia import Idempotencia, control_idempotencia
 
 from fastapi_filter import FilterDepends
 from fastapi_pagination import Page
@@ -18,7 +31,14 @@ from .httpClient import ComandaClient
 router = APIRouter()
 
 @router.post("/", response_model=schemas.FacturaOut, status_code=status.HTTP_201_CREATED)
-async def create(payload: schemas.FacturaCreate, db: Session = Depends(get_db)):
+async def create(
+    payload: schemas.FacturaCreate,
+    db: Session = Depends(get_db),
+    idempotencia: Idempotencia = Depends(control_idempotencia),
+):
+    if idempotencia.respuesta is not None:
+        return idempotencia.respuesta
+
     validator = FacturaValidator(db)
 
     # Validar y obtener datos de la comanda
@@ -31,7 +51,7 @@ async def create(payload: schemas.FacturaCreate, db: Session = Depends(get_db)):
     id_reserva = datos_comanda["comanda"].get("id_reserva")
     total = await validator.calcular_total_con_descuento_seña(datos_comanda["detalles"], id_reserva)
 
-    # Obtener monto de seña aplicado como descuento
+    # Obtener monto de seña aplicado como descuento (la reserva ya está memoizada en el validator)
     monto_seña = await validator.obtener_descuento_seña(id_reserva) if id_reserva else 0.0
 
     db_factura = models.Factura(
@@ -42,7 +62,10 @@ async def create(payload: schemas.FacturaCreate, db: Session = Depends(get_db)):
         estado=models.EstadoFactura.pendiente
     )
     db.add(db_factura)
-    db.flush()
+    try:
+        db.flush()
+    except IntegrityError as e:
+        validator.manejar_error_integridad(e, payload.id_comanda)
 
     for detalle in detalles_factura:
         db_detalle = models.DetalleFactura(
@@ -53,6 +76,7 @@ async def create(payload: schemas.FacturaCreate, db: Session = Depends(get_db)):
             subtotal=detalle.subtotal,
         )
         db.add(db_detalle)
+    cierre.registrar_facturas(db, [db_factura])
 
     try:
         await ComandaClient().marcar_comanda_facturada(payload.id_comanda)
@@ -64,8 +88,121 @@ async def create(payload: schemas.FacturaCreate, db: Session = Depends(get_db)):
         )
     db.commit()
     db.refresh(db_factura)
+    idempotencia.completar(status.HTTP_201_CREATED, schemas.FacturaOut.model_validate(db_factura))
     return db_factura
 
+@router.post("/batch", response_model=schemas.FacturaBatchOut)
+async def create_batch(
+    payload: list[schemas.FacturaCreate],
+    db: Session = Depends(get_db),
+    idempotencia: Idempotencia = Depends(control_idempotencia),
+):
+    """
+    Factura varias comandas en un solo request. Los datos de comandas y reservas
+    se consultan en paralelo (con límite de concurrencia), las facturas se insertan
+    en una sola transacción (con un SAVEPOINT por factura) y las comandas se marcan
+    con una única llamada.
+    """
+    if idempotencia.respuesta is not None:
+        return idempotencia.respuesta
+
+    validator = FacturaValidator(db)
+    errores: dict[int, str] = {}
+
+    # Una sola consulta para las facturas activas existentes
+    con_factura = validator.comandas_con_factura_activa([item.id_comanda for item in payload])
+    vistos: set[int] = set()
+    a_preparar: list[int] = []
+    for i, item in enumerate(payload):
+        if item.id_comanda in con_factura:
+            errores[i] = "Ya existe una factura activa para esta comanda"
+        elif item.id_comanda in vistos:
+            errores[i] = "Comanda repetida en el lote"
+        else:
+            vistos.add(item.id_comanda)
+            a_preparar.append(i)
+
+    semaforo = asyncio.Semaphore(settings.FACTURA_BATCH_CONCURRENCIA)
+
+    async def preparar(item: schemas.FacturaCreate):
+        async with semaforo:
+            datos_comanda = await validator.obtener_datos_comanda(item.id_comanda)
+            id_reserva = datos_comanda["comanda"].get("id_reserva")
+            total = await validator.calcular_total_con_descuento_seña(datos_comanda["detalles"], id_reserva)
+            monto_seña = await validator.obtener_descuento_seña(id_reserva) if id_reserva else 0.0
+            detalles = validator.crear_detalles_factura_desde_comanda(datos_comanda["detalles"])
+            return total, monto_seña, detalles
+
+    preparados = await asyncio.gather(
+        *(preparar(payload[i]) for i in a_preparar), return_exceptions=True
+    )
+
+    nuevas: dict[int, models.Factura] = {}
+    for i, preparado in zip(a_preparar, preparados):
+        if isinstance(preparado, HTTPException):
+            errores[i] = str(preparado.detail)
+            continue
+        if isinstance(preparado, Exception):
+            errores[i] = f"Error al preparar la factura: {preparado}"
+            continue
+        total, monto_seña, detalles = preparado
+        nuevas[i] = models.Factura(
+            id_comanda=payload[i].id_comanda,
+            total=total,
+            monto_seña=monto_seña,
+            medio_pago=payload[i].medio_pago,
+            estado=models.EstadoFactura.pendiente,
+            detalles_factura=[models.DetalleFactura(**detalle.model_dump()) for detalle in detalles],
+        )
+
+    # Un SAVEPOINT por factura: si otra request facturó la comanda entre la consulta
+    # inicial y el insert, falla solo ese item y el resto del lote sigue
+    for i in list(nuevas):
+        try:
+            with db.begin_nested():
+                db.add(nuevas[i])
+        except IntegrityError as e:
+            if "id_comanda" not in str(e.orig):
+                raise
+            del nuevas[i]
+            errores[i] = "Ya existe una factura activa para esta comanda"
+
+    facturas: dict[int, models.Factura] = {}
+    if nuevas:
+        cierre.registrar_facturas(db, list(nuevas.values()))
+        try:
+            await ComandaClient().marcar_comandas_facturadas([f.id_comanda for f in nuevas.values()])
+        except httpx.HTTPError as e:
+            db.rollback()
+            raise HTTPException(
+                status_code=502,
+                detail=f"No se pudo actualizar el estado de las comandas: {str(e)}",
+            )
+        ids_factura = [f.id for f in nuevas.values()]
+        db.commit()
+        facturas = {
+            f.id: f
+            for f in db.scalars(
+                select(models.Factura)
+                .where(models.Factura.id.in_(ids_factura))
+                .options(selectinload(models.Factura.detalles_factura))
+            )
+        }
+
+    resultados = []
+    for i, item in enumerate(payload):
+        if i in nuevas:
+            factura = facturas[nuevas[i].id]
+            resultados.append({"id_comanda": item.id_comanda, "ok": True, "factura": factura})
+        else:
+            resultados.append({"id_comanda": item.id_comanda, "ok": False, "error": errores[i]})
+
+    respuesta = schemas.FacturaBatchOut(
+        creadas=len(nuevas), fallidas=len(payload) - len(nuevas), resultados=resultados
+    )
+    idempotencia.completar(status.HTTP_200_OK, respuesta)
+    return respuesta
+
 @router.get("/", response_model=Page[schemas.FacturaList])
 def list_all(
     filtro: FacturaFilter = FilterDepends(FacturaFilter),
@@ -75,6 +212,53 @@ def list_all(
     query = filtro.sort(query)
     return paginate(db, query)
 
+@router.get("/stats/ingresos", response_model=schemas.IngresosOut)
+def stats_ingresos(
+    granularidad: schemas.Granularidad = Query(schemas.Granularidad.month),
+    estado: list[schemas.EstadoFactura] = Query([schemas.EstadoFactura.pagada]),
+    medio_pago: schemas.MedioPago | None = None,
+    desde: date | None = Query(None, description="Fecha de emisión desde (inclusive)"),
+    hasta: date | None = Query(None, description="Fecha de emisión hasta (inclusive)"),
+    db: Session = Depends(get_db),
+):
+    """Ingresos agrupados por día, semana o mes, calculados con GROUP BY en la base"""
+    return ingresos(db, granularidad, estado, medio_pago, desde, hasta)
+
+@router.get("/cierre", response_model=list[schemas.CierreDiarioOut])
+def cierre_de_caja(
+    desde: date = Query(..., description="Fecha desde (inclusive)"),
+    hasta: date = Query(..., description="Fecha hasta (inclusive)"),
+    db: Session = Depends(get_db),
+):
+    """Totales por día, medio de pago y estado leídos del rollup `cierre_diario`"""
+    if desde > hasta:
+        raise HTTPException(status_code=400, detail="'desde' no puede ser posterior a 'hasta'")
+    return cierre.consultar(db, desde, hasta)
+
+@router.get("/export")
+def export(
+    desde: date | None = Query(None, description="Fecha de emisión desde (inclusive)"),
+    hasta: date | None = Query(None, description="Fecha de emisión hasta (inclusive)"),
+    formato: schemas.FormatoExportacion = Query(schemas.FormatoExportacion.csv, alias="format"),
+    detalles: bool = Query(False, description="Incluir las líneas de detalle_facturas"),
+    db: Session = Depends(get_db),
+):
+    """Exporta facturas en streaming (CSV o NDJSON) sin paginar"""
+    if formato == schemas.FormatoExportacion.csv:
+        contenido, media_type = exportar_csv(db.get_bind(), desde, hasta, detalles), "text/csv"
+    else:
+        contenido, media_type = exportar_ndjson(db.get_bind(), desde, hasta, detalles), "application/x-ndjson"
+    return StreamingResponse(
+        contenido,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="facturas.{formato.value}"'},
+    )
+
+@router.get("/pdf/metricas", response_model=schemas.PdfMetricasOut)
+def pdf_metricas():
+    """Profundidad de la cola de pre-renderizado, tiempos de render y uso de la caché"""
+    return renderizador.metricas()
+
 @router.get("/{id_}", response_model=schemas.FacturaOut)
 def get_one(id_: int, db: Session = Depends(get_db)):
     obj = db.get(models.Factura, id_)
@@ -82,8 +266,33 @@ def get_one(id_: int, db: Session = Depends(get_db)):
         raise HTTPException(status_code=404, detail="Factura no encontrada")
     return obj
 
+@router.get("/{id_}/pdf")
+async def get_pdf(id_: int, db: Session = Depends(get_db)):
+    obj = db.get(models.Factura, id_)
+    if obj is None:
+        raise HTTPException(status_code=404, detail="Factura no encontrada")
+
+    try:
+        ruta = await renderizador.obtener(datos_factura(obj))
+    except (ImportError, OSError, BrokenProcessPool):
+        # Falta jinja2/weasyprint o las librerías de sistema que usa weasyprint,
+        # o murió un proceso del pool (el próximo pedido usa uno nuevo)
+        raise HTTPException(
+            status_code=503,
+            detail="La generación de PDF no está disponible en este entorno",
+        )
+    return FileResponse(ruta, media_type="application/pdf", filename=f"factura-{obj.id}.pdf")
+
 @router.put("/{id_}/pagar", response_model=schemas.FacturaOut)
-async def mark_as_paid(id_: int, db: Session = Depends(get_db)):
+async def mark_as_paid(
+    id_: int,
+    background_tasks: BackgroundTasks,
+    db: Session = Depends(get_db),
+    idempotencia: Idempotencia = Depends(control_idempotencia),
+):
+    if idempotencia.respuesta is not None:
+        return idempotencia.respuesta
+
     obj = db.get(models.Factura, id_)
     if obj is None:
         raise HTTPException(status_code=404, detail="Factura no encontrada")
@@ -91,6 +300,7 @@ async def mark_as_paid(id_: int, db: Session = Depends(get_db)):
     validator = FacturaValidator(db)
     validator.validar_transicion_estado(obj, models.EstadoFactura.pagada)
 
+    cierre.cambiar_estado(db, obj, models.EstadoFactura.pagada)
     obj.estado = models.EstadoFactura.pagada
 
     obj.id_comanda
@@ -106,10 +316,20 @@ async def mark_as_paid(id_: int, db: Session = Depends(get_db)):
 
     db.commit()
     db.refresh(obj)
+    idempotencia.completar(status.HTTP_200_OK, schemas.FacturaOut.model_validate(obj))
+    # La factura pagada es la que se descarga: dejar su PDF listo en la caché
+    renderizador.encolar(background_tasks, datos_factura(obj))
     return obj
 
 @router.put("/{id_}/cancelar", response_model=schemas.FacturaOut)
-async def mark_as_cancelled(id_: int, db: Session = Depends(get_db)):
+async def mark_as_cancelled(
+    id_: int,
+    db: Session = Depends(get_db),
+    idempotencia: Idempotencia = Depends(control_idempotencia),
+):
+    if idempotencia.respuesta is not None:
+        return idempotencia.respuesta
+
     obj = db.get(models.Factura, id_)
     if obj is None:
         raise HTTPException(status_code=404, detail="Factura no encontrada")
@@ -117,6 +337,7 @@ async def mark_as_cancelled(id_: int, db: Session = Depends(get_db)):
     validator = FacturaValidator(db)
     validator.validar_transicion_estado(obj, models.EstadoFactura.cancelada)
 
+    cierre.cambiar_estado(db, obj, models.EstadoFactura.cancelada)
     obj.estado = models.EstadoFactura.cancelada
 
     try:
@@ -130,10 +351,18 @@ async def mark_as_cancelled(id_: int, db: Session = Depends(get_db)):
 
     db.commit()
     db.refresh(obj)
+    idempotencia.completar(status.HTTP_200_OK, schemas.FacturaOut.model_validate(obj))
     return obj
 
 @router.put("/{id_}/anular", response_model=schemas.FacturaOut)
-async def mark_as_annulled(id_: int, db: Session = Depends(get_db)):
+async def mark_as_annulled(
+    id_: int,
+    db: Session = Depends(get_db),
+    idempotencia: Idempotencia = Depends(control_idempotencia),
+):
+    if idempotencia.respuesta is not None:
+        return idempotencia.respuesta
+
     obj = db.get(models.Factura, id_)
     if obj is None:
         raise HTTPException(status_code=404, detail="Factura no encontrada")
@@ -151,7 +380,9 @@ async def mark_as_annulled(id_: int, db: Session = Depends(get_db)):
     )
 
 
+    cierre.cambiar_estado(db, obj, models.EstadoFactura.anulada)
     obj.estado = models.EstadoFactura.anulada
     db.commit()
     db.refresh(obj)
+    idempotencia.completar(status.HTTP_200_OK, schemas.FacturaOut.model_validate(obj))
     return obj
@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field, ConfigDict
-from datetime import datetime
+from datetime import date, datetime
 from typing import List, Optional, Literal
 from enum import Enum
 
@@ -65,3 +65,62 @@ class FacturaList(BaseModel):
     medio_pago: MedioPago
     estado: EstadoFactura
     model_config = ConfigDict(from_attributes=True)
+
+# Schemas para estadísticas de ingresos
+class Granularidad(str, Enum):
+    day = "day"
+    week = "week"
+    month = "month"
+
+class IngresoPeriodo(BaseModel):
+    periodo: str  # fecha de inicio del período (YYYY-MM-DD)
+    cantidad: int
+    total: float
+    ticket_promedio: float
+
+class IngresosOut(BaseModel):
+    granularidad: Granularidad
+    cantidad: int
+    total: float
+    ticket_promedio: float
+    periodos: List[IngresoPeriodo]
+
+# Schemas para el cierre de caja
+class CierreDiarioOut(BaseModel):
+    fecha: date
+    medio_pago: MedioPago
+    estado: EstadoFactura
+    cantidad: int
+    total: float
+    monto_seña: float
+    model_config = ConfigDict(from_attributes=True)
+
+# Schemas para la exportación
+class FormatoExportacion(str, Enum):
+    csv = "csv"
+    ndjson = "ndjson"
+
+# Schemas para la generación de PDFs
+class PdfMetricasOut(BaseModel):
+    en_cola: int  # pre-renderizados pendientes
+    renderizando: int
+    renderizados: int
+    errores: int
+    cache_hits: int
+    cache_misses: int
+    render_ms_promedio: float
+    render_ms_max: float
+    render_ms_ultimo: float
+
+# Schemas para facturación en lote
+class FacturaBatchResultado(BaseModel):
+    """Resultado de cada item de POST /factura/batch"""
+    id_comanda: int
+    ok: bool
+    factura: Optional[FacturaOut] = None
+    error: Optional[str] = None
+
+class FacturaBatchOut(BaseModel):
+    creadas: int
+    fallidas: int
+    resultados: List[FacturaBatchResultado]
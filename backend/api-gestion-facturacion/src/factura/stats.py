@@ -0,0 +1,74 @@
+"""
+Agregaciones de ingresos calculadas en SQL sobre `facturas`.
+
+El filtro por estado y rango de `fecha_emision` usa el índice compuesto
+`ix_facturas_estado_fecha_emision`, así que no hace falta leer las facturas
+una por una ni paginar desde otros servicios.
+"""
+from datetime import date, datetime, time, timedelta
+
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from . import models, schemas
+
+
+def _expresion_periodo(granularidad: schemas.Granularidad):
+    """Fecha de inicio del período al que pertenece cada factura (SQLite)"""
+    fecha = models.Factura.fecha_emision
+    if granularidad == schemas.Granularidad.day:
+        return func.date(fecha)
+    if granularidad == schemas.Granularidad.week:
+        # Semanas de lunes a domingo: avanzar al domingo y retroceder 6 días
+        return func.date(fecha, "weekday 0", "-6 days")
+    return func.strftime("%Y-%m-01", fecha)
+
+
+def ingresos(
+    db: Session,
+    granularidad: schemas.Granularidad,
+    estados: list[schemas.EstadoFactura],
+    medio_pago: schemas.MedioPago | None = None,
+    desde: date | None = None,
+    hasta: date | None = None,
+) -> dict:
+    """Suma, cantidad y ticket promedio de facturas agrupadas por período"""
+    factura = models.Factura
+    periodo = _expresion_periodo(granularidad).label("periodo")
+    cantidad = func.count(factura.id).label("cantidad")
+    total = func.coalesce(func.sum(factura.total), 0.0).label("total")
+
+    condiciones = [factura.estado.in_([models.EstadoFactura(e.value) for e in estados])]
+    if medio_pago is not None:
+        condiciones.append(factura.medio_pago == models.MedioPago(medio_pago.value))
+    if desde is not None:
+        condiciones.append(factura.fecha_emision >= datetime.combine(desde, time.min))
+    if hasta is not None:
+        # Rango semiabierto para que el índice cubra todo el día final
+        condiciones.append(factura.fecha_emision < datetime.combine(hasta + timedelta(days=1), time.min))
+
+    filas = db.execute(
+        select(periodo, cantidad, total)
+        .where(*condiciones)
+        .group_by(periodo)
+        .order_by(periodo)
+    ).all()
+
+    periodos = [
+        {
+            "periodo": fila.periodo,
+            "cantidad": fila.cantidad,
+            "total": round(fila.total, 2),
+            "ticket_promedio": round(fila.total / fila.cantidad, 2),
+        }
+        for fila in filas
+    ]
+    cantidad_total = sum(p["cantidad"] for p in periodos)
+    suma_total = round(sum(fila.total for fila in filas), 2)
+    return {
+        "granularidad": granularidad,
+        "cantidad": cantidad_total,
+        "total": suma_total,
+        "ticket_promedio": round(suma_total / cantidad_total, 2) if cantidad_total else 0.0,
+        "periodos": periodos,
+    }
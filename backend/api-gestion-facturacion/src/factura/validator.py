@@ -1,4 +1,6 @@
+import asyncio
 import httpx
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 from fastapi import HTTPException, status
 from . import models, schemas
@@ -8,12 +10,14 @@ class FacturaValidator:
         self.db = db
         self.comanda_api_url = "http://gestion-comanda:8000"
         self.reserva_api_url = "http://gestion-reservas:8000"
+        # Reservas consultadas durante este request (id_reserva -> tarea)
+        self._reservas: dict[int, asyncio.Future] = {}
 
     async def obtener_datos_comanda(self, id_comanda: int) -> dict:
         """Obtiene los datos completos de la comanda desde la API de gestión-comanda"""
         try:
             async with httpx.AsyncClient() as client:
-                # Obtener datos de la comanda
+                # ComandaOut ya incluye todos los detalles, no hace falta pedir /detalles (paginado)
                 response_comanda = await client.get(f"{self.comanda_api_url}/comanda/{id_comanda}")
                 if response_comanda.status_code != 200:
                     if response_comanda.status_code == 404:
@@ -27,20 +31,11 @@ class FacturaValidator:
                             detail="Error al obtener datos de comanda"
                         )
 
-                # Obtener detalles de la comanda
-                response_detalles = await client.get(f"{self.comanda_api_url}/comanda/{id_comanda}/detalles")
-                if response_detalles.status_code != 200:
-                    raise HTTPException(
-                        status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                        detail="Error al obtener detalles de comanda"
-                    )
-
                 comanda_data = response_comanda.json()
-                detalles_data = response_detalles.json()
 
                 return {
                     "comanda": comanda_data,
-                    "detalles": detalles_data["items"]  # Extraer items de la paginación
+                    "detalles": comanda_data.get("detalles_comanda", [])
                 }
 
         except httpx.RequestError:
@@ -49,53 +44,72 @@ class FacturaValidator:
                 detail="No se pudo conectar al servicio de gestión-comanda"
             )
 
-    async def validar_seña_reserva_pagada(self, id_reserva: int):
-        """Valida que si la comanda tiene reserva, la seña esté pagada"""
-        if not id_reserva:
-            return  # No hay reserva, validación pasa
-
+    async def obtener_reserva(self, id_reserva: int) -> dict | None:
+        """
+        Obtiene la reserva una sola vez por request. Las llamadas concurrentes
+        comparten la misma consulta en curso. Devuelve None si la reserva no existe.
+        """
+        tarea = self._reservas.get(id_reserva)
+        if tarea is None:
+            tarea = asyncio.ensure_future(self._consultar_reserva(id_reserva))
+            self._reservas[id_reserva] = tarea
+        return await tarea
+
+    async def _consultar_reserva(self, id_reserva: int) -> dict | None:
         try:
             async with httpx.AsyncClient() as client:
-                # Obtener datos de la reserva
                 response = await client.get(f"{self.reserva_api_url}/reserva/{id_reserva}")
-                if response.status_code == 404:
-                    # Reserva no existe, pero no es error crítico para facturación
-                    return
-                elif response.status_code != 200:
-                    raise HTTPException(
-                        status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                        detail="Error al consultar reserva"
-                    )
-
-                reserva_data = response.json()
-
-                # Verificar si tiene menú reserva con seña pagada
-                menu_reserva = reserva_data.get("menu_reserva")
-                if menu_reserva and menu_reserva.get("monto_seña"):
-                    if not menu_reserva.get("seña_pagada", False):
-                        raise HTTPException(
-                            status_code=status.HTTP_400_BAD_REQUEST,
-                            detail=f"La reserva {id_reserva} tiene una seña pendiente de pago. No se puede facturar hasta que la seña sea pagada."
-                        )
-
         except httpx.RequestError:
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                 detail="No se pudo conectar al servicio de gestión-reservas"
             )
+        if response.status_code == 404:
+            return None
+        if response.status_code != 200:
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail="Error al consultar reserva"
+            )
+        return response.json()
 
-    def validar_no_factura_existente(self, id_comanda: int):
-        """Valida que no existe una factura para esta comanda"""
-        factura_existente = self.db.query(models.Factura).filter(
-            models.Factura.id_comanda == id_comanda,
-            models.Factura.estado != models.EstadoFactura.anulada and models.Factura.estado != models.EstadoFactura.cancelada
-        ).first()
+    async def validar_seña_reserva_pagada(self, id_reserva: int):
+        """Valida que si la comanda tiene reserva, la seña esté pagada"""
+        if not id_reserva:
+            return  # No hay reserva, validación pasa
 
-        if factura_existente:
+        reserva_data = await self.obtener_reserva(id_reserva)
+        if reserva_data is None:
+            # Reserva no existe, pero no es error crítico para facturación
+            return
+
+        # Verificar si tiene menú reserva con seña pagada
+        menu_reserva = reserva_data.get("menu_reserva")
+        if menu_reserva and menu_reserva.get("monto_seña"):
+            if not menu_reserva.get("seña_pagada", False):
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail=f"La reserva {id_reserva} tiene una seña pendiente de pago. No se puede facturar hasta que la seña sea pagada."
+                )
+
+    def manejar_error_integridad(self, error: IntegrityError, id_comanda: int | None = None):
+        """Hace rollback y traduce la violación de `ux_facturas_id_comanda_activa` en un 400"""
+        self.db.rollback()
+        if "id_comanda" in str(error.orig):
+            comanda = f"la comanda {id_comanda}" if id_comanda is not None else "una de las comandas"
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
-                detail=f"Ya existe una factura activa para la comanda {id_comanda}"
-            )
+                detail=f"Ya existe una factura activa para {comanda}"
+            ) from error
+        raise error
+
+    def comandas_con_factura_activa(self, ids_comanda: list[int]) -> set[int]:
+        """Devuelve, en una sola consulta, las comandas que ya tienen una factura activa"""
+        filas = self.db.query(models.Factura.id_comanda).filter(
+            models.Factura.id_comanda.in_(ids_comanda),
+            models.Factura.estado.notin_([models.EstadoFactura.anulada, models.EstadoFactura.cancelada]),
+        ).distinct()
+        return {id_comanda for (id_comanda,) in filas}
 
     def validar_transicion_estado(self, factura: models.Factura, nuevo_estado: models.EstadoFactura):
         """Valida que la transición de estado sea válida"""
@@ -118,12 +132,11 @@ class FacturaValidator:
 
     async def validar_creacion_factura(self, payload: schemas.FacturaCreate):
         """Valida todos los requisitos para crear una factura"""
+        # La unicidad de la factura activa la controla el índice único al insertar
+
         # Validar que la comanda existe y obtener sus datos
         datos_comanda = await self.obtener_datos_comanda(payload.id_comanda)
 
-        # Validar que no existe factura para esta comanda
-        self.validar_no_factura_existente(payload.id_comanda)
-
         return datos_comanda  # Retornar datos completos de la comanda
 
     def crear_detalles_factura_desde_comanda(self, detalles_comanda: list) -> list[schemas.DetalleFacturaCreate]:
@@ -163,19 +176,16 @@ class FacturaValidator:
     async def obtener_descuento_seña(self, id_reserva: int) -> float:
         """Obtiene el monto de descuento por seña pagada (monto_seña > 0)"""
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.get(f"{self.reserva_api_url}/reserva/{id_reserva}")
-                if response.status_code == 200:
-                    reserva_data = response.json()
-                    menu_reserva = reserva_data.get("menu_reserva")
+            reserva_data = await self.obtener_reserva(id_reserva)
+        except Exception:
+            # En caso de error de conexión o cualquier otro, no aplicar descuento
+            return 0.0
 
-                    # Si tiene menú reserva con monto_seña > 0, devolver el monto como descuento
-                    if menu_reserva and menu_reserva.get("monto_seña") and menu_reserva["monto_seña"] > 0:
-                        return float(menu_reserva["monto_seña"])
+        menu_reserva = (reserva_data or {}).get("menu_reserva")
 
-                # Si no hay seña pagada (monto_seña <= 0) o hay error, no aplicar descuento
-                return 0.0
+        # Si tiene menú reserva con monto_seña > 0, devolver el monto como descuento
+        if menu_reserva and menu_reserva.get("monto_seña") and menu_reserva["monto_seña"] > 0:
+            return float(menu_reserva["monto_seña"])
 
-        except Exception:
-            # En caso de error de conexión o cualquier otro, no aplicar descuento
-            return 0.0
\ No newline at end of file
+        # Si no hay seña pagada (monto_seña <= 0) o no existe la reserva, no aplicar descuento
+        return 0.0
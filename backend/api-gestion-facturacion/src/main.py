@@ -1,14 +1,62 @@
+import logging
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
-from .database import engine
-from .factura import models as factura_models
+from sqlalchemy import func, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from .database import SessionLocal, engine
+from .factura import cierre, models as factura_models
+from .factura.pdf import renderizador
 from .factura.router import router as factura_router
 
+logger = logging.getLogger(__name__)
+
 # Crea las tablas en la base de datos (si no existen)
 factura_models.Base.metadata.create_all(bind=engine)
 
+
+def crear_indices(bind) -> None:
+    """
+    create_all no agrega índices nuevos a tablas existentes. Si datos previos impiden
+    crear `ux_facturas_id_comanda_activa` el servicio no arranca: sin el índice nada
+    evita dos facturas activas para la misma comanda.
+    """
+    for index in factura_models.Factura.__table__.indexes:
+        try:
+            index.create(bind=bind, checkfirst=True)
+        except IntegrityError as e:
+            factura = factura_models.Factura
+            with Session(bind) as db:
+                duplicadas = db.scalars(
+                    select(factura.id_comanda)
+                    .where(factura.estado.notin_([factura_models.EstadoFactura.anulada, factura_models.EstadoFactura.cancelada]))
+                    .group_by(factura.id_comanda)
+                    .having(func.count() > 1)
+                ).all()
+            logger.error(
+                "No se pudo crear el índice %s: las comandas %s tienen más de una factura activa; "
+                "hay que anular los duplicados a mano", index.name, duplicadas,
+            )
+            raise RuntimeError(f"Índice {index.name} sin crear: comandas con más de una factura activa") from e
+
+
+crear_indices(engine)
+# Bases con facturas de antes del rollup de cierre
+with SessionLocal() as db:
+    cierre.reconstruir_si_falta(db)
+
 from fastapi_pagination import add_pagination
 
-app = FastAPI(title="API gestion-facturacion")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    # Libera los procesos del pool de PDFs
+    renderizador.cerrar()
+
+
+app = FastAPI(title="API gestion-facturacion", lifespan=lifespan)
 
 @app.get("/health")
 def health():
@@ -1,3 +1,4 @@
+import httpx
 import pytest
 from fastapi.testclient import TestClient
 from datetime import datetime
@@ -13,7 +14,7 @@ from sqlalchemy.orm import sessionmaker
 from sqlalchemy.pool import StaticPool
 
 from src.main import app
-from src.database import Base, get_db
+from src.database import Base, get_db, habilitar_savepoints
 from src.factura import models
 
 # --- Configuración de la Base de Datos de Prueba ---
@@ -25,6 +26,7 @@ engine = create_engine(
     connect_args={"check_same_thread": False},
     poolclass=StaticPool,  # Deshabilita el pooling de conexiones para SQLite en memoria
 )
+habilitar_savepoints(engine)
 
 # Creamos una sesión de prueba
 TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
@@ -471,4 +473,515 @@ def test_crear_factura_con_reserva_con_seña(mock_obtener_datos, mock_calcular_t
 
 # Este test ya no aplica porque ahora el total se calcula automáticamente
 # def test_validacion_total_incorrecto(client):
-#     pass
\ No newline at end of file
+#     pass
+
+
+@patch('src.factura.httpClient.ComandaClient.marcar_comanda_facturada')
+@patch('httpx.AsyncClient.get', new_callable=AsyncMock)
+def test_crear_factura_una_consulta_por_servicio(mock_get, mock_marcar_facturada, client):
+    """
+    Test para verificar que crear una factura consulta la comanda una sola vez
+    (con todos sus detalles, aunque sean más de una página) y la reserva una sola vez.
+    """
+    from unittest.mock import Mock
+
+    detalles = [
+        {"id": i, "id_producto": i, "cantidad": 1, "precio_unitario": 100}
+        for i in range(1, 61)  # más de 50 líneas (tamaño de página por defecto)
+    ]
+    respuesta_comanda = Mock(status_code=200)
+    respuesta_comanda.json.return_value = {"id": 1, "id_reserva": 7, "detalles_comanda": detalles}
+    respuesta_reserva = Mock(status_code=200)
+    respuesta_reserva.json.return_value = {"id": 7, "menu_reserva": {"monto_seña": 1000, "seña_pagada": True}}
+
+    mock_get.side_effect = lambda url: respuesta_reserva if "/reserva/" in url else respuesta_comanda
+    mock_marcar_facturada.return_value = None
+
+    response = client.post("/factura/", json={"id_comanda": 1, "medio_pago": "efectivo"})
+    assert response.status_code == 201, response.text
+    data = response.json()
+    assert len(data["detalles_factura"]) == 60
+    assert data["total"] == 6000 - 1000
+    assert data["monto_seña"] == 1000
+
+    urls = [llamada.args[0] for llamada in mock_get.call_args_list]
+    assert len(urls) == 2
+    assert sum("/comanda/" in url for url in urls) == 1
+    assert sum("/reserva/" in url for url in urls) == 1
+
+@patch('src.factura.httpClient.ComandaClient.marcar_comandas_facturadas')
+@patch('src.factura.httpClient.ComandaClient.marcar_comanda_facturada')
+@patch('src.factura.validator.FacturaValidator.obtener_datos_comanda')
+def test_crear_facturas_en_lote(mock_obtener_datos, mock_marcar_facturada, mock_marcar_lote, client):
+    """
+    Test para verificar la facturación en lote: resultados por comanda, sin duplicar
+    facturas activas y marcando todas las comandas con una sola llamada.
+    """
+    def datos(id_comanda):
+        if id_comanda == 4:
+            return {"comanda": {"id": 4}, "detalles": []}  # sin detalles: debe fallar solo este item
+        return {
+            "comanda": {"id": id_comanda},
+            "detalles": [{"id": 1, "id_producto": 1, "cantidad": 2, "precio_unitario": 100 * id_comanda}],
+        }
+    mock_obtener_datos.side_effect = datos
+    mock_marcar_facturada.return_value = None
+    mock_marcar_lote.return_value = None
+
+    # La comanda 3 ya tiene una factura activa
+    assert client.post("/factura/", json={"id_comanda": 3, "medio_pago": "efectivo"}).status_code == 201
+
+    lote = [
+        {"id_comanda": 1, "medio_pago": "efectivo"},
+        {"id_comanda": 2, "medio_pago": "transferencia"},
+        {"id_comanda": 3, "medio_pago": "efectivo"},
+        {"id_comanda": 2, "medio_pago": "efectivo"},
+        {"id_comanda": 4, "medio_pago": "efectivo"},
+    ]
+    response = client.post("/factura/batch", json=lote)
+    assert response.status_code == 200, response.text
+    data = response.json()
+    assert data["creadas"] == 2
+    assert data["fallidas"] == 3
+
+    resultados = data["resultados"]
+    assert [r["id_comanda"] for r in resultados] == [1, 2, 3, 2, 4]
+    assert [r["ok"] for r in resultados] == [True, True, False, False, False]
+    assert resultados[0]["factura"]["total"] == 200
+    assert resultados[1]["factura"]["total"] == 400
+    assert resultados[1]["factura"]["medio_pago"] == "transferencia"
+    assert len(resultados[0]["factura"]["detalles_factura"]) == 1
+    assert "factura activa" in resultados[2]["error"]
+    assert "repetida" in resultados[3]["error"]
+    assert "sin detalles" in resultados[4]["error"]
+
+    mock_marcar_lote.assert_called_once_with([1, 2])
+    assert client.get("/factura/?id_comanda=1").json()["total"] == 1
+
+@patch('src.factura.validator.FacturaValidator.comandas_con_factura_activa', return_value=set())
+@patch('src.factura.httpClient.ComandaClient.marcar_comandas_facturadas')
+@patch('src.factura.httpClient.ComandaClient.marcar_comanda_facturada')
+@patch('src.factura.validator.FacturaValidator.obtener_datos_comanda')
+def test_lote_con_factura_creada_en_carrera(mock_obtener_datos, mock_marcar_facturada, mock_marcar_lote, mock_activas, client):
+    """
+    Si otra request factura una comanda entre la consulta inicial y el insert,
+    el índice único rechaza solo ese item y el resto del lote se crea.
+    """
+    mock_obtener_datos.side_effect = lambda id_comanda: {
+        "comanda": {"id": id_comanda},
+        "detalles": [{"id": 1, "id_producto": 1, "cantidad": 1, "precio_unitario": 100}],
+    }
+    mock_marcar_facturada.return_value = None
+    mock_marcar_lote.return_value = None
+
+    # La consulta inicial no la ve (mockeada), pero la comanda 2 ya tiene factura activa
+    assert client.post("/factura/", json={"id_comanda": 2, "medio_pago": "efectivo"}).status_code == 201
+
+    lote = [{"id_comanda": id_comanda, "medio_pago": "efectivo"} for id_comanda in (1, 2, 3)]
+    response = client.post("/factura/batch", json=lote)
+    assert response.status_code == 200, response.text
+    data = response.json()
+    assert (data["creadas"], data["fallidas"]) == (2, 1)
+    assert [r["ok"] for r in data["resultados"]] == [True, False, True]
+    assert "factura activa" in data["resultados"][1]["error"]
+
+    mock_marcar_lote.assert_called_once_with([1, 3])
+    assert client.get("/factura/?id_comanda=2").json()["total"] == 1
+    assert client.get("/factura/?id_comanda=3").json()["total"] == 1
+
+    # Si después falla el servicio de comandas, el rollback deshace también los SAVEPOINT liberados
+    mock_marcar_lote.side_effect = httpx.ConnectError("sin conexión")
+    lote = [{"id_comanda": id_comanda, "medio_pago": "efectivo"} for id_comanda in (4, 2)]
+    assert client.post("/factura/batch", json=lote).status_code == 502
+    assert client.get("/factura/?id_comanda=4").json()["total"] == 0
+
+def test_stats_ingresos_agrupados_por_periodo(client):
+    """
+    Test para verificar que /factura/stats/ingresos suma, cuenta y promedia en SQL
+    por período, filtrando por estado y medio de pago (sin límite de página).
+    """
+    db = TestingSessionLocal()
+    facturas = [
+        (datetime(2025, 1, 6, 12), 100, "efectivo", "pagada"),      # lunes
+        (datetime(2025, 1, 12, 21), 300, "transferencia", "pagada"),  # domingo, misma semana
+        (datetime(2025, 1, 13, 10), 50, "efectivo", "pagada"),      # semana siguiente
+        (datetime(2025, 2, 1, 13), 200, "efectivo", "pagada"),
+        (datetime(2025, 2, 2, 13), 999, "efectivo", "anulada"),     # no cuenta por defecto
+    ]
+    # Más de una página de facturas en marzo
+    facturas += [(datetime(2025, 3, 10, 20), 10, "debito", "pagada")] * 60
+    for id_comanda, (fecha, total, medio_pago, estado) in enumerate(facturas, start=1):
+        db.add(models.Factura(
+            id_comanda=id_comanda, fecha_emision=fecha, total=total,
+            medio_pago=models.MedioPago(medio_pago), estado=models.EstadoFactura(estado),
+        ))
+    db.commit()
+    db.close()
+
+    data = client.get("/factura/stats/ingresos").json()
+    assert data["granularidad"] == "month"
+    assert data["cantidad"] == 64
+    assert data["total"] == 1250
+    assert [(p["periodo"], p["cantidad"], p["total"]) for p in data["periodos"]] == [
+        ("2025-01-01", 3, 450), ("2025-02-01", 1, 200), ("2025-03-01", 60, 600),
+    ]
+    assert data["periodos"][0]["ticket_promedio"] == 150
+
+    data = client.get("/factura/stats/ingresos?granularidad=week&hasta=2025-01-31").json()
+    assert [(p["periodo"], p["total"]) for p in data["periodos"]] == [("2025-01-06", 400), ("2025-01-13", 50)]
+
+    data = client.get(
+        "/factura/stats/ingresos?granularidad=day&medio_pago=efectivo"
+        "&estado=pagada&estado=anulada&desde=2025-02-01&hasta=2025-02-28"
+    ).json()
+    assert [(p["periodo"], p["total"]) for p in data["periodos"]] == [("2025-02-01", 200), ("2025-02-02", 999)]
+    assert data["ticket_promedio"] == 599.5
+
+@patch('src.factura.httpClient.ComandaClient.marcar_comanda_anulada')
+@patch('src.factura.httpClient.ComandaClient.marcar_comanda_pagada')
+@patch('src.factura.httpClient.ComandaClient.marcar_comanda_facturada')
+@patch('src.factura.validator.FacturaValidator.obtener_datos_comanda')
+def test_cierre_diario_incremental(mock_obtener_datos, mock_marcar_facturada, mock_marcar_pagada, mock_marcar_anulada, client):
+    """
+    Test para verificar que el rollup `cierre_diario` se mantiene al crear y cambiar
+    de estado facturas, y que coincide con una reconstrucción completa.
+    """
+    from src.factura import cierre
+
+    mock_obtener_datos.return_value = {
+        "comanda": {"id": 1},
+        "detalles": [{"id": 1, "id_producto": 1, "cantidad": 2, "precio_unitario": 100}],
+    }
+    id_1 = client.post("/factura/", json={"id_comanda": 1, "medio_pago": "efectivo"}).json()["id"]
+    id_2 = client.post("/factura/", json={"id_comanda": 2, "medio_pago": "efectivo"}).json()["id"]
+    client.post("/factura/", json={"id_comanda": 3, "medio_pago": "debito"})
+    assert client.put(f"/factura/{id_1}/pagar").status_code == 200
+    assert client.put(f"/factura/{id_2}/anular").status_code == 200
+
+    hoy = client.get(f"/factura/{id_1}").json()["fecha_emision"][:10]
+    response = client.get(f"/factura/cierre?desde={hoy}&hasta={hoy}")
+    assert response.status_code == 200
+    filas = {(f["medio_pago"], f["estado"]): (f["cantidad"], f["total"]) for f in response.json()}
+    assert filas == {
+        ("efectivo", "pagada"): (1, 200),
+        ("efectivo", "anulada"): (1, 200),
+        ("debito", "pendiente"): (1, 200),
+    }
+
+    # La reconstrucción desde `facturas` da el mismo resultado
+    db = TestingSessionLocal()
+    cierre.reconstruir(db)
+    db.close()
+    assert client.get(f"/factura/cierre?desde={hoy}&hasta={hoy}").json() == response.json()
+
+    assert client.get("/factura/cierre?desde=2025-02-01&hasta=2025-01-01").status_code == 400
+
+def test_arranque_falla_si_no_se_puede_crear_el_indice_unico(caplog):
+    """
+    Test para verificar que con datos previos que violan el índice único de
+    factura activa el servicio no arranca y registra las comandas duplicadas.
+    """
+    from src.main import crear_indices
+
+    engine_previo = create_engine("sqlite:///:memory:", poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine_previo)
+    with engine_previo.begin() as conn:
+        conn.exec_driver_sql("DROP INDEX ux_facturas_id_comanda_activa")
+    with sessionmaker(bind=engine_previo)() as db:
+        for _ in range(2):
+            db.add(models.Factura(id_comanda=7, total=100, medio_pago=models.MedioPago.efectivo))
+        db.add(models.Factura(id_comanda=8, total=100, medio_pago=models.MedioPago.efectivo))
+        db.commit()
+
+    with pytest.raises(RuntimeError):
+        crear_indices(engine_previo)
+    assert "las comandas [7] tienen más de una factura activa" in caplog.text
+
+def test_cierre_se_reconstruye_si_falta(client):
+    """
+    Test para verificar que en una base con facturas pero sin rollup (anterior a
+    `cierre_diario`) se reconstruye una sola vez, y que fecha_emision vuelve en el
+    mismo INSERT sin otro SELECT.
+    """
+    from src.factura import cierre
+
+    db = TestingSessionLocal()
+    assert cierre.reconstruir_si_falta(db) is False  # sin facturas no hay nada que armar
+
+    factura = models.Factura(id_comanda=1, total=150, medio_pago=models.MedioPago.efectivo)
+    db.add(factura)
+    db.flush()
+    assert "fecha_emision" in factura.__dict__
+    db.add(models.Factura(
+        id_comanda=2, fecha_emision=datetime(2025, 1, 6, 12), total=50,
+        medio_pago=models.MedioPago.debito, estado=models.EstadoFactura.pagada,
+    ))
+    db.commit()
+
+    assert cierre.reconstruir_si_falta(db) is True
+    assert cierre.reconstruir_si_falta(db) is False
+    db.close()
+    filas = client.get("/factura/cierre?desde=2025-01-06&hasta=2025-01-06").json()
+    assert [(f["medio_pago"], f["estado"], f["total"]) for f in filas] == [("debito", "pagada", 50)]
+
+@patch('src.factura.httpClient.ComandaClient.marcar_comanda_pagada')
+@patch('src.factura.httpClient.ComandaClient.marcar_comanda_facturada')
+@patch('src.factura.validator.FacturaValidator.obtener_datos_comanda')
+def test_pdf_factura_con_cache_y_prerender(mock_obtener_datos, mock_marcar_facturada, mock_marcar_pagada, client, tmp_path):
+    """
+    Test para verificar que el PDF se renderiza una vez por contenido, que las
+    descargas repetidas salen de la caché en disco y que pagar pre-renderiza el PDF.
+    """
+    from src.factura.pdf import RenderizadorPDF, renderizar_html
+
+    mock_obtener_datos.return_value = {
+        "comanda": {"id": 1},
+        "detalles": [{"id": 1, "id_producto": 7, "cantidad": 2, "precio_unitario": 150}],
+    }
+    id_factura = client.post("/factura/", json={"id_comanda": 1, "medio_pago": "efectivo"}).json()["id"]
+
+    renderizador = RenderizadorPDF(str(tmp_path), workers=1, max_archivos=10)
+    renderizador._ejecutar = AsyncMock(return_value=(b"%PDF-1.7 prueba", 0.2))
+    with patch('src.factura.router.renderizador', renderizador):
+        response = client.get(f"/factura/{id_factura}/pdf")
+        assert response.status_code == 200
+        assert response.headers["content-type"] == "application/pdf"
+        assert response.content == b"%PDF-1.7 prueba"
+
+        # Segunda descarga: lectura del archivo, sin renderizar
+        assert client.get(f"/factura/{id_factura}/pdf").status_code == 200
+        assert renderizador._ejecutar.await_count == 1
+
+        # Pagar cambia el contenido y deja el nuevo PDF renderizado en segundo plano
+        assert client.put(f"/factura/{id_factura}/pagar").status_code == 200
+        assert renderizador._ejecutar.await_count == 2
+        assert renderizador._ejecutar.await_args.args[0]["estado"] == "pagada"
+        assert client.get(f"/factura/{id_factura}/pdf").status_code == 200
+        assert renderizador._ejecutar.await_count == 2
+
+        metricas = client.get("/factura/pdf/metricas").json()
+        assert metricas["en_cola"] == 0
+        assert metricas["renderizados"] == 2
+        assert metricas["cache_hits"] == 2
+        assert metricas["cache_misses"] == 1
+        assert metricas["render_ms_max"] == 200.0
+
+    assert len(list(tmp_path.glob("*.pdf"))) == 2
+    html = renderizar_html(renderizador._ejecutar.await_args.args[0])
+    assert "Factura N° 1" in html and "300.00" in html
+
+def test_pdf_cache_borra_los_usados_hace_mas_tiempo(tmp_path):
+    """
+    Test para verificar que la caché de PDFs no pasa de `max_archivos`: al escribir
+    uno nuevo se borra el usado hace más tiempo, y una descarga renueva su archivo.
+    """
+    import asyncio
+    import os
+    from src.factura.pdf import RenderizadorPDF
+
+    renderizador = RenderizadorPDF(str(tmp_path), workers=1, max_archivos=2)
+    renderizador._ejecutar = AsyncMock(return_value=(b"%PDF-1.7 prueba", 0.1))
+
+    def obtener(id_factura, hace_segundos=None):
+        ruta = asyncio.run(renderizador.obtener({"id": id_factura}))
+        if hace_segundos is not None:
+            os.utime(ruta, (ruta.stat().st_atime, ruta.stat().st_mtime - hace_segundos))
+        return ruta
+
+    primera = obtener(1, hace_segundos=30)
+    segunda = obtener(2, hace_segundos=20)
+    assert obtener(1) == primera  # de la caché: pasa a ser la más reciente
+    tercera = obtener(3)
+
+    assert sorted(tmp_path.glob("*.pdf")) == sorted([primera, tercera])
+    assert not segunda.exists()
+    assert renderizador._ejecutar.await_count == 3
+
+def test_pdf_factura_inexistente(client):
+    """
+    Test para verificar que pedir el PDF de una factura inexistente devuelve 404.
+    """
+    assert client.get("/factura/999/pdf").status_code == 404
+
+@patch('src.factura.httpClient.ComandaClient.marcar_comanda_facturada')
+@patch('src.factura.validator.FacturaValidator.obtener_datos_comanda')
+def test_pdf_pool_roto_devuelve_503_y_se_recrea(mock_obtener_datos, mock_marcar_facturada, client, tmp_path):
+    """
+    Test para verificar que si muere un proceso del pool de PDFs se responde 503,
+    se descarta el pool roto y el siguiente pedido arma uno nuevo (con spawn).
+    """
+    from concurrent.futures import Executor
+    from concurrent.futures.process import BrokenProcessPool
+    from src.factura.pdf import RenderizadorPDF
+
+    pools = []
+
+    class PoolRoto(Executor):
+        def __init__(self, max_workers, mp_context):
+            self.mp_context = mp_context
+            self.cerrado = False
+            pools.append(self)
+
+        def submit(self, fn, *args, **kwargs):
+            raise BrokenProcessPool("un proceso del pool terminó abruptamente")
+
+        def shutdown(self, wait=True, *, cancel_futures=False):
+            self.cerrado = True
+
+    mock_obtener_datos.return_value = {
+        "comanda": {"id": 1},
+        "detalles": [{"id": 1, "id_producto": 7, "cantidad": 2, "precio_unitario": 150}],
+    }
+    id_factura = client.post("/factura/", json={"id_comanda": 1, "medio_pago": "efectivo"}).json()["id"]
+
+    renderizador = RenderizadorPDF(str(tmp_path), workers=1, max_archivos=10)
+    with patch('src.factura.router.renderizador', renderizador), \
+            patch('src.factura.pdf.ProcessPoolExecutor', PoolRoto):
+        assert client.get(f"/factura/{id_factura}/pdf").status_code == 503
+        assert renderizador._pool is None
+        assert client.get(f"/factura/{id_factura}/pdf").status_code == 503
+
+    assert len(pools) == 2 and all(p.cerrado for p in pools)
+    assert all(p.mp_context.get_start_method() == "spawn" for p in pools)
+    assert renderizador.metricas()["errores"] == 2
+
+def test_exportar_facturas_csv_y_ndjson(client):
+    """
+    Test para verificar la exportación en streaming de facturas (con y sin detalles)
+    en CSV y NDJSON, filtrando por fecha de emisión.
+    """
+    import csv
+    import io
+    import json
+
+    db = TestingSessionLocal()
+    for i, fecha in enumerate([datetime(2025, 1, 10, 12), datetime(2025, 1, 20, 12), datetime(2025, 2, 5, 12)], start=1):
+        factura = models.Factura(
+            id_comanda=i, fecha_emision=fecha, total=100 * i,
+            medio_pago=models.MedioPago.efectivo, estado=models.EstadoFactura.pagada,
+        )
+        if i == 1:
+            factura.detalles_factura = [
+                models.DetalleFactura(id_producto=1, cantidad=1, precio_unitario=40, subtotal=40),
+                models.DetalleFactura(id_producto=2, cantidad=2, precio_unitario=30, subtotal=60),
+            ]
+        db.add(factura)
+    db.commit()
+    db.close()
+
+    response = client.get("/factura/export?desde=2025-01-01&hasta=2025-01-31")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/csv")
+    filas = list(csv.DictReader(io.StringIO(response.text)))
+    assert [f["id_comanda"] for f in filas] == ["1", "2"]
+    assert filas[0]["estado"] == "pagada"
+    assert filas[0]["fecha_emision"] == "2025-01-10T12:00:00"
+
+    filas = list(csv.DictReader(io.StringIO(client.get("/factura/export?detalles=true").text)))
+    assert [(f["id_comanda"], f["id_producto"]) for f in filas] == [("1", "1"), ("1", "2"), ("2", ""), ("3", "")]
+
+    response = client.get("/factura/export?format=ndjson&detalles=true")
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    facturas = [json.loads(linea) for linea in response.text.splitlines()]
+    assert [f["id_comanda"] for f in facturas] == [1, 2, 3]
+    assert [d["id_producto"] for d in facturas[0]["detalles"]] == [1, 2]
+    assert facturas[1]["detalles"] == []
+    assert facturas[2]["total"] == 300
+
+    assert client.get("/factura/export?format=xml").status_code == 422
+
+@patch('src.factura.httpClient.ComandaClient.marcar_comanda_anulada')
+@patch('src.factura.httpClient.ComandaClient.marcar_comanda_pendiente')
+@patch('src.factura.httpClient.ComandaClient.marcar_comanda_facturada')
+@patch('src.factura.validator.FacturaValidator.obtener_datos_comanda')
+def test_una_factura_activa_por_comanda(mock_obtener_datos, mock_marcar_facturada, mock_marcar_pendiente, mock_marcar_anulada, client):
+    """
+    Test para verificar que el índice único parcial impide dos facturas activas para la
+    misma comanda, pero permite refacturar una comanda con la factura anulada o cancelada.
+    """
+    mock_obtener_datos.return_value = {
+        "comanda": {"id": 1},
+        "detalles": [{"id": 1, "id_producto": 1, "cantidad": 1, "precio_unitario": 100}],
+    }
+    factura = {"id_comanda": 1, "medio_pago": "efectivo"}
+
+    id_1 = client.post("/factura/", json=factura).json()["id"]
+    response = client.post("/factura/", json=factura)
+    assert response.status_code == 400
+    assert "Ya existe una factura activa para la comanda 1" in response.json()["detail"]
+    assert mock_marcar_facturada.call_count == 1  # el duplicado no llegó a tocar la comanda
+
+    # Anulada: se puede volver a facturar
+    assert client.put(f"/factura/{id_1}/anular").status_code == 200
+    id_2 = client.post("/factura/", json=factura).json()["id"]
+
+    # Cancelada: también se puede volver a facturar
+    assert client.put(f"/factura/{id_2}/cancelar").status_code == 200
+    assert client.post("/factura/", json=factura).status_code == 201
+    assert client.post("/factura/", json=factura).status_code == 400
+
+    assert client.get("/factura/?id_comanda=1").json()["total"] == 3
+
+@patch('src.factura.httpClient.ComandaClient.marcar_comanda_pagada')
+@patch('src.factura.httpClient.ComandaClient.marcar_comanda_facturada')
+@patch('src.factura.validator.FacturaValidator.obtener_datos_comanda')
+def test_idempotency_key_en_creacion_y_pago(mock_obtener_datos, mock_marcar_facturada, mock_marcar_pagada, client):
+    """
+    Test para verificar que los reintentos con la misma Idempotency-Key devuelven la
+    respuesta guardada sin volver a llamar a comandas, y que una clave reutilizada con
+    otro request o de un request fallido se maneja correctamente.
+    """
+    mock_obtener_datos.return_value = {
+        "comanda": {"id": 1},
+        "detalles": [{"id": 1, "id_producto": 1, "cantidad": 1, "precio_unitario": 100}],
+    }
+    factura = {"id_comanda": 1, "medio_pago": "efectivo"}
+
+    primera = client.post("/factura/", json=factura, headers={"Idempotency-Key": "crear-1"})
+    reintento = client.post("/factura/", json=factura, headers={"Idempotency-Key": "crear-1"})
+    assert primera.status_code == reintento.status_code == 201
+    assert reintento.json() == primera.json()
+    assert reintento.headers["Idempotent-Replayed"] == "true"
+    assert mock_obtener_datos.call_count == 1
+    assert mock_marcar_facturada.call_count == 1
+
+    # Misma clave con otro cuerpo
+    response = client.post("/factura/", json={"id_comanda": 2, "medio_pago": "efectivo"}, headers={"Idempotency-Key": "crear-1"})
+    assert response.status_code == 422
+
+    id_factura = primera.json()["id"]
+    for _ in range(2):
+        response = client.put(f"/factura/{id_factura}/pagar", headers={"Idempotency-Key": "pagar-1"})
+        assert response.status_code == 200
+        assert response.json()["estado"] == "pagada"
+    assert mock_marcar_pagada.call_count == 1
+
+    # Un request que falla libera la clave: el reintento se procesa de nuevo
+    mock_obtener_datos.return_value = {"comanda": {"id": 3}, "detalles": []}
+    factura_3 = {"id_comanda": 3, "medio_pago": "efectivo"}
+    assert client.post("/factura/", json=factura_3, headers={"Idempotency-Key": "crear-3"}).status_code == 400
+    mock_obtener_datos.return_value = {
+        "comanda": {"id": 3},
+        "detalles": [{"id": 1, "id_producto": 1, "cantidad": 1, "precio_unitario": 100}],
+    }
+    assert client.post("/factura/", json=factura_3, headers={"Idempotency-Key": "crear-3"}).status_code == 201
+
+    # Sin header se comporta como siempre
+    assert client.put(f"/factura/{id_factura}/pagar").status_code == 400
+
+def test_idempotency_keys_vencidas_se_limpian(client):
+    """
+    Test para verificar que las claves más viejas que el TTL se borran.
+    """
+    from datetime import timedelta
+    from src.factura.idempotencia import limpiar_vencidas
+
+    db = TestingSessionLocal()
+    ahora = datetime.utcnow()
+    db.add(models.ClaveIdempotencia(clave="vieja", hash_request="x", completada=1, created_at=ahora - timedelta(days=3)))
+    db.add(models.ClaveIdempotencia(clave="nueva", hash_request="x", completada=1, created_at=ahora))
+    db.commit()
+    assert limpiar_vencidas(db) == 1
+    db.commit()
+    assert [c.clave for c in db.query(models.ClaveIdempotencia)] == ["nueva"]
+    db.close()
@@ -144,31 +144,25 @@ async def delete(id_: int, db: Session = Depends(get_db)):
             detail="No se puede eliminar la mesa porque tiene reservas activas"
         )
 
-    # Verificar si la mesa está en comandas pendientes
+    # Verificar si la mesa está en comandas pendientes o facturadas (una sola consulta)
     try:
         async with httpx.AsyncClient(timeout=5.0) as client:
-            response = await client.get(f"{COMANDAS_API_URL}/comanda/?id_mesa={id_}&estado=pendiente")
+            response = await client.get(
+                f"{COMANDAS_API_URL}/comanda/references",
+                params={"entidad": "mesa", "id": id_, "estados": "pendiente,facturada"},
+            )
             response.raise_for_status()
-            comandas_data = response.json()
+            referencias = response.json().get("estados", {})
     except Exception:
-        comandas_data = {"total": 0}
+        referencias = {}
 
-    if comandas_data.get("total", 0) > 0:
+    if referencias.get("pendiente"):
         raise HTTPException(
             status_code=409,
             detail="No se puede eliminar la mesa porque tiene comandas pendientes"
         )
 
-    # Verificar si la mesa está en comandas facturadas
-    try:
-        async with httpx.AsyncClient(timeout=5.0) as client:
-            response = await client.get(f"{COMANDAS_API_URL}/comanda/?id_mesa={id_}&estado=facturada")
-            response.raise_for_status()
-            comandas_data = response.json()
-    except Exception:
-        comandas_data = {"total": 0}
-
-    if comandas_data.get("total", 0) > 0:
+    if referencias.get("facturada"):
         raise HTTPException(
             status_code=409,
             detail="No se puede eliminar la mesa porque tiene comandas facturadas"
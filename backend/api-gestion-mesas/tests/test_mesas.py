@@ -351,18 +351,13 @@ def test_eliminar_mesa_con_comandas_pendientes(mock_client_class, client):
     mock_response_reservas.json.return_value = {"total": 0}
     mock_response_reservas.raise_for_status.return_value = None
 
-    # Mock para comandas pendientes (sin comandas)
-    mock_response_pendientes = Mock()
-    mock_response_pendientes.json.return_value = {"total": 0}
-    mock_response_pendientes.raise_for_status.return_value = None
-
-    # Mock para comandas facturadas (con comandas)
-    mock_response_facturadas = Mock()
-    mock_response_facturadas.json.return_value = {"total": 1}
-    mock_response_facturadas.raise_for_status.return_value = None
+    # Mock para referencias en comandas (sin pendientes, con facturadas)
+    mock_response_referencias = Mock()
+    mock_response_referencias.json.return_value = {"estados": {"pendiente": False, "facturada": True}}
+    mock_response_referencias.raise_for_status.return_value = None
 
     mock_client_instance = AsyncMock()
-    mock_client_instance.get = AsyncMock(side_effect=[mock_response_reservas, mock_response_pendientes, mock_response_facturadas])
+    mock_client_instance.get = AsyncMock(side_effect=[mock_response_reservas, mock_response_referencias])
     mock_client_instance.__aenter__ = AsyncMock(return_value=mock_client_instance)
     mock_client_instance.__aexit__ = AsyncMock(return_value=None)
 
@@ -5,6 +5,7 @@ from .schemas import TipoProducto
 class ProductosFilter(Filter):
     """Filtros para el modelo de Productos."""
     id: int | None = None
+    id__in: list[int] | None = None  # ?id__in=1,2,3
     tipo: TipoProducto | None = None
     nombre__ilike: str | None = None
     precio__gte: float | None = None
@@ -116,14 +116,17 @@ async def delete(id_: int, db: Session = Depends(get_db)):
     # Verificar si el producto está en comandas activas
     try:
         async with httpx.AsyncClient(timeout=5.0) as client:
-            response = await client.get(f"{COMANDAS_API_URL}/comanda/?id_producto={id_}&estado__in=pendiente,facturada")
+            response = await client.get(
+                f"{COMANDAS_API_URL}/comanda/references",
+                params={"entidad": "producto", "id": id_, "estados": "pendiente,facturada"},
+            )
             response.raise_for_status()
-            comandas_data = response.json()
+            referencias = response.json().get("estados", {})
     except Exception:
         # Si hay cualquier error (conexión, parsing, etc.), asumir que no hay comandas activas
-        comandas_data = {"total": 0}
+        referencias = {}
 
-    if comandas_data.get("total", 0) > 0:
+    if any(referencias.values()):
         raise HTTPException(
             status_code=409,
             detail="No se puede eliminar el producto porque está en comandas activas"
@@ -151,6 +151,20 @@ def test_filtrar_productos_por_carta(client):
     assert data["total"] == 1
     assert data["items"][0]["nombre"] == "Helado"
 
+def test_filtrar_productos_por_lista_de_ids(client):
+    """
+    Test para verificar el filtro id__in (resolución de nombres en lote).
+    """
+    client.post("/carta/", json={"nombre": "Carta A"})
+    for nombre in ("Pizza", "Cerveza", "Ensalada"):
+        client.post("/productos/", json={"nombre": nombre, "tipo": "plato", "precio": 5, "id_carta": 1})
+
+    response = client.get("/productos/?id__in=1,3")
+    assert response.status_code == 200
+    data = response.json()
+    assert data["total"] == 2
+    assert {p["nombre"] for p in data["items"]} == {"Pizza", "Ensalada"}
+
 def test_modificar_producto(client):
     """
     Test para verificar la modificación de un producto existente.
@@ -6,6 +6,7 @@ class ReservaFilter(Filter):
     # Filtros básicos por ID
     id: Optional[int] = None
     id__neq: Optional[int] = None
+    id__gt: Optional[int] = None  # ?id__gt=100 (sincronización incremental de reporte)
     id__gte: Optional[int] = None
     id__lte: Optional[int] = None
     
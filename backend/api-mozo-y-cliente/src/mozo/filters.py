@@ -4,6 +4,7 @@ from .models import Mozo
 class MozoFilter(Filter):
     # ejemplos típicos (extensible según tu modelo):
     id: int | None = None                    # ?id=1
+    id__in: list[int] | None = None         # ?id__in=1,2,3
     id__neq: int | None = None              # ?id__eq=1
     nombre__ilike: str | None = None       # ?nombre__ilike=juan
     apellido__ilike: str | None = None
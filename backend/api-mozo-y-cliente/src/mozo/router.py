@@ -84,10 +84,13 @@ async def delete(id_: int, db: Session = Depends(get_db)):
     # Verificar si el mozo tiene comandas pendientes o facturadas
     try:
         async with httpx.AsyncClient() as client:
-            response = await client.get(f"{COMANDAS_API_URL}/comanda/?id_mozo={id_}&estado__in=pendiente,facturada")
+            response = await client.get(
+                f"{COMANDAS_API_URL}/comanda/references",
+                params={"entidad": "mozo", "id": id_, "estados": "pendiente,facturada"},
+            )
             response.raise_for_status()
-            comandas_data = response.json()
-            if comandas_data.get("total", 0) > 0:
+            referencias = response.json().get("estados", {})
+            if any(referencias.values()):
                 raise HTTPException(
                     status_code=409,
                     detail="No se puede eliminar el mozo porque tiene comandas pendientes o facturadas"
@@ -185,6 +185,25 @@ def test_filtrar_mozos_por_nombre(client):
     assert data["total"] == 1
     assert data["items"][0]["nombre"] == "Juan"
 
+def test_filtrar_mozos_por_lista_de_ids(client):
+    """
+    Test para verificar el filtro id__in (resolución de nombres en lote).
+    """
+    for i, nombre in enumerate(("Juan", "María", "Carlos")):
+        client.post("/mozo/", json={
+            "nombre": nombre,
+            "apellido": "Pérez",
+            "dni": f"1234567{i}",
+            "direccion": "Calle 1",
+            "telefono": "111111111"
+        })
+
+    response = client.get("/mozo/?id__in=2,3")
+    assert response.status_code == 200
+    data = response.json()
+    assert data["total"] == 2
+    assert {m["nombre"] for m in data["items"]} == {"María", "Carlos"}
+
 def test_filtrar_mozos_por_baja(client):
     """
     Test para verificar el filtro de mozos por estado baja.
@@ -2,6 +2,22 @@ from pydantic_settings import BaseSettings, SettingsConfigDict
 
 class Settings(BaseSettings):
     database_url: str
+    # URLs de los otros servicios (configurables por entorno)
+    FACTURACION_API_URL: str = "http://gestion-facturacion:8000"
+    COMANDA_API_URL: str = "http://gestion-comanda:8000"
+    PRODUCTOS_API_URL: str = "http://gestion-productos:8000"
+    MOZO_API_URL: str = "http://mozo-y-cliente:8000"
+    RESERVAS_API_URL: str = "http://gestion-reservas:8000"
+    UPSTREAM_CONCURRENCIA: int = 4  # páginas pedidas en paralelo a cada servicio
+    REPORTE_SYNC_SEGUNDOS: int = 30  # intervalo de la sincronización incremental
+    REPORTE_RECONCILIACION_SEGUNDOS: int = 600  # intervalo de la reconciliación
+    REPORTE_RECONCILIACION_DIAS: int = 7  # ventana que se vuelve a copiar para tomar cambios de estado
+    REPORTE_CACHE_TTL_SEGUNDOS: int = 60  # vencimiento de reportes de períodos abiertos
+    REPORTE_CACHE_MAX_ENTRADAS: int = 1000  # al pasarse se descarta la menos usada
+    REPORTE_NOMBRES_TTL_SEGUNDOS: int = 300  # caché de nombres de productos y mozos
+    REPORTE_MOTOR: str = "columnar"  # "columnar" (NumPy) o "sql" (agregación en SQLite)
+    REPORTE_JOBS_WORKERS: int = 2  # trabajos de reportes ejecutándose a la vez
+    REPORTE_PROCESOS: int = 2  # procesos para los reportes del motor columnar (0: en un thread)
     model_config = SettingsConfigDict(env_file=".env")
 
 settings = Settings()
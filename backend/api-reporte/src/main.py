@@ -1,14 +1,46 @@
-from fastapi import FastAPI
-from .database import engine
+import asyncio
+import time
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, Request
+from .database import engine, SessionLocal
 from .reporte import models as reporte_models
+from .reporte.aproximados import registro_latencias
+from .reporte.procesos import pool_agregaciones
 from .reporte.router import router as reporte_router
+from .reporte.sincronizacion import ciclo_sincronizacion
+from .reporte.trabajos import cola_trabajos
 
 # Crea las tablas en la base de datos (si no existen)
 reporte_models.Base.metadata.create_all(bind=engine)
 
 from fastapi_pagination import add_pagination
 
-app = FastAPI(title="API reporte")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Mantiene las tablas de hechos al día mientras el servicio está levantado
+    tarea = asyncio.create_task(ciclo_sincronizacion(engine))
+    # Trabajos de reportes que quedaron pendientes antes de reiniciar
+    cola_trabajos.reanudar(SessionLocal)
+    yield
+    tarea.cancel()
+    await cola_trabajos.detener()
+    pool_agregaciones.cerrar()
+
+
+app = FastAPI(title="API reporte", lifespan=lifespan)
+
+
+@app.middleware("http")
+async def medir_latencia(request: Request, call_next):
+    # Duración por ruta (plantilla, no la URL) para GET /reporte/aproximado/latencias
+    inicio = time.perf_counter()
+    response = await call_next(request)
+    ruta = request.scope.get("route")
+    if ruta is not None:
+        registro_latencias.registrar(f"{request.method} {ruta.path}", (time.perf_counter() - inicio) * 1000)
+    return response
 
 @app.get("/health")
 def health():
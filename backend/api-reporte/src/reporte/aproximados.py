@@ -0,0 +1,245 @@
+"""
+Reportes aproximados sobre sketches diarios (ver `sketches`).
+
+Por cada día se guarda en `sketches_diarios` un sketch por métrica:
+
+- "clientes": HyperLogLog de los clientes con reservas (sin las dadas de baja).
+- "productos": Count-Min Sketch de las unidades vendidas por producto.
+- "latencias:<ruta>": t-digest de la duración de los requests, en ms.
+
+Los de clientes y productos se recalculan desde las tablas de hechos para los
+días que toca cada lote de la sincronización. Los de latencias se acumulan en
+memoria (`registro_latencias`) y se vuelcan a la base en cada ciclo de
+sincronización y antes de consultarlos. Al consultar se combinan los días del
+rango de a uno, así la memoria no depende del largo del rango.
+
+Reconstrucción de los sketches de clientes y productos (desde la carpeta del servicio):
+
+    python -m src.reporte.aproximados
+"""
+import json
+from datetime import date
+
+from sqlalchemy import delete, func, select
+from sqlalchemy.orm import Session
+
+from . import models, nombres
+from .consultas import ESTADOS_VENTA
+from .sketches import CountMinSketch, HyperLogLog, TDigest
+
+CLIENTES = "clientes"
+PRODUCTOS = "productos"
+PREFIJO_LATENCIAS = "latencias:"
+CUANTILES = (0.5, 0.9, 0.95, 0.99)
+MAX_TOP_PRODUCTOS = 32  # candidatos a más vendidos que guarda cada Count-Min Sketch
+
+
+def _tipo(metrica: str):
+    if metrica.startswith(PREFIJO_LATENCIAS):
+        return TDigest
+    return HyperLogLog if metrica == CLIENTES else CountMinSketch
+
+
+def _guardar(db: Session, dia: date, metrica: str, sketch) -> None:
+    db.merge(models.SketchDiario(fecha=dia, metrica=metrica, datos=json.dumps(sketch.a_dict())))
+
+
+# --- Sketches calculados desde las tablas de hechos ---
+
+def sketch_clientes(db: Session, dia: date) -> HyperLogLog | None:
+    reserva = models.ReservaHecho
+    ids = db.scalars(select(reserva.id_cliente).distinct().where(reserva.fecha == dia, reserva.baja.is_(False))).all()
+    if not ids:
+        return None
+    hll = HyperLogLog()
+    for id_cliente in ids:
+        hll.agregar(id_cliente)
+    return hll
+
+
+def sketch_productos(db: Session, dia: date) -> CountMinSketch | None:
+    comanda, detalle = models.ComandaHecho, models.DetalleComandaHecho
+    vendidos = db.execute(
+        select(detalle.id_producto, func.sum(detalle.cantidad))
+        .join(comanda, comanda.id == detalle.id_comanda)
+        .where(comanda.fecha == dia, comanda.estado.in_(ESTADOS_VENTA))
+        .group_by(detalle.id_producto)
+    ).all()
+    if not vendidos:
+        return None
+    cms = CountMinSketch(candidatos=MAX_TOP_PRODUCTOS)
+    for id_producto, cantidad in vendidos:
+        cms.agregar(id_producto, int(cantidad))
+    return cms
+
+
+# fuente sincronizada -> (modelo con `fecha`, métrica, cálculo del sketch de un día)
+POR_FUENTE = {
+    "reservas": (models.ReservaHecho, CLIENTES, sketch_clientes),
+    "comandas": (models.ComandaHecho, PRODUCTOS, sketch_productos),
+}
+
+
+def dias_de_lote(db: Session, fuente: str, lote: list[dict]) -> set[date]:
+    """Días que cambian al guardar el lote: los nuevos y los que tenían antes esas filas"""
+    if fuente not in POR_FUENTE:
+        return set()
+    modelo, _, _ = POR_FUENTE[fuente]
+    anteriores = db.scalars(select(modelo.fecha).distinct().where(modelo.id.in_([item["id"] for item in lote])))
+    return set(anteriores) | {date.fromisoformat(item["fecha"]) for item in lote}
+
+
+def recalcular(db: Session, fuente: str, dias) -> None:
+    """Vuelve a calcular el sketch de cada día desde las tablas de hechos, sin hacer commit"""
+    if fuente not in POR_FUENTE:
+        return
+    _, metrica, calcular = POR_FUENTE[fuente]
+    for dia in dias:
+        sketch = calcular(db, dia)
+        if sketch is None:
+            db.execute(
+                delete(models.SketchDiario)
+                .where(models.SketchDiario.fecha == dia, models.SketchDiario.metrica == metrica)
+            )
+        else:
+            _guardar(db, dia, metrica, sketch)
+
+
+def reconstruir(db: Session) -> int:
+    """Recalcula los sketches de clientes y productos de todos los días. Devuelve los días"""
+    total = 0
+    for fuente, (modelo, _, _) in POR_FUENTE.items():
+        dias = db.scalars(select(modelo.fecha).distinct()).all()
+        recalcular(db, fuente, dias)
+        db.commit()
+        total += len(dias)
+    return total
+
+
+# --- Latencias de los requests ---
+
+class RegistroLatencias:
+    """Un t-digest por día y ruta en memoria hasta que se vuelca a la base"""
+
+    def __init__(self):
+        self._digests: dict[tuple[date, str], TDigest] = {}
+
+    def invalidar(self) -> None:
+        self._digests.clear()
+
+    def registrar(self, ruta: str, ms: float) -> None:
+        clave = (date.today(), ruta)
+        digest = self._digests.get(clave)
+        if digest is None:
+            digest = self._digests[clave] = TDigest()
+        digest.agregar(ms)
+
+    def volcar(self, db: Session) -> int:
+        """Combina lo acumulado con lo guardado de cada día. Devuelve los sketches escritos"""
+        digests, self._digests = self._digests, {}
+        for (dia, ruta), digest in digests.items():
+            metrica = PREFIJO_LATENCIAS + ruta
+            guardado = db.get(models.SketchDiario, (dia, metrica))
+            if guardado is not None:
+                digest.merge(TDigest.desde_dict(json.loads(guardado.datos)))
+            _guardar(db, dia, metrica, digest)
+        db.commit()
+        return len(digests)
+
+
+registro_latencias = RegistroLatencias()
+
+
+# --- Consultas: combinación de los días del rango ---
+
+def combinar(db: Session, metrica: str, desde: date, hasta: date):
+    """Sketch de todo el rango (None si no hay días con datos)"""
+    tipo = _tipo(metrica)
+    stmt = (
+        select(models.SketchDiario.datos)
+        .where(
+            models.SketchDiario.metrica == metrica,
+            models.SketchDiario.fecha >= desde,
+            models.SketchDiario.fecha <= hasta,
+        )
+        .execution_options(yield_per=64)
+    )
+    total = None
+    for datos in db.scalars(stmt):
+        sketch = tipo.desde_dict(json.loads(datos))
+        if total is None:
+            total = sketch
+        else:
+            total.merge(sketch)
+    return total
+
+
+def clientes_distintos(db: Session, desde: date, hasta: date) -> dict:
+    hll = combinar(db, CLIENTES, desde, hasta) or HyperLogLog()
+    estimado = hll.estimar()
+    # ±2 desvíos estándar: ~95% de confianza
+    margen = 2 * hll.error_relativo * estimado
+    return {
+        "clientes_distintos": round(estimado),
+        "error_relativo": hll.error_relativo,
+        "minimo": max(0, round(estimado - margen)),
+        "maximo": round(estimado + margen),
+    }
+
+
+async def top_productos(db: Session, desde: date, hasta: date, limite: int) -> dict:
+    cms = combinar(db, PRODUCTOS, desde, hasta) or CountMinSketch(candidatos=MAX_TOP_PRODUCTOS)
+    top = cms.mas_frecuentes(limite)
+    detalles_map = await nombres.productos.resolver(id_prod for id_prod, _ in top)
+    # El Count-Min Sketch solo sobreestima: la cantidad real está entre estimada - error y estimada
+    error = cms.error_maximo
+    return {
+        "desde": desde,
+        "hasta": hasta,
+        "total_unidades": cms.total,
+        "error_maximo": error,
+        "confianza": 1 - cms.delta,
+        "productos": [
+            {
+                "id_producto": id_prod,
+                "nombre": detalles_map.get(id_prod, {}).get("nombre", "N/A"),
+                "tipo": detalles_map.get(id_prod, {}).get("tipo", "N/A"),
+                "cantidad_estimada": cantidad,
+                "cantidad_minima": max(0, int(cantidad - error)),
+            }
+            for id_prod, cantidad in top
+        ],
+    }
+
+
+def latencias(db: Session, desde: date, hasta: date, ruta: str | None = None) -> list[dict]:
+    registro_latencias.volcar(db)
+    metrica = models.SketchDiario.metrica
+    stmt = (
+        select(metrica).distinct()
+        .where(models.SketchDiario.fecha >= desde, models.SketchDiario.fecha <= hasta)
+        .order_by(metrica)
+    )
+    stmt = stmt.where(metrica == PREFIJO_LATENCIAS + ruta) if ruta else stmt.where(metrica.startswith(PREFIJO_LATENCIAS))
+
+    resultado = []
+    for nombre in db.scalars(stmt).all():
+        digest = combinar(db, nombre, desde, hasta)
+        cuantiles = []
+        for q in CUANTILES:
+            ms, error_rango = digest.cuantil(q)
+            cuantiles.append({"cuantil": q, "ms": ms, "error_rango": error_rango})
+        resultado.append({
+            "ruta": nombre.removeprefix(PREFIJO_LATENCIAS),
+            "cantidad": round(digest.cantidad),
+            "cuantiles": cuantiles,
+        })
+    return resultado
+
+
+if __name__ == "__main__":
+    from ..database import SessionLocal, engine
+
+    models.Base.metadata.create_all(bind=engine)
+    with SessionLocal() as db:
+        print(f"Días recalculados: {reconstruir(db)}")
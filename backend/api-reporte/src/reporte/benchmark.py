@@ -0,0 +1,339 @@
+"""
+Benchmarks de reporte (desde la carpeta del servicio).
+
+Motor columnar contra el recorrido fila por fila que hacían los reportes
+(listas de dicts, `datetime.fromisoformat`, `dict.get` y `Counter`), con el
+costo por millón de filas de cada agregación:
+
+    python -m src.reporte.benchmark --filas 1000000
+
+Memoria pico al leer una respuesta sintética de N MB completa
+(`response.json()`) contra el parseo incremental de `fetcher.parsear_items`:
+
+    python -m src.reporte.benchmark --json-mb 300
+
+Latencia del event loop mientras se atienden reportes concurrentes sobre una
+base SQLite de N filas (carga y agregación), en el loop, en un thread y en el
+pool de procesos (`procesos`):
+
+    python -m src.reporte.benchmark --loop 2000000
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import resource
+import sqlite3
+import tempfile
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime, timedelta
+
+import numpy as np
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+from ..config import settings
+from . import columnar, models, reportes
+from .fetcher import parsear_items
+from .procesos import PoolAgregaciones
+
+DESDE = date(2023, 1, 1)
+DIAS = 730
+
+
+def datos_sinteticos(filas: int, semilla: int = 0, con_dicts: bool = True):
+    """Mismas filas como arrays y (si `con_dicts`) como dicts al estilo de la respuesta JSON"""
+    rng = np.random.default_rng(semilla)
+    fechas = DESDE.toordinal() + rng.integers(0, DIAS, filas, dtype=np.int32)
+    comandas = columnar.Comandas(
+        id_mozo=rng.integers(1, 50, filas),
+        fecha=fechas,
+        venta=rng.random(filas) < 0.8,
+    )
+    detalles = columnar.Detalles(
+        id_producto=rng.integers(1, 500, filas),
+        cantidad=rng.integers(1, 5, filas),
+        venta=comandas.venta,
+    )
+    facturas = columnar.Facturas(fecha=fechas, total=rng.random(filas) * 10000, pagada=comandas.venta)
+    if not con_dicts:
+        return comandas, detalles, facturas, None
+
+    isoformat = {o: date.fromordinal(o).isoformat() for o in range(DESDE.toordinal(), DESDE.toordinal() + DIAS)}
+    dicts = [
+        {
+            "fecha": isoformat[int(f)], "id_mozo": int(m), "id_producto": int(p),
+            "cantidad": int(c), "total": float(t), "estado": "pagada" if v else "pendiente",
+        }
+        for f, m, p, c, t, v in zip(
+            fechas, comandas.id_mozo, detalles.id_producto, detalles.cantidad, facturas.total, comandas.venta
+        )
+    ]
+    return comandas, detalles, facturas, dicts
+
+
+# --- Recorrido fila por fila (como antes del motor columnar) ---
+
+def filas_ganancias(dicts, año):
+    ganancias = {i: 0.0 for i in range(1, 13)}
+    for fila in dicts:
+        if fila.get("estado") != "pagada":
+            continue
+        fecha = datetime.fromisoformat(fila["fecha"])
+        if fecha.year == año:
+            ganancias[fecha.month] += fila.get("total", 0.0)
+    return ganancias
+
+
+def filas_top_productos(dicts, limite):
+    contador = Counter()
+    for fila in dicts:
+        if fila.get("estado") == "pagada":
+            contador[fila["id_producto"]] += fila.get("cantidad", 0)
+    return contador.most_common(limite)
+
+
+def filas_dia_semana(dicts, desde, hasta):
+    contador = Counter()
+    for fila in dicts:
+        fecha = datetime.fromisoformat(fila["fecha"]).date()
+        if desde <= fecha <= hasta:
+            contador[fecha.weekday()] += 1
+    return contador
+
+
+def filas_por_mozo(dicts, desde, hasta):
+    contador = Counter()
+    for fila in dicts:
+        fecha = datetime.fromisoformat(fila["fecha"]).date()
+        if desde <= fecha <= hasta:
+            contador[fila["id_mozo"]] += 1
+    return contador.most_common()
+
+
+def medir(funcion, *args, repeticiones: int = 3) -> float:
+    mejor = float("inf")
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        funcion(*args)
+        mejor = min(mejor, time.perf_counter() - inicio)
+    return mejor
+
+
+def main(filas: int) -> None:
+    comandas, detalles, facturas, dicts = datos_sinteticos(filas)
+    hasta = DESDE + timedelta(days=DIAS)
+    casos = [
+        ("ganancias mensuales", (filas_ganancias, dicts, 2023), (columnar.ganancias_por_mes, facturas, 2023)),
+        ("top productos", (filas_top_productos, dicts, 5), (columnar.productos_mas_vendidos, detalles, 5)),
+        ("días concurridos", (filas_dia_semana, dicts, DESDE, hasta), (columnar.histograma_dia_semana, comandas, DESDE, hasta)),
+        ("comandas por mozo", (filas_por_mozo, dicts, DESDE, hasta), (columnar.conteo_por_mozo, comandas, DESDE, hasta)),
+    ]
+    escala = 1_000_000 / filas
+    print(f"{filas} filas; ms por millón de filas")
+    print(f"{'reporte':<22}{'filas (dicts)':>15}{'columnar':>12}{'speedup':>10}")
+    for nombre, (f_filas, *a_filas), (f_col, *a_col) in casos:
+        t_filas = medir(f_filas, *a_filas, repeticiones=1) * escala * 1000
+        t_col = medir(f_col, *a_col) * escala * 1000
+        print(f"{nombre:<22}{t_filas:>15.1f}{t_col:>12.1f}{t_filas / t_col:>9.0f}x")
+
+
+# --- Memoria: respuesta completa contra parseo incremental ---
+
+def respuesta_sintetica(mb: int, tamanio_chunk: int = 64 * 1024):
+    """Listado de facturas de ~mb MB generado en chunks, sin armar el cuerpo entero"""
+    plantilla = (
+        '{{"id": {id}, "id_comanda": {id}, "fecha_emision": "{fecha}T20:00:00", "total": {total:.2f}, '
+        '"monto_seña": 0.0, "medio_pago": "efectivo", "estado": "pagada"}}'
+    )
+    fechas = [(DESDE + timedelta(days=d)).isoformat() for d in range(DIAS)]
+    cantidad = mb * 1_000_000 // len(plantilla.format(id=1, fecha=fechas[0], total=1.0).encode())
+
+    buffer = bytearray(b'{"items": [')
+    for i in range(1, cantidad + 1):
+        if i > 1:
+            buffer += b", "
+        buffer += plantilla.format(id=i, fecha=fechas[i % DIAS], total=(i % 1000) * 1.5).encode()
+        if len(buffer) >= tamanio_chunk:
+            yield bytes(buffer)
+            buffer.clear()
+    buffer += f'], "total": {cantidad}, "page": 1, "size": {cantidad}, "pages": 1}}'.encode()
+    yield bytes(buffer)
+
+
+class AcumuladorGanancias:
+    """Ganancia por mes de 2023 acumulada lote a lote con el motor columnar"""
+
+    def __init__(self):
+        self.sumas = np.zeros(12)
+        self.filas = 0
+
+    def agregar(self, lote: list[dict]) -> None:
+        fechas = np.fromiter((date.fromisoformat(f["fecha_emision"][:10]).toordinal() for f in lote), np.int32, len(lote))
+        totales = np.fromiter((f["total"] for f in lote), np.float64, len(lote))
+        pagadas = np.fromiter((f["estado"] == "pagada" for f in lote), bool, len(lote))
+        ganancias = columnar.ganancias_por_mes(columnar.Facturas(fechas, totales, pagadas), DESDE.year)
+        self.sumas += np.array(list(ganancias.values()))
+        self.filas += len(lote)
+
+
+def leer_completa(mb: int) -> AcumuladorGanancias:
+    acumulador = AcumuladorGanancias()
+    cuerpo = b"".join(respuesta_sintetica(mb))
+    acumulador.agregar(json.loads(cuerpo)["items"])
+    return acumulador
+
+
+def leer_incremental(mb: int) -> AcumuladorGanancias:
+    async def chunks():
+        for chunk in respuesta_sintetica(mb):
+            yield chunk
+
+    async def leer():
+        acumulador = AcumuladorGanancias()
+        async for lote in parsear_items(chunks(), {}):
+            acumulador.agregar(lote)
+        return acumulador
+
+    return asyncio.run(leer())
+
+
+def _medir_en_proceso(modo: str, mb: int) -> tuple[float, float, int, list[float]]:
+    """Corre en un proceso nuevo: (segundos, MB de RSS pico por encima del inicial, filas, sumas)"""
+    base = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    inicio = time.perf_counter()
+    acumulador = (leer_incremental if modo == "incremental" else leer_completa)(mb)
+    segundos = time.perf_counter() - inicio
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - base  # KB en Linux
+    return segundos, pico / 1024, acumulador.filas, acumulador.sumas.tolist()
+
+
+def main_json(mb: int) -> None:
+    print(f"respuesta sintética de ~{mb} MB")
+    print(f"{'lectura':<14}{'filas':>12}{'segundos':>10}{'MB pico':>10}")
+    resultados = []
+    for modo in ("incremental", "completa"):
+        # Un proceso por modo para que el pico de memoria de uno no tape al otro
+        with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as pool:
+            segundos, pico, filas, sumas = pool.submit(_medir_en_proceso, modo, mb).result()
+        resultados.append(sumas)
+        print(f"{modo:<14}{filas:>12}{segundos:>10.1f}{pico:>10.1f}")
+    assert np.allclose(*resultados)
+
+
+# --- Latencia del event loop: reportes completos en el loop, en un thread y en el pool ---
+
+def base_sintetica(filas: int, ruta: str) -> None:
+    """SQLite en `ruta` con `filas` comandas y `filas` facturas en las tablas de hechos"""
+    comandas, _, facturas, _ = datos_sinteticos(filas, con_dicts=False)
+    engine = create_engine(f"sqlite:///{ruta}")
+    models.Base.metadata.create_all(engine, tables=[models.ComandaHecho.__table__, models.FacturaHecho.__table__])
+    engine.dispose()
+    isoformat = {o: date.fromordinal(o).isoformat() for o in range(DESDE.toordinal(), DESDE.toordinal() + DIAS)}
+    with sqlite3.connect(ruta) as conn:
+        conn.executemany(
+            "INSERT INTO hechos_comandas (id, id_mesa, id_mozo, fecha, estado, total) VALUES (?, 1, ?, ?, ?, 0)",
+            (
+                (i, int(m), isoformat[int(f)], "pagada" if v else "pendiente")
+                for i, (m, f, v) in enumerate(zip(comandas.id_mozo, comandas.fecha, comandas.venta), start=1)
+            ),
+        )
+        conn.executemany(
+            "INSERT INTO hechos_facturas (id, id_comanda, fecha_emision, total, monto_seña, medio_pago, estado) "
+            "VALUES (?, ?, ?, ?, 0, 'efectivo', ?)",
+            (
+                (i, i, f"{isoformat[int(f)]} 20:00:00.000000", float(t), "pagada" if p else "pendiente")
+                for i, (f, t, p) in enumerate(zip(facturas.fecha, facturas.total, facturas.pagada), start=1)
+            ),
+        )
+
+
+class _EnElLoop(PoolAgregaciones):
+    """Como antes de `procesos`: carga y agregación dentro del event loop"""
+
+    async def calcular(self, db, funcion, *args):
+        return funcion(db, *args)
+
+
+async def _latencia_loop(engine, pedidos: int, intervalo: float = 0.005):
+    """(segundos, retrasos de un tick de `intervalo` s en ms) mientras se atienden `pedidos` de cada reporte"""
+    loop = asyncio.get_running_loop()
+    retrasos = []
+    terminado = asyncio.Event()
+
+    async def tick():
+        while not terminado.is_set():
+            esperado = loop.time() + intervalo
+            await asyncio.sleep(intervalo)
+            retrasos.append((loop.time() - esperado) * 1000)
+
+    async def pedido(calcular, *args):
+        # Una sesión por request, como `get_db`
+        with Session(engine) as db:
+            return await calcular(db, *args)
+
+    # Requests de dias-concurridos (lee comandas) y de ganancias-mensuales (lee facturas)
+    trabajos = []
+    for _ in range(pedidos):
+        trabajos.append(pedido(reportes.dias_concurridos, DESDE, DESDE + timedelta(days=DIAS)))
+        trabajos.append(pedido(reportes.ganancias_mensuales, DESDE.year))
+
+    tarea = asyncio.create_task(tick())
+    await asyncio.sleep(intervalo * 4)
+    inicio = time.perf_counter()
+    pendientes = []
+    for trabajo in trabajos:
+        # Como requests que van llegando: cada uno se lanza sin esperar al anterior
+        pendientes.append(asyncio.ensure_future(trabajo))
+        await asyncio.sleep(0)
+    await asyncio.gather(*pendientes)
+    segundos = time.perf_counter() - inicio
+    terminado.set()
+    await tarea
+    return segundos, np.array(retrasos)
+
+
+def main_loop(filas: int, pedidos: int = 10) -> None:
+    with tempfile.TemporaryDirectory() as carpeta:
+        ruta = f"{carpeta}/reporte.db"
+        base_sintetica(filas, ruta)
+        engine = create_engine(f"sqlite:///{ruta}", connect_args={"check_same_thread": False})
+
+        print(f"{filas} comandas y {filas} facturas, {pedidos * 2} reportes concurrentes; retraso del loop en ms (tick de 5 ms)")
+        print(f"{'cálculo':<14}{'segundos':>10}{'p50':>8}{'p99':>8}{'máx':>8}")
+        settings.REPORTE_MOTOR = "columnar"
+        procesos = max(settings.REPORTE_PROCESOS, 1)
+        for modo, pool in (("en el loop", _EnElLoop()), ("en un thread", PoolAgregaciones()), ("pool", PoolAgregaciones())):
+            settings.REPORTE_PROCESOS = procesos if modo == "pool" else 0
+            reportes.pool_agregaciones = pool
+
+            async def medir():
+                if modo == "pool":
+                    # Arranque de los procesos (y su conexión) fuera de la medición
+                    with Session(engine) as db:
+                        await asyncio.gather(*(
+                            pool.calcular(db, columnar.comandas_por_mozo, DESDE, DESDE) for _ in range(procesos)
+                        ))
+                return await _latencia_loop(engine, pedidos)
+
+            segundos, retrasos = asyncio.run(medir())
+            pool.cerrar()
+            p50, p99 = np.percentile(retrasos, [50, 99])
+            print(f"{modo:<14}{segundos:>10.2f}{p50:>8.1f}{p99:>8.1f}{retrasos.max():>8.1f}")
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks de reporte")
+    parser.add_argument("--filas", type=int, default=1_000_000, help="filas del benchmark del motor columnar")
+    parser.add_argument("--json-mb", type=int, help="tamaño de la respuesta del benchmark de memoria")
+    parser.add_argument("--loop", type=int, help="filas del benchmark de latencia del event loop")
+    args = parser.parse_args()
+    if args.json_mb:
+        main_json(args.json_mb)
+    elif args.loop:
+        main_loop(args.loop)
+    else:
+        main(args.filas)
@@ -0,0 +1,139 @@
+"""
+Caché de resultados de reportes por endpoint y parámetros normalizados.
+
+- Períodos cerrados (terminaron antes de la ventana de reconciliación, así
+  que la sincronización ya no los modifica): sin vencimiento.
+- Períodos actuales: REPORTE_CACHE_TTL_SEGUNDOS.
+- Cada sincronización que copia filas borra los períodos abiertos; una
+  copia completa borra todo.
+- Una entrada vencida se sigue sirviendo mientras un único refresco en
+  segundo plano la recalcula (stale-while-revalidate).
+- Como máximo REPORTE_CACHE_MAX_ENTRADAS entradas (los rangos los elige el
+  cliente): al pasarse se descarta la usada hace más tiempo (LRU).
+"""
+import asyncio
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import date, timedelta
+from typing import Any, Awaitable, Callable
+
+from fastapi import BackgroundTasks
+from sqlalchemy.orm import Session
+
+from ..config import settings
+
+Calculo = Callable[[Session], Awaitable[Any]]
+
+
+@dataclass
+class Entrada:
+    valor: Any
+    creada: float
+    ttl: float | None  # None = no vence
+
+    def vigente(self, ahora: float) -> bool:
+        return self.ttl is None or ahora - self.creada < self.ttl
+
+
+def clave_cache(endpoint: str, **params) -> str:
+    """Clave estable: endpoint + parámetros ordenados por nombre"""
+    normalizados = "&".join(f"{nombre}={valor}" for nombre, valor in sorted(params.items()))
+    return f"{endpoint}?{normalizados}"
+
+
+def ttl_para_periodo(fin: date | None) -> float | None:
+    """Sin vencimiento si el período ya no puede cambiar; TTL corto si sigue abierto"""
+    cierre = date.today() - timedelta(days=settings.REPORTE_RECONCILIACION_DIAS)
+    if fin is not None and fin < cierre:
+        return None
+    return settings.REPORTE_CACHE_TTL_SEGUNDOS
+
+
+class CacheReportes:
+    def __init__(self):
+        self._entradas: OrderedDict[str, Entrada] = OrderedDict()
+        self._refrescando: set[str] = set()
+        self._calculando: dict[str, asyncio.Future] = {}
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+
+    async def obtener(
+        self,
+        clave: str,
+        calcular: Calculo,
+        ttl: float | None,
+        db: Session,
+        background_tasks: BackgroundTasks,
+    ) -> Any:
+        ahora = time.monotonic()
+        entrada = self._entradas.get(clave)
+        if entrada is not None:
+            self._entradas.move_to_end(clave)
+            if entrada.vigente(ahora):
+                self.hits += 1
+            else:
+                # Vencida: se sirve igual y se recalcula una sola vez en segundo plano
+                self.stale += 1
+                if clave not in self._refrescando:
+                    self._refrescando.add(clave)
+                    background_tasks.add_task(self._refrescar, clave, calcular, ttl, db.get_bind())
+            return entrada.valor
+
+        self.misses += 1
+        # Pedidos simultáneos de la misma clave comparten el cálculo
+        pendiente = self._calculando.get(clave)
+        if pendiente is not None:
+            return await asyncio.shield(pendiente)
+        pendiente = asyncio.get_running_loop().create_future()
+        self._calculando[clave] = pendiente
+        try:
+            valor = await calcular(db)
+            self._guardar(clave, Entrada(valor, time.monotonic(), ttl))
+            pendiente.set_result(valor)
+            return valor
+        except BaseException as e:
+            pendiente.set_exception(e)
+            pendiente.exception()  # evita el aviso de excepción no consumida
+            raise
+        finally:
+            self._calculando.pop(clave, None)
+
+    async def _refrescar(self, clave: str, calcular: Calculo, ttl: float | None, bind) -> None:
+        try:
+            # Sesión propia: la del request ya se cerró cuando corre la tarea
+            with Session(bind=bind) as db:
+                valor = await calcular(db)
+            self._guardar(clave, Entrada(valor, time.monotonic(), ttl))
+        except Exception:
+            # Se sigue sirviendo el valor anterior; el próximo pedido reintenta
+            pass
+        finally:
+            self._refrescando.discard(clave)
+
+    def _guardar(self, clave: str, entrada: Entrada) -> None:
+        self._entradas[clave] = entrada
+        self._entradas.move_to_end(clave)
+        while len(self._entradas) > settings.REPORTE_CACHE_MAX_ENTRADAS:
+            self._entradas.popitem(last=False)
+
+    def invalidar(self, endpoint: str | None = None) -> int:
+        """Borra todas las entradas, o solo las de un endpoint. Devuelve cuántas se borraron"""
+        claves = [c for c in self._entradas if endpoint is None or c.split("?", 1)[0] == endpoint]
+        for clave in claves:
+            del self._entradas[clave]
+        return len(claves)
+
+    def invalidar_abiertas(self) -> int:
+        """Borra las entradas de períodos abiertos (llegaron datos nuevos)"""
+        claves = [c for c, entrada in self._entradas.items() if entrada.ttl is not None]
+        for clave in claves:
+            del self._entradas[clave]
+        return len(claves)
+
+    def estadisticas(self) -> dict:
+        return {"entradas": len(self._entradas), "hits": self.hits, "misses": self.misses, "stale": self.stale}
+
+
+cache_reportes = CacheReportes()
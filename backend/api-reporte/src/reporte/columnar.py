@@ -0,0 +1,201 @@
+"""
+Motor columnar de los reportes (REPORTE_MOTOR=columnar).
+
+Las tablas de hechos se cargan como arrays de NumPy (fechas como ordinales de
+día, ids, cantidades y totales) y los reportes se agregan con bincount /
+unique en lugar de recorrer filas en Python. Las funciones `cargar_*` leen la
+base y las de agregación solo reciben arrays, así se pueden usar por separado
+(p. ej. para varios reportes sobre una misma carga). Las de la misma interfaz
+que `consultas` cargan y agregan en una llamada: `procesos.pool_agregaciones`
+las corre enteras en otro proceso.
+
+Benchmark por millón de filas:
+
+    python -m src.reporte.benchmark
+"""
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+
+import numpy as np
+from sqlalchemy import Integer, cast, func, select
+from sqlalchemy.orm import Session
+
+from . import models
+from .consultas import ESTADOS_VENTA
+
+# julianday('0001-01-01') - 1 : pasa fechas de SQLite a date.toordinal()
+JULIANDAY_ORDINAL = 1721424.5
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+DIAS_SEMANA = ("lunes", "martes", "miercoles", "jueves", "viernes", "sabado", "domingo")
+
+
+@dataclass
+class Comandas:
+    id_mozo: np.ndarray  # int64
+    fecha: np.ndarray  # int32, ordinal de día
+    venta: np.ndarray  # bool, estado pagada o facturada
+
+
+@dataclass
+class Detalles:
+    id_producto: np.ndarray  # int64
+    cantidad: np.ndarray  # int64
+    venta: np.ndarray  # bool, según el estado de su comanda
+
+
+@dataclass
+class Facturas:
+    fecha: np.ndarray  # int32, ordinal de día de fecha_emision
+    total: np.ndarray  # float64
+    pagada: np.ndarray  # bool
+
+
+def _ordinal(columna):
+    return cast(func.julianday(columna) - JULIANDAY_ORDINAL, Integer)
+
+
+def _cargar(db: Session, stmt, dtype: list[tuple[str, str]]) -> np.ndarray:
+    """Ejecuta la consulta y arma un array estructurado sin listas intermedias"""
+    return np.fromiter(map(tuple, db.execute(stmt)), dtype=np.dtype(dtype))
+
+
+def cargar_comandas(db: Session, desde: date | None = None, hasta: date | None = None) -> Comandas:
+    comanda = models.ComandaHecho
+    stmt = select(comanda.id_mozo, _ordinal(comanda.fecha), comanda.estado.in_(ESTADOS_VENTA))
+    if desde is not None:
+        stmt = stmt.where(comanda.fecha >= desde)
+    if hasta is not None:
+        stmt = stmt.where(comanda.fecha <= hasta)
+    filas = _cargar(db, stmt, [("id_mozo", "i8"), ("fecha", "i4"), ("venta", "?")])
+    return Comandas(filas["id_mozo"], filas["fecha"], filas["venta"])
+
+
+def cargar_detalles(db: Session, desde: date | None = None, hasta: date | None = None) -> Detalles:
+    """Detalles con el estado de su comanda; el rango filtra por la fecha de la comanda"""
+    comanda, detalle = models.ComandaHecho, models.DetalleComandaHecho
+    stmt = (
+        select(detalle.id_producto, detalle.cantidad, comanda.estado.in_(ESTADOS_VENTA))
+        .join(comanda, comanda.id == detalle.id_comanda)
+    )
+    if desde is not None:
+        stmt = stmt.where(comanda.fecha >= desde)
+    if hasta is not None:
+        stmt = stmt.where(comanda.fecha <= hasta)
+    filas = _cargar(db, stmt, [("id_producto", "i8"), ("cantidad", "i8"), ("venta", "?")])
+    return Detalles(filas["id_producto"], filas["cantidad"], filas["venta"])
+
+
+def cargar_facturas(db: Session, desde: date | None = None, hasta: date | None = None) -> Facturas:
+    factura = models.FacturaHecho
+    stmt = select(_ordinal(factura.fecha_emision), factura.total, factura.estado == "pagada")
+    if desde is not None:
+        stmt = stmt.where(factura.fecha_emision >= datetime.combine(desde, datetime.min.time()))
+    if hasta is not None:
+        stmt = stmt.where(factura.fecha_emision < datetime.combine(hasta + timedelta(days=1), datetime.min.time()))
+    filas = _cargar(db, stmt, [("fecha", "i4"), ("total", "f8"), ("pagada", "?")])
+    return Facturas(filas["fecha"], filas["total"], filas["pagada"])
+
+
+# --- Agregaciones sobre arrays ---
+
+def meses(fechas: np.ndarray) -> np.ndarray:
+    """Meses desde 1970-01 (año * 12 + mes - 1 relativo a 1970) para cada ordinal"""
+    if len(fechas) == 0:
+        return np.empty(0, dtype=np.int64)
+    # Se convierte una vez cada día distinto del rango y se indexa
+    primera = int(fechas.min())
+    dias = np.arange(primera, int(fechas.max()) + 1) - EPOCH_ORDINAL
+    tabla = dias.astype("datetime64[D]").astype("datetime64[M]").astype(np.int64)
+    return tabla[fechas - primera]
+
+
+def dias_semana(fechas: np.ndarray) -> np.ndarray:
+    """0 = lunes ... 6 = domingo, como date.weekday()"""
+    return (fechas.astype(np.int64) + 6) % 7
+
+
+def _en_rango(fechas: np.ndarray, desde: date, hasta: date) -> np.ndarray:
+    return (fechas >= desde.toordinal()) & (fechas <= hasta.toordinal())
+
+
+def _sumar_por_clave(claves: np.ndarray, pesos: np.ndarray | None = None) -> tuple[np.ndarray, np.ndarray]:
+    """Claves distintas y su suma (o conteo), ordenadas de mayor a menor y luego por clave"""
+    if len(claves) and 0 <= claves.min() and claves.max() <= 4 * len(claves):
+        # Ids chicos y densos: bincount directo, sin ordenar
+        conteos = np.bincount(claves)
+        unicas = np.flatnonzero(conteos)
+        sumas = (conteos if pesos is None else np.bincount(claves, weights=pesos))[unicas]
+    else:
+        unicas, inversa = np.unique(claves, return_inverse=True)
+        sumas = np.bincount(inversa, weights=pesos, minlength=len(unicas))
+    orden = np.lexsort((unicas, -sumas))
+    return unicas[orden], sumas[orden]
+
+
+def ganancias_por_mes(facturas: Facturas, año: int) -> dict[int, float]:
+    mascara = facturas.pagada & _en_rango(facturas.fecha, date(año, 1, 1), date(año, 12, 31))
+    mes = meses(facturas.fecha[mascara]) - (año - 1970) * 12
+    sumas = np.bincount(mes, weights=facturas.total[mascara], minlength=12)
+    return {i + 1: float(total) for i, total in enumerate(sumas)}
+
+
+def ganancias_por_mes_en_rango(facturas: Facturas, desde: date, hasta: date) -> list[tuple[int, int, float]]:
+    """(año, mes, ganancia) de cada mes entre desde y hasta, incluidos los meses sin ventas"""
+    primero = (desde.year - 1970) * 12 + desde.month - 1
+    cantidad = (hasta.year - 1970) * 12 + hasta.month - primero
+    mascara = facturas.pagada & _en_rango(facturas.fecha, desde, hasta)
+    sumas = np.bincount(meses(facturas.fecha[mascara]) - primero, weights=facturas.total[mascara], minlength=cantidad)
+    return [(1970 + (primero + i) // 12, (primero + i) % 12 + 1, float(total)) for i, total in enumerate(sumas)]
+
+
+def productos_mas_vendidos(detalles: Detalles, limite: int = 5) -> list[tuple[int, int]]:
+    mascara = detalles.venta
+    ids, cantidades = _sumar_por_clave(detalles.id_producto[mascara], detalles.cantidad[mascara])
+    return [(int(i), int(c)) for i, c in zip(ids[:limite], cantidades[:limite])]
+
+
+def histograma_dia_semana(comandas: Comandas, desde: date, hasta: date) -> dict[str, int]:
+    fechas = comandas.fecha[_en_rango(comandas.fecha, desde, hasta)]
+    conteo = np.bincount(dias_semana(fechas), minlength=7)
+    return {nombre: int(cantidad) for nombre, cantidad in zip(DIAS_SEMANA, conteo)}
+
+
+def conteo_por_mozo(comandas: Comandas, desde: date, hasta: date) -> list[tuple[int, int]]:
+    ids, cantidades = _sumar_por_clave(comandas.id_mozo[_en_rango(comandas.fecha, desde, hasta)])
+    return [(int(i), int(c)) for i, c in zip(ids, cantidades)]
+
+
+def agregar_dashboard(comandas: Comandas, detalles: Detalles, facturas: Facturas, desde: date, hasta: date) -> dict:
+    """Las cuatro agregaciones del dashboard sobre una sola carga de cada tabla"""
+    return {
+        "ganancias_mensuales": ganancias_por_mes_en_rango(facturas, desde, hasta),
+        "top_productos": productos_mas_vendidos(detalles, 5),
+        "dias_concurridos": histograma_dia_semana(comandas, desde, hasta),
+        "ranking_mozos": conteo_por_mozo(comandas, desde, hasta),
+    }
+
+
+# --- Misma interfaz que `consultas` ---
+
+def ganancias_mensuales(db: Session, año: int) -> dict[int, float]:
+    return ganancias_por_mes(cargar_facturas(db, date(año, 1, 1), date(año, 12, 31)), año)
+
+
+def top_productos(db: Session, limite: int = 5) -> list[tuple[int, int]]:
+    return productos_mas_vendidos(cargar_detalles(db), limite)
+
+
+def comandas_por_dia_semana(db: Session, desde: date, hasta: date) -> dict[str, int]:
+    return histograma_dia_semana(cargar_comandas(db, desde, hasta), desde, hasta)
+
+
+def comandas_por_mozo(db: Session, desde: date, hasta: date) -> list[tuple[int, int]]:
+    return conteo_por_mozo(cargar_comandas(db, desde, hasta), desde, hasta)
+
+
+def dashboard(db: Session, desde: date, hasta: date) -> dict:
+    return agregar_dashboard(
+        cargar_comandas(db, desde, hasta), cargar_detalles(db, desde, hasta), cargar_facturas(db, desde, hasta),
+        desde, hasta,
+    )
@@ -0,0 +1,121 @@
+"""
+Consultas de los reportes sobre las tablas de hechos locales.
+
+Las comandas que cuentan como venta son las `pagada` o `facturada`; las
+facturas que cuentan como ingreso son las `pagada`.
+"""
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import Integer, cast, func, select
+from sqlalchemy.orm import Session
+
+from . import models
+
+ESTADOS_VENTA = ("pagada", "facturada")
+
+# strftime('%w') de SQLite: 0 = domingo
+DIAS_SEMANA_SQLITE = {
+    "0": "domingo", "1": "lunes", "2": "martes", "3": "miercoles",
+    "4": "jueves", "5": "viernes", "6": "sabado",
+}
+
+
+def ganancias_mensuales(db: Session, año: int) -> dict[int, float]:
+    factura = models.FacturaHecho
+    mes = cast(func.strftime("%m", factura.fecha_emision), Integer).label("mes")
+    filas = db.execute(
+        select(mes, func.sum(factura.total))
+        .where(
+            factura.estado == "pagada",
+            factura.fecha_emision >= datetime(año, 1, 1),
+            factura.fecha_emision < datetime(año + 1, 1, 1),
+        )
+        .group_by(mes)
+    ).all()
+    ganancias = {i: 0.0 for i in range(1, 13)}
+    ganancias.update({mes: total for mes, total in filas})
+    return ganancias
+
+
+def ganancias_por_mes_en_rango(db: Session, desde: date, hasta: date) -> list[tuple[int, int, float]]:
+    """(año, mes, ganancia) de cada mes entre desde y hasta, incluidos los meses sin ventas"""
+    factura = models.FacturaHecho
+    mes = func.strftime("%Y-%m", factura.fecha_emision).label("mes")
+    filas = db.execute(
+        select(mes, func.sum(factura.total))
+        .where(
+            factura.estado == "pagada",
+            factura.fecha_emision >= datetime.combine(desde, datetime.min.time()),
+            factura.fecha_emision < datetime.combine(hasta + timedelta(days=1), datetime.min.time()),
+        )
+        .group_by(mes)
+    ).all()
+    totales = dict(filas)
+    meses = []
+    año, numero = desde.year, desde.month
+    while (año, numero) <= (hasta.year, hasta.month):
+        meses.append((año, numero, totales.get(f"{año:04d}-{numero:02d}", 0.0)))
+        año, numero = (año + 1, 1) if numero == 12 else (año, numero + 1)
+    return meses
+
+
+def top_productos(
+    db: Session, limite: int = 5, desde: date | None = None, hasta: date | None = None
+) -> list[tuple[int, int]]:
+    """(id_producto, cantidad) de los productos más vendidos; el rango filtra por la fecha de la comanda"""
+    comanda, detalle = models.ComandaHecho, models.DetalleComandaHecho
+    cantidad = func.sum(detalle.cantidad).label("cantidad")
+    stmt = (
+        select(detalle.id_producto, cantidad)
+        .join(comanda, comanda.id == detalle.id_comanda)
+        .where(comanda.estado.in_(ESTADOS_VENTA))
+    )
+    if desde is not None:
+        stmt = stmt.where(comanda.fecha >= desde)
+    if hasta is not None:
+        stmt = stmt.where(comanda.fecha <= hasta)
+    return [
+        tuple(fila)
+        for fila in db.execute(
+            stmt.group_by(detalle.id_producto).order_by(cantidad.desc(), detalle.id_producto).limit(limite)
+        )
+    ]
+
+
+def comandas_por_dia_semana(db: Session, desde: date, hasta: date) -> dict[str, int]:
+    comanda = models.ComandaHecho
+    dia = func.strftime("%w", comanda.fecha).label("dia")
+    filas = db.execute(
+        select(dia, func.count(comanda.id))
+        .where(comanda.fecha >= desde, comanda.fecha <= hasta)
+        .group_by(dia)
+    ).all()
+    conteo = {nombre: 0 for nombre in ("lunes", "martes", "miercoles", "jueves", "viernes", "sabado", "domingo")}
+    for dia, cantidad in filas:
+        conteo[DIAS_SEMANA_SQLITE[dia]] = cantidad
+    return conteo
+
+
+def comandas_por_mozo(db: Session, desde: date, hasta: date) -> list[tuple[int, int]]:
+    """(id_mozo, cantidad de comandas) ordenado de mayor a menor"""
+    comanda = models.ComandaHecho
+    cantidad = func.count(comanda.id).label("cantidad")
+    return [
+        tuple(fila)
+        for fila in db.execute(
+            select(comanda.id_mozo, cantidad)
+            .where(comanda.fecha >= desde, comanda.fecha <= hasta)
+            .group_by(comanda.id_mozo)
+            .order_by(cantidad.desc(), comanda.id_mozo)
+        )
+    ]
+
+
+def dashboard(db: Session, desde: date, hasta: date) -> dict:
+    """Las cuatro agregaciones del dashboard, cada una en su consulta"""
+    return {
+        "ganancias_mensuales": ganancias_por_mes_en_rango(db, desde, hasta),
+        "top_productos": top_productos(db, 5, desde, hasta),
+        "dias_concurridos": comandas_por_dia_semana(db, desde, hasta),
+        "ranking_mozos": comandas_por_mozo(db, desde, hasta),
+    }
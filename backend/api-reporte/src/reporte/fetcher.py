@@ -0,0 +1,139 @@
+"""
+Lectura completa de listados paginados de otros servicios (fastapi-pagination).
+
+La primera página informa `total` y `pages`; el resto se pide en paralelo,
+con un semáforo que limita la concurrencia y el tamaño de página máximo. Las
+respuestas se parsean de forma incremental (ijson) a medida que llegan los
+bytes, así nunca se retiene un cuerpo completo: los items se entregan como un
+stream asíncrono de lotes de a lo sumo TAMANIO_LOTE.
+"""
+import asyncio
+from typing import AsyncIterator
+from urllib.parse import urlencode
+
+import httpx
+import ijson
+from fastapi import HTTPException
+
+from ..config import settings
+
+# Máximo `size` que acepta fastapi-pagination en los otros servicios
+TAMANIO_PAGINA = 100
+# Items por lote entregado mientras se parsea una respuesta
+TAMANIO_LOTE = 100
+
+_FIN = object()
+
+
+async def parsear_items(
+    chunks: AsyncIterator[bytes],
+    metadatos: dict,
+    tamanio_lote: int = TAMANIO_LOTE,
+) -> AsyncIterator[list[dict]]:
+    """
+    Parsea incrementalmente un listado `{"items": [...], "total": ..., "pages": ...}`.
+    Entrega los items en lotes a medida que se completan y deja los demás campos
+    de primer nivel en `metadatos`. Solo se retienen el lote actual y el item
+    en construcción, no el cuerpo completo ni la lista de items.
+    """
+    eventos = ijson.sendable_list()
+    parser = ijson.parse_coro(eventos, use_float=True)
+    items: list = []
+    constructor = None
+
+    def procesar() -> None:
+        nonlocal constructor
+        for prefijo, evento, valor in eventos:
+            if constructor is not None:
+                constructor.event(evento, valor)
+                if prefijo == "items.item" and evento in ("end_map", "end_array"):
+                    items.append(constructor.value)
+                    constructor = None
+            elif prefijo == "items.item":
+                if evento in ("start_map", "start_array"):
+                    constructor = ijson.ObjectBuilder()
+                    constructor.event(evento, valor)
+                else:
+                    items.append(valor)
+            elif prefijo and "." not in prefijo and evento in ("number", "string", "boolean", "null"):
+                metadatos[prefijo] = valor
+        del eventos[:]
+
+    async for chunk in chunks:
+        parser.send(chunk)
+        procesar()
+        while len(items) >= tamanio_lote:
+            yield items[:tamanio_lote]
+            del items[:tamanio_lote]
+    parser.close()
+    procesar()
+    if items:
+        yield items
+
+
+async def _leer_pagina(
+    client: httpx.AsyncClient, url: str, params: dict, pagina: int, metadatos: dict
+) -> AsyncIterator[list[dict]]:
+    query = urlencode({**params, "page": pagina, "size": TAMANIO_PAGINA}, doseq=True)
+    async with client.stream("GET", f"{url}?{query}") as response:
+        response.raise_for_status()
+        async for lote in parsear_items(response.aiter_bytes(), metadatos):
+            yield lote
+
+
+async def iterar_paginas(
+    url: str,
+    servicio: str,
+    params: dict | None = None,
+    concurrencia: int | None = None,
+) -> AsyncIterator[list[dict]]:
+    """
+    Devuelve los `items` de todas las páginas del listado en lotes. La primera
+    página sale primero; las demás a medida que se parsean, con una cola acotada
+    entre los pedidos y el consumidor.
+    """
+    params = params or {}
+    concurrencia = concurrencia or settings.UPSTREAM_CONCURRENCIA
+    try:
+        async with httpx.AsyncClient() as client:
+            metadatos = {}
+            async for lote in _leer_pagina(client, url, params, 1, metadatos):
+                yield lote
+
+            paginas = metadatos.get("pages") or 1
+            if paginas <= 1:
+                return
+
+            semaforo = asyncio.Semaphore(concurrencia)
+            cola: asyncio.Queue = asyncio.Queue(maxsize=concurrencia)
+
+            async def pedir(pagina: int) -> None:
+                try:
+                    async with semaforo:
+                        async for lote in _leer_pagina(client, url, params, pagina, {}):
+                            await cola.put(lote)
+                    await cola.put(_FIN)
+                except Exception as e:
+                    await cola.put(e)
+
+            tareas = [asyncio.create_task(pedir(pagina)) for pagina in range(2, paginas + 1)]
+            try:
+                terminadas = 0
+                while terminadas < len(tareas):
+                    lote = await cola.get()
+                    if lote is _FIN:
+                        terminadas += 1
+                    elif isinstance(lote, Exception):
+                        raise lote
+                    else:
+                        yield lote
+            finally:
+                # Si el consumidor corta antes (o falla una página) no dejar pedidos colgados
+                for tarea in tareas:
+                    tarea.cancel()
+    except HTTPException:
+        raise
+    except httpx.RequestError as e:
+        raise HTTPException(status_code=503, detail=f"Error al contactar la API de {servicio}: {e}")
+    except Exception:
+        raise HTTPException(status_code=500, detail=f"Error inesperado al procesar respuesta de la API de {servicio}")
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, func
+from sqlalchemy import Boolean, Column, Integer, Float, String, Text, Date, DateTime, Index, func, text
 from ..database import Base
 
 class Reporte(Base):
@@ -7,3 +7,93 @@ class Reporte(Base):
     id = Column(Integer, primary_key=True, index=True)
     nombre = Column(String, index=True)
     created_at = Column(DateTime, server_default=func.now(), index=True)
+
+# --- Tablas de hechos: copia local de los datos de comandas y facturación ---
+
+class ComandaHecho(Base):
+    __tablename__ = "hechos_comandas"
+
+    id = Column(Integer, primary_key=True, autoincrement=False)  # mismo id que en gestion-comanda
+    id_mesa = Column(Integer, nullable=False)
+    id_mozo = Column(Integer, nullable=False)
+    fecha = Column(Date, nullable=False)
+    estado = Column(String, nullable=False)
+    total = Column(Float, default=0.0, nullable=False)
+
+    __table_args__ = (
+        Index("ix_hechos_comandas_fecha_estado", "fecha", "estado"),
+    )
+
+class DetalleComandaHecho(Base):
+    __tablename__ = "hechos_detalles_comanda"
+
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    id_comanda = Column(Integer, index=True, nullable=False)
+    id_producto = Column(Integer, index=True, nullable=False)
+    cantidad = Column(Integer, nullable=False)
+    precio_unitario = Column(Float, nullable=False)
+
+class FacturaHecho(Base):
+    __tablename__ = "hechos_facturas"
+
+    id = Column(Integer, primary_key=True, autoincrement=False)  # mismo id que en gestion-facturacion
+    id_comanda = Column(Integer, nullable=False)
+    fecha_emision = Column(DateTime, nullable=False)
+    total = Column(Float, nullable=False)
+    monto_seña = Column(Float, default=0.0, nullable=False)
+    medio_pago = Column(String, nullable=False)
+    estado = Column(String, nullable=False)
+
+    __table_args__ = (
+        Index("ix_hechos_facturas_estado_fecha_emision", "estado", "fecha_emision"),
+    )
+
+class ReservaHecho(Base):
+    __tablename__ = "hechos_reservas"
+
+    id = Column(Integer, primary_key=True, autoincrement=False)  # mismo id que en gestion-reservas
+    id_cliente = Column(Integer, nullable=False)
+    fecha = Column(Date, index=True, nullable=False)
+    baja = Column(Boolean, default=False, nullable=False)
+
+class EstadoSincronizacion(Base):
+    """Marca de agua (último id copiado) y fechas de sincronización por fuente"""
+    __tablename__ = "sincronizaciones"
+
+    fuente = Column(String, primary_key=True)  # "comandas" | "facturas" | "reservas"
+    ultimo_id = Column(Integer, default=0, nullable=False)
+    sincronizado_en = Column(DateTime, nullable=True)
+    reconciliado_en = Column(DateTime, nullable=True)
+
+class TrabajoReporte(Base):
+    """Reporte pedido con POST /reporte/jobs; lo ejecuta la cola de trabajos en segundo plano"""
+    __tablename__ = "trabajos_reporte"
+
+    id = Column(Integer, primary_key=True, index=True)
+    reporte = Column(String, nullable=False)
+    parametros = Column(Text, nullable=False)  # JSON normalizado
+    clave = Column(String, nullable=False)  # reporte + parámetros, para deduplicar
+    estado = Column(String, default="pendiente", nullable=False)  # pendiente | en_curso | completado | error
+    resultado = Column(Text, nullable=True)  # JSON
+    error = Column(String, nullable=True)
+    creado_en = Column(DateTime, nullable=False)
+    iniciado_en = Column(DateTime, nullable=True)
+    terminado_en = Column(DateTime, nullable=True)
+
+    __table_args__ = (
+        # Un único trabajo activo por reporte y parámetros
+        Index(
+            "ux_trabajos_reporte_clave_activa", "clave",
+            unique=True,
+            sqlite_where=text("estado IN ('pendiente', 'en_curso')"),
+            postgresql_where=text("estado IN ('pendiente', 'en_curso')"),
+        ),
+    )
+
+class SketchDiario(Base):
+    """Sketch de un día para los reportes aproximados (ver `aproximados`)"""
+    __tablename__ = "sketches_diarios"
+
+    fecha = Column(Date, primary_key=True)
+    metrica = Column(String, primary_key=True)  # "clientes" | "productos" | "latencias:<ruta>"
+    datos = Column(Text, nullable=False)  # JSON de `a_dict()`
@@ -0,0 +1,87 @@
+"""
+Resolución de nombres de productos y mozos para los reportes.
+
+Junta los ids que necesita un reporte y los pide en un solo request por
+servicio (`?id__in=1,2,3`), guardando cada resultado REPORTE_NOMBRES_TTL_SEGUNDOS.
+El listado excluye las bajas lógicas, así que los ids que no vuelven se
+consultan de a uno por `GET /{id}` (caso raro: productos o mozos dados de baja).
+"""
+import time
+from typing import Callable
+
+import httpx
+
+from ..config import settings
+
+TAMAÑO_LOTE = 100  # máximo de fastapi-pagination
+
+
+class ResolutorNombres:
+    def __init__(self, url: str, no_encontrado: Callable[[int], dict], error: Callable[[int], dict]):
+        self.url = url
+        self.no_encontrado = no_encontrado
+        self.error = error
+        self._cache: dict[int, tuple[dict, float]] = {}
+
+    def invalidar(self) -> None:
+        self._cache.clear()
+
+    async def resolver(self, ids) -> dict[int, dict]:
+        """Detalles de cada id pedido; nunca falla (usa los valores por defecto)"""
+        ahora = time.monotonic()
+        resultado = {}
+        faltantes = []
+        for id_ in dict.fromkeys(ids):
+            cacheado = self._cache.get(id_)
+            if cacheado is not None and cacheado[1] > ahora:
+                resultado[id_] = cacheado[0]
+            else:
+                faltantes.append(id_)
+        if not faltantes:
+            return resultado
+
+        vence = ahora + settings.REPORTE_NOMBRES_TTL_SEGUNDOS
+        try:
+            async with httpx.AsyncClient() as client:
+                encontrados = {}
+                for i in range(0, len(faltantes), TAMAÑO_LOTE):
+                    encontrados.update(await self._buscar_lote(client, faltantes[i:i + TAMAÑO_LOTE]))
+                for id_ in faltantes:
+                    if id_ not in encontrados:
+                        encontrados[id_] = await self._buscar_uno(client, id_)
+        except httpx.HTTPError:
+            # Servicio caído: valores por defecto sin cachear, se reintenta en el próximo reporte
+            for id_ in faltantes:
+                resultado[id_] = self.error(id_)
+            return resultado
+
+        for id_ in faltantes:
+            self._cache[id_] = (encontrados[id_], vence)
+            resultado[id_] = encontrados[id_]
+        return resultado
+
+    async def _buscar_lote(self, client: httpx.AsyncClient, ids: list[int]) -> dict[int, dict]:
+        ids_param = ",".join(str(id_) for id_ in ids)
+        response = await client.get(f"{self.url}/?id__in={ids_param}&size={TAMAÑO_LOTE}")
+        response.raise_for_status()
+        return {item["id"]: item for item in response.json().get("items", [])}
+
+    async def _buscar_uno(self, client: httpx.AsyncClient, id_: int) -> dict:
+        response = await client.get(f"{self.url}/{id_}")
+        if response.status_code == 404:
+            return self.no_encontrado(id_)
+        response.raise_for_status()
+        return response.json()
+
+
+productos = ResolutorNombres(
+    f"{settings.PRODUCTOS_API_URL}/productos",
+    no_encontrado=lambda id_: {"nombre": f"Producto ID {id_} no encontrado", "tipo": "desconocido"},
+    error=lambda id_: {"nombre": f"Error al buscar producto ID {id_}", "tipo": "desconocido"},
+)
+
+mozos = ResolutorNombres(
+    f"{settings.MOZO_API_URL}/mozo",
+    no_encontrado=lambda id_: {"nombre": f"Mozo ID {id_}", "apellido": "no encontrado"},
+    error=lambda id_: {"nombre": f"Error al buscar mozo ID {id_}", "apellido": ""},
+)
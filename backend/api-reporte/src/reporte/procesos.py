@@ -0,0 +1,82 @@
+"""
+Pool de procesos para los reportes del motor columnar.
+
+Cargar las columnas de SQLite (la consulta y el armado de los arrays) cuesta
+mucho más que agregarlas con NumPy, y las dos cosas usan CPU con el GIL
+tomado: en el event loop, un `top-productos` o `mozo-del-mes` grande frena a
+todos los requests concurrentes del worker. Con REPORTE_PROCESOS > 0 el
+reporte completo corre en un ProcessPoolExecutor: al proceso viajan la URL de
+la base y los parámetros, el proceso abre su propia conexión, carga, agrega y
+devuelve solo el resultado. Sin pool, o si la base no se puede abrir desde
+otro proceso (SQLite en memoria), corre en un thread.
+
+Latencia del event loop con reportes concurrentes en el loop, en un thread y
+en el pool:
+
+    python -m src.reporte.benchmark --loop 2000000
+"""
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from sqlalchemy import create_engine
+from sqlalchemy.engine import URL, Engine
+from sqlalchemy.orm import Session
+
+from ..config import settings
+
+# Engines de cada proceso del pool, por URL
+_engines: dict[str, Engine] = {}
+
+
+def _ejecutar(url: str, funcion, *args):
+    """En el proceso del pool: `funcion(db, *args)` con una sesión propia"""
+    engine = _engines.get(url)
+    if engine is None:
+        engine = _engines[url] = create_engine(url)
+    with Session(engine) as db:
+        return funcion(db, *args)
+
+
+def _accesible_desde_otro_proceso(url: URL) -> bool:
+    """Una base SQLite en memoria solo existe en la conexión de este proceso"""
+    if url.get_backend_name() != "sqlite":
+        return True
+    return url.database not in (None, "", ":memory:") and url.query.get("mode") != "memory"
+
+
+class PoolAgregaciones:
+    def __init__(self):
+        self._pool: ProcessPoolExecutor | None = None
+
+    def _obtener(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            # spawn: el hijo no hereda el event loop, los threads ni las conexiones del proceso padre
+            self._pool = ProcessPoolExecutor(
+                max_workers=settings.REPORTE_PROCESOS,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return self._pool
+
+    async def calcular(self, db: Session, funcion, *args):
+        """`funcion(db, *args)` fuera del event loop: en el pool con su propia conexión, o en un thread"""
+        url = db.get_bind().url
+        if settings.REPORTE_PROCESOS > 0 and _accesible_desde_otro_proceso(url):
+            try:
+                return await asyncio.get_running_loop().run_in_executor(
+                    self._obtener(), _ejecutar, url.render_as_string(hide_password=False), funcion, *args
+                )
+            except BrokenProcessPool:
+                # Un proceso murió (p. ej. por memoria): se arma otro pool la próxima vez
+                self.cerrar()
+        # La sesión del request no se usa mientras se espera al thread
+        return await asyncio.to_thread(funcion, db, *args)
+
+    def cerrar(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+
+pool_agregaciones = PoolAgregaciones()
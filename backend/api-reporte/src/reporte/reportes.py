@@ -0,0 +1,153 @@
+"""
+Cálculo de cada reporte a partir de las tablas de hechos locales.
+
+Las funciones reciben la sesión y los parámetros ya normalizados, y devuelven
+datos serializables (lo que se cachea y lo que devuelve el endpoint). Los
+nombres de mozos y productos se resuelven en lote con `nombres`. La lectura y
+la agregación nunca corren en el event loop: con el motor columnar van al pool
+de procesos (`procesos`) y con el de SQL a un thread.
+"""
+import asyncio
+from datetime import date, timedelta
+
+from fastapi import HTTPException
+from sqlalchemy.orm import Session
+
+from ..config import settings
+from . import columnar, consultas, nombres, schemas
+from .procesos import pool_agregaciones
+
+
+def motor():
+    """Consultas SQL o motor columnar, según REPORTE_MOTOR"""
+    return columnar if settings.REPORTE_MOTOR == "columnar" else consultas
+
+
+async def _calcular(db: Session, consulta: str, *args):
+    """`consulta` del motor activo (`consultas` y `columnar` usan los mismos nombres), fuera del loop"""
+    if motor() is columnar:
+        return await pool_agregaciones.calcular(db, getattr(columnar, consulta), *args)
+    return await asyncio.to_thread(getattr(consultas, consulta), db, *args)
+
+
+def rango_del_mes(año: int, mes: int) -> tuple[date, date]:
+    """Primer y último día del mes"""
+    fecha_inicio = date(año, mes, 1)
+    # Para obtener el último día, vamos al primer día del mes siguiente y restamos un día
+    siguiente_mes = mes + 1 if mes < 12 else 1
+    siguiente_año = año if mes < 12 else año + 1
+    return fecha_inicio, date(siguiente_año, siguiente_mes, 1) - timedelta(days=1)
+
+
+async def ganancias_mensuales(db: Session, año: int) -> list[dict]:
+    ganancias_por_mes = await _calcular(db, "ganancias_mensuales", año)
+    return [{"mes": mes, "ganancia": total} for mes, total in ganancias_por_mes.items()]
+
+
+async def top_productos(db: Session) -> list[dict]:
+    # Solo cuentan comandas 'pagada' o 'facturada' para reflejar ventas reales
+    top_5 = await _calcular(db, "top_productos", 5)
+
+    # Un solo request al servicio de productos, indexado por el id pedido
+    detalles_map = await nombres.productos.resolver(id_prod for id_prod, _ in top_5)
+
+    # Construir la respuesta final
+    resultado = []
+    for id_prod, cantidad in top_5:
+        detalle = detalles_map.get(id_prod, {})
+        resultado.append({
+            "id_producto": id_prod,
+            "nombre": detalle.get("nombre", "N/A"),
+            "tipo": detalle.get("tipo", "N/A"),
+            "cantidad_total": cantidad
+        })
+    return resultado
+
+
+async def dias_concurridos(db: Session, fecha_desde: date, fecha_hasta: date) -> dict:
+    return await _calcular(db, "comandas_por_dia_semana", fecha_desde, fecha_hasta)
+
+
+async def mozo_del_mes(db: Session, año: int, mes: int) -> dict:
+    fecha_inicio, fecha_fin = rango_del_mes(año, mes)
+    conteo_mozos = await _calcular(db, "comandas_por_mozo", fecha_inicio, fecha_fin)
+    if not conteo_mozos:
+        raise HTTPException(status_code=404, detail="No se encontraron comandas para el período especificado.")
+
+    # Obtener el mozo con más comandas
+    id_mozo_top, cantidad = conteo_mozos[0]
+
+    # Obtener los detalles del mozo
+    detalles_mozo = (await nombres.mozos.resolver([id_mozo_top]))[id_mozo_top]
+    nombre_completo = f"{detalles_mozo.get('nombre', '')} {detalles_mozo.get('apellido', '')}".strip()
+
+    return {"id_mozo": id_mozo_top, "nombre_completo": nombre_completo, "cantidad_comandas": cantidad}
+
+
+async def dashboard(db: Session, desde: date, hasta: date) -> dict:
+    """
+    Los cuatro reportes sobre el rango en una sola llamada al motor. Con el
+    columnar, las columnas se leen una vez y todas las agregaciones trabajan sobre ellas.
+    """
+    agregados = await _calcular(db, "dashboard", desde, hasta)
+    top, ranking = agregados["top_productos"], agregados["ranking_mozos"]
+
+    # Nombres de productos y mozos en un request por servicio, en paralelo
+    productos, mozos = await asyncio.gather(
+        nombres.productos.resolver(id_prod for id_prod, _ in top),
+        nombres.mozos.resolver(id_mozo for id_mozo, _ in ranking),
+    )
+
+    return {
+        "desde": desde,
+        "hasta": hasta,
+        "ganancias_mensuales": [
+            {"año": año, "mes": mes, "ganancia": total}
+            for año, mes, total in agregados["ganancias_mensuales"]
+        ],
+        "top_productos": [
+            {
+                "id_producto": id_prod,
+                "nombre": productos.get(id_prod, {}).get("nombre", "N/A"),
+                "tipo": productos.get(id_prod, {}).get("tipo", "N/A"),
+                "cantidad_total": cantidad,
+            }
+            for id_prod, cantidad in top
+        ],
+        "dias_concurridos": agregados["dias_concurridos"],
+        "ranking_mozos": [
+            {
+                "id_mozo": id_mozo,
+                "nombre_completo": (
+                    f"{mozos.get(id_mozo, {}).get('nombre', '')} {mozos.get(id_mozo, {}).get('apellido', '')}".strip()
+                ),
+                "cantidad_comandas": cantidad,
+            }
+            for id_mozo, cantidad in ranking
+        ],
+    }
+
+
+# Reportes que se pueden pedir como trabajo (POST /reporte/jobs): parámetros y cálculo
+REPORTES = {
+    "ganancias-mensuales": (
+        schemas.ParametrosGanancias,
+        lambda db, p: ganancias_mensuales(db, p.año),
+    ),
+    "top-productos-vendidos": (
+        schemas.ParametrosTopProductos,
+        lambda db, p: top_productos(db),
+    ),
+    "dias-concurridos": (
+        schemas.ParametrosDiasConcurridos,
+        lambda db, p: dias_concurridos(db, p.fecha_desde, p.fecha_hasta),
+    ),
+    "mozo-del-mes": (
+        schemas.ParametrosMozoDelMes,
+        lambda db, p: mozo_del_mes(db, p.año, p.mes),
+    ),
+    "dashboard": (
+        schemas.ParametrosDashboard,
+        lambda db, p: dashboard(db, p.desde, p.hasta),
+    ),
+}
@@ -1,21 +1,17 @@
-from fastapi import APIRouter, HTTPException, Depends, Query
+import asyncio
+
+from fastapi import APIRouter, BackgroundTasks, HTTPException, Depends, Query, status
+from fastapi.exceptions import RequestValidationError
+from pydantic import ValidationError
 from sqlalchemy.orm import Session
-from sqlalchemy import select
-from datetime import date, datetime, timedelta
-from collections import Counter
-import asyncio, os
+from datetime import date
 
 from ..database import get_db
 from . import models, schemas
 from .filters import ReporteFilter
-
-# URL del servicio de facturación (configurable por entorno)
-import httpx
-FACTURACION_API_URL = os.getenv("FACTURACION_API_URL", "http://gestion-facturacion:8000")
-COMANDA_API_URL = os.getenv("COMANDA_API_URL", "http://gestion-comanda:8000")
-PRODUCTOS_API_URL = os.getenv("PRODUCTOS_API_URL", "http://gestion-productos:8000")
-MOZO_API_URL = os.getenv("MOZO_API_URL", "http://mozo-y-cliente:8000")
-
+from . import aproximados, reportes, sincronizacion, trabajos
+from .cache import cache_reportes, clave_cache, ttl_para_periodo
+from .trabajos import cola_trabajos
 
 
 from fastapi_filter import FilterDepends
@@ -25,209 +21,209 @@ from fastapi_pagination.ext.sqlalchemy import paginate
 router = APIRouter()
 
 
-async def get_facturas_pagadas(fecha_desde: date, fecha_hasta: date) -> list:
+@router.post("/sincronizar", response_model=schemas.SincronizacionOut)
+async def sincronizar_datos(
+    reconciliar: bool = Query(False, description="Volver a copiar también los últimos días (cambios de estado)"),
+    completa: bool = Query(False, description="Volver a copiar todas las filas"),
+    db: Session = Depends(get_db),
+):
     """
-    Función helper para obtener todas las facturas de la API de facturación.
+    Sincroniza ahora las tablas de hechos locales (además de la tarea periódica).
     """
-    # Para probar, hacemos un GET básico sin filtros, pidiendo hasta 1000 facturas.
-    url = f"{FACTURACION_API_URL}/factura/"
-    try:
-        async with httpx.AsyncClient() as client:
-            response = await client.get(url)
-            response.raise_for_status()
-            return response.json().get("items", [])
-    except httpx.RequestError as e:
-        raise HTTPException(status_code=503, detail=f"Error al contactar la API de facturación: {e}")
-    except Exception:
-        raise HTTPException(status_code=500, detail="Error inesperado al procesar respuesta de la API de facturación")
+    copiadas = await sincronizacion.sincronizar(db.get_bind(), reconciliacion=reconciliar, completa=completa)
+    fuentes = await asyncio.to_thread(lambda: db.query(models.EstadoSincronizacion).all())
+    return {"copiadas": copiadas, "fuentes": fuentes}
 
-@router.get("/ganancias-mensuales/", response_model=list[schemas.GananciaMensual])
-async def reporte_ganancias_mensuales(
-    año: int = Query(..., description="Año para el cual se generará el reporte de ganancias.")
-):
+
+@router.get("/sincronizacion", response_model=list[schemas.EstadoSincronizacionOut])
+def estado_sincronizacion(db: Session = Depends(get_db)):
     """
-    Calcula la suma de los montos totales de las facturas PAGADAS por cada mes de un año determinado.
+    Marca de agua y fecha de la última sincronización de cada fuente.
     """
-    fecha_inicio = date(año, 1, 1)
-    fecha_fin = date(año, 12, 31)
-    facturas_pagadas = await get_facturas_pagadas(fecha_inicio, fecha_fin)
+    return db.query(models.EstadoSincronizacion).all()
 
-    ganancias_por_mes = {i: 0.0 for i in range(1, 13)}
 
-    # Como traemos todas las facturas, filtramos aquí por estado y año.
-    for factura in facturas_pagadas:
-        if (factura.get("estado") == "pagada" and 
-            factura.get("total") is not None and 
-            factura.get("fecha_emision")):
-            fecha_factura = datetime.fromisoformat(factura["fecha_emision"]).date()
-            if fecha_factura.year == año:
-                mes = fecha_factura.month
-                ganancias_por_mes[mes] += factura["total"]
-
-    return [{"mes": mes, "ganancia": total} for mes, total in ganancias_por_mes.items()]
+@router.get("/cache", response_model=schemas.CacheEstadisticas)
+def estadisticas_cache():
+    """
+    Entradas, aciertos, fallos y respuestas vencidas servidas por la caché de reportes.
+    """
+    return cache_reportes.estadisticas()
 
 
-async def get_all_comandas(fecha_desde: date | None = None, fecha_hasta: date | None = None) -> list:
+@router.delete("/cache", response_model=schemas.CacheInvalidada)
+def invalidar_cache(
+    endpoint: str | None = Query(None, description="Solo este reporte (p. ej. 'ganancias-mensuales'); todos si se omite"),
+):
     """
-    Función helper para obtener todas las comandas de la API de gestión de comandas.
-    Opcionalmente filtra por un rango de fechas.
+    Borra resultados cacheados para forzar que se recalculen.
     """
-    # NOTA: En una implementación real, se debería manejar la paginación.
-    url = f"{COMANDA_API_URL}/comanda/"
-    if fecha_desde and fecha_hasta:
-        url += f"&fecha__gte={fecha_desde}&fecha__lte={fecha_hasta}"
-    try:
-        async with httpx.AsyncClient() as client:
-            response = await client.get(url)
-            response.raise_for_status()
-            return response.json().get("items", [])
-    except httpx.RequestError as e:
-        raise HTTPException(status_code=503, detail=f"Error al contactar la API de comandas: {e}")
-    except Exception:
-        raise HTTPException(status_code=500, detail="Error inesperado al procesar respuesta de la API de comandas")
+    return {"invalidadas": cache_reportes.invalidar(endpoint)}
 
 
-async def get_producto_details(id_producto: int) -> dict:
+@router.post("/jobs", response_model=schemas.TrabajoOut, status_code=status.HTTP_202_ACCEPTED)
+async def crear_trabajo(payload: schemas.TrabajoCreate, db: Session = Depends(get_db)):
     """
-    Obtiene los detalles de un producto específico desde la API de gestión de productos.
+    Encola un reporte para calcularlo en segundo plano. Si ya hay uno idéntico
+    pendiente o en curso, devuelve ese mismo trabajo.
     """
-    url = f"{PRODUCTOS_API_URL}/productos/{id_producto}"
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.get(url)
-            # Si el producto no se encuentra, devolvemos un diccionario por defecto.
-            if response.status_code == 404:
-                return {"nombre": f"Producto ID {id_producto} no encontrado", "tipo": "desconocido"}
-            response.raise_for_status()
-            return response.json()
-    except httpx.RequestError:
-        # En caso de error de conexión, también devolvemos un default.
-        return {"nombre": f"Error al buscar producto ID {id_producto}", "tipo": "desconocido"}
+        trabajo, nuevo = trabajos.crear_o_reutilizar(db, payload.reporte.value, payload.parametros)
+    except ValidationError as e:
+        raise RequestValidationError(e.errors(include_url=False))
+    if nuevo:
+        cola_trabajos.encolar(trabajo.id, db.get_bind())
+    return trabajos.a_salida(trabajo)
 
 
-@router.get("/top-productos-vendidos/", response_model=list[schemas.ProductoVendido])
-async def reporte_top_productos():
+@router.get("/jobs/{id_trabajo}", response_model=schemas.TrabajoOut)
+def obtener_trabajo(id_trabajo: int, db: Session = Depends(get_db)):
     """
-    Devuelve un ranking de los 5 productos más vendidos (platos, bebidas, etc.)
-    incluyendo su nombre y tipo.
+    Estado del trabajo y, cuando está completado, su resultado.
     """
-    comandas = await get_all_comandas()
-    conteo_productos = Counter()
-
-    for comanda in comandas:
-        # Solo contamos comandas que estén 'pagada' o 'facturada' para reflejar ventas reales
-        estado_comanda = comanda.get("estado", "").lower()
-        if estado_comanda in ["pagada", "facturada"] and comanda.get("detalles_comanda"):
-            for detalle in comanda["detalles_comanda"]:
-                if detalle.get("id_producto") and detalle.get("cantidad"):
-                    conteo_productos[detalle["id_producto"]] += detalle["cantidad"]
+    trabajo = db.get(models.TrabajoReporte, id_trabajo)
+    if trabajo is None:
+        raise HTTPException(status_code=404, detail="Trabajo no encontrado")
+    return trabajos.a_salida(trabajo)
 
-    # Obtener los 5 productos más vendidos
-    top_5 = conteo_productos.most_common(5)
 
-    # Crear tareas para obtener los detalles de los productos concurrentemente
-    tasks = [get_producto_details(id_prod) for id_prod, _ in top_5]
-    detalles_productos = await asyncio.gather(*tasks)
+@router.get("/ganancias-mensuales/", response_model=list[schemas.GananciaMensual])
+async def reporte_ganancias_mensuales(
+    background_tasks: BackgroundTasks,
+    año: int = Query(..., description="Año para el cual se generará el reporte de ganancias."),
+    db: Session = Depends(get_db),
+):
+    """
+    Calcula la suma de los montos totales de las facturas PAGADAS por cada mes de un año determinado.
+    """
+    return await cache_reportes.obtener(
+        clave_cache("ganancias-mensuales", año=año),
+        lambda sesion: reportes.ganancias_mensuales(sesion, año),
+        ttl_para_periodo(date(año, 12, 31)),
+        db,
+        background_tasks,
+    )
 
-    # Mapear detalles por ID de producto para fácil acceso
-    detalles_map = {detalle.get("id"): detalle for detalle in detalles_productos}
 
-    # Construir la respuesta final
-    resultado = []
-    for id_prod, cantidad in top_5:
-        detalle = detalles_map.get(id_prod, {})
-        resultado.append({
-            "id_producto": id_prod,
-            "nombre": detalle.get("nombre", "N/A"),
-            "tipo": detalle.get("tipo", "N/A"),
-            "cantidad_total": cantidad
-        })
-    return resultado
+@router.get("/top-productos-vendidos/", response_model=list[schemas.ProductoVendido])
+async def reporte_top_productos(background_tasks: BackgroundTasks, db: Session = Depends(get_db)):
+    """
+    Devuelve un ranking de los 5 productos más vendidos (platos, bebidas, etc.)
+    incluyendo su nombre y tipo.
+    """
+    # Abarca todas las ventas, así que siempre es un período abierto
+    return await cache_reportes.obtener(
+        clave_cache("top-productos-vendidos"),
+        reportes.top_productos,
+        ttl_para_periodo(None),
+        db,
+        background_tasks,
+    )
 
 
 @router.get("/dias-concurridos/", response_model=schemas.ConcurrenciaSemanal)
 async def reporte_dias_concurridos(
+    background_tasks: BackgroundTasks,
     fecha_desde: date = Query(..., description="Fecha de inicio del rango a analizar."),
-    fecha_hasta: date = Query(..., description="Fecha de fin del rango a analizar.")
+    fecha_hasta: date = Query(..., description="Fecha de fin del rango a analizar."),
+    db: Session = Depends(get_db),
 ):
     """
     Analiza las comandas en un rango de fechas y devuelve la cantidad
     total de comandas por cada día de la semana.
     """
-    # Se traen todas las comandas sin filtro en la URL, ya que la API de comandas
-    # no soporta el filtrado por fecha directamente.
-    comandas = await get_all_comandas() 
-
-    # Mapeo de weekday() a nombres de días en español (0=lunes)
-    dias_semana = {
-        0: "lunes", 1: "martes", 2: "miercoles",
-        3: "jueves", 4: "viernes", 5: "sabado", 6: "domingo"
-    }
-    conteo_dias = Counter()
-
-    # El filtrado por fecha se hace aquí, en Python
-    for comanda in comandas:
-        if comanda.get("fecha"):
-            fecha_comanda = date.fromisoformat(comanda["fecha"])
-            if fecha_desde <= fecha_comanda <= fecha_hasta:
-                nombre_dia = dias_semana[fecha_comanda.weekday()]
-                conteo_dias[nombre_dia] += 1
-
-    # Devolvemos el conteo para cada día, asegurando que todos los días aparezcan
-    return {dia: conteo_dias[dia] for dia in dias_semana.values()}
-
-
-async def get_mozo_details(id_mozo: int) -> dict:
-    """
-    Obtiene los detalles de un mozo específico desde la API de mozos.
-    """
-    url = f"{MOZO_API_URL}/mozo/{id_mozo}"
-    try:
-        async with httpx.AsyncClient() as client:
-            response = await client.get(url)
-            if response.status_code == 404:
-                return {"nombre": f"Mozo ID {id_mozo}", "apellido": "no encontrado"}
-            response.raise_for_status()
-            return response.json()
-    except httpx.RequestError:
-        return {"nombre": f"Error al buscar mozo ID {id_mozo}", "apellido": ""}
+    return await cache_reportes.obtener(
+        clave_cache("dias-concurridos", fecha_desde=fecha_desde, fecha_hasta=fecha_hasta),
+        lambda sesion: reportes.dias_concurridos(sesion, fecha_desde, fecha_hasta),
+        ttl_para_periodo(fecha_hasta),
+        db,
+        background_tasks,
+    )
 
 
 @router.get("/mozo-del-mes/", response_model=schemas.MozoDelMes)
 async def reporte_mozo_del_mes(
+    background_tasks: BackgroundTasks,
     año: int = Query(..., description="Año a analizar."),
-    mes: int = Query(..., ge=1, le=12, description="Mes a analizar.")
+    mes: int = Query(..., ge=1, le=12, description="Mes a analizar."),
+    db: Session = Depends(get_db),
 ):
     """
     Encuentra al mozo con la mayor cantidad de comandas atendidas en un mes y año específicos.
     """
-    # Determinar primer y último día del mes
-    fecha_inicio = date(año, mes, 1)
-    # Para obtener el último día, vamos al primer día del mes siguiente y restamos un día
-    siguiente_mes = mes + 1 if mes < 12 else 1
-    siguiente_año = año if mes < 12 else año + 1
-    fecha_fin = date(siguiente_año, siguiente_mes, 1) - timedelta(days=1)
-
-    # Se traen todas las comandas y se filtran por fecha aquí en Python
-    todas_las_comandas = await get_all_comandas()
-    comandas_del_periodo = [
-        c for c in todas_las_comandas
-        if c.get("fecha") and fecha_inicio <= date.fromisoformat(c["fecha"]) <= fecha_fin
-    ]
+    _, fecha_fin = reportes.rango_del_mes(año, mes)
+    return await cache_reportes.obtener(
+        clave_cache("mozo-del-mes", año=año, mes=mes),
+        lambda sesion: reportes.mozo_del_mes(sesion, año, mes),
+        ttl_para_periodo(fecha_fin),
+        db,
+        background_tasks,
+    )
+
+
+@router.get("/dashboard", response_model=schemas.Dashboard)
+async def reporte_dashboard(
+    background_tasks: BackgroundTasks,
+    desde: date = Query(..., description="Fecha de inicio del rango."),
+    hasta: date = Query(..., description="Fecha de fin del rango."),
+    db: Session = Depends(get_db),
+):
+    """
+    Ganancias por mes, productos más vendidos, concurrencia por día de la
+    semana y ranking de mozos del rango, calculados sobre una sola carga de datos.
+    """
+    if hasta < desde:
+        raise HTTPException(status_code=400, detail="La fecha 'hasta' no puede ser anterior a 'desde'.")
+    return await cache_reportes.obtener(
+        clave_cache("dashboard", desde=desde, hasta=hasta),
+        lambda sesion: reportes.dashboard(sesion, desde, hasta),
+        ttl_para_periodo(hasta),
+        db,
+        background_tasks,
+    )
 
-    if not comandas_del_periodo:
-        raise HTTPException(status_code=404, detail="No se encontraron comandas para el período especificado.")
 
-    conteo_mozos = Counter(comanda["id_mozo"] for comanda in comandas_del_periodo if comanda.get("id_mozo"))
+@router.get("/aproximado/clientes-distintos", response_model=schemas.ClientesDistintos)
+def reporte_clientes_distintos(
+    año: int = Query(..., description="Año a analizar."),
+    mes: int = Query(..., ge=1, le=12, description="Mes a analizar."),
+    db: Session = Depends(get_db),
+):
+    """
+    Cantidad aproximada de clientes distintos con reservas en el mes
+    (HyperLogLog), con su error relativo y un intervalo de ~95%.
+    """
+    desde, hasta = reportes.rango_del_mes(año, mes)
+    return {"año": año, "mes": mes, **aproximados.clientes_distintos(db, desde, hasta)}
 
-    if not conteo_mozos:
-        raise HTTPException(status_code=404, detail="No hay comandas con mozo asignado en este período.")
 
-    # Obtener el mozo con más comandas
-    id_mozo_top, cantidad = conteo_mozos.most_common(1)[0]
+@router.get("/aproximado/top-productos", response_model=schemas.TopProductosAproximado)
+async def reporte_top_productos_aproximado(
+    desde: date = Query(..., description="Fecha de inicio del rango."),
+    hasta: date = Query(..., description="Fecha de fin del rango."),
+    limite: int = Query(5, ge=1, le=aproximados.MAX_TOP_PRODUCTOS, description="Cantidad de productos."),
+    db: Session = Depends(get_db),
+):
+    """
+    Productos más vendidos del rango según los Count-Min Sketch diarios. Cada
+    cantidad puede estar sobreestimada hasta `error_maximo` con probabilidad `confianza`.
+    """
+    if hasta < desde:
+        raise HTTPException(status_code=400, detail="La fecha 'hasta' no puede ser anterior a 'desde'.")
+    return await aproximados.top_productos(db, desde, hasta, limite)
 
-    # Obtener los detalles del mozo
-    detalles_mozo = await get_mozo_details(id_mozo_top)
-    nombre_completo = f"{detalles_mozo.get('nombre', '')} {detalles_mozo.get('apellido', '')}".strip()
 
-    return {"id_mozo": id_mozo_top, "nombre_completo": nombre_completo, "cantidad_comandas": cantidad}
+@router.get("/aproximado/latencias", response_model=list[schemas.LatenciaRuta])
+def reporte_latencias(
+    desde: date = Query(..., description="Fecha de inicio del rango."),
+    hasta: date = Query(..., description="Fecha de fin del rango."),
+    ruta: str | None = Query(None, description="Solo esta ruta (p. ej. 'GET /reporte/dashboard'); todas si se omite"),
+    db: Session = Depends(get_db),
+):
+    """
+    Cuantiles (p50, p90, p95, p99) de la duración de los requests de este
+    servicio por ruta, según los t-digest diarios.
+    """
+    if hasta < desde:
+        raise HTTPException(status_code=400, detail="La fecha 'hasta' no puede ser anterior a 'desde'.")
+    return aproximados.latencias(db, desde, hasta, ruta)
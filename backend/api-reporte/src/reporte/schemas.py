@@ -1,3 +1,6 @@
+from datetime import date, datetime
+from enum import Enum
+from typing import Any
 from pydantic import BaseModel, Field, ConfigDict, conint
 
 class ReporteBase(BaseModel):
@@ -38,3 +41,120 @@ class MozoDelMes(BaseModel):
     id_mozo: int
     nombre_completo: str
     cantidad_comandas: int
+
+# --- Schema del dashboard (los cuatro reportes sobre un rango) ---
+class GananciaPeriodo(BaseModel):
+    año: int
+    mes: conint(ge=1, le=12)
+    ganancia: float
+
+class Dashboard(BaseModel):
+    desde: date
+    hasta: date
+    ganancias_mensuales: list[GananciaPeriodo]
+    top_productos: list[ProductoVendido]
+    dias_concurridos: ConcurrenciaSemanal
+    ranking_mozos: list[MozoDelMes]
+
+# --- Schemas de los reportes aproximados (sketches diarios) ---
+class ClientesDistintos(BaseModel):
+    año: int
+    mes: conint(ge=1, le=12)
+    clientes_distintos: int
+    error_relativo: float  # desvío estándar relativo del HyperLogLog
+    minimo: int  # ±2 desvíos: ~95% de confianza
+    maximo: int
+
+class ProductoAproximado(BaseModel):
+    id_producto: int
+    nombre: str
+    tipo: str
+    cantidad_estimada: int
+    cantidad_minima: int
+
+class TopProductosAproximado(BaseModel):
+    desde: date
+    hasta: date
+    total_unidades: int
+    error_maximo: float  # sobreestimación máxima de cada cantidad...
+    confianza: float  # ...con esta probabilidad
+    productos: list[ProductoAproximado]
+
+class CuantilLatencia(BaseModel):
+    cuantil: float
+    ms: float
+    error_rango: float  # el valor corresponde a un cuantil en cuantil ± error_rango
+
+class LatenciaRuta(BaseModel):
+    ruta: str
+    cantidad: int
+    cuantiles: list[CuantilLatencia]
+
+# --- Schemas de la sincronización de las tablas de hechos ---
+class EstadoSincronizacionOut(BaseModel):
+    fuente: str
+    ultimo_id: int
+    sincronizado_en: datetime | None = None
+    reconciliado_en: datetime | None = None
+    model_config = ConfigDict(from_attributes=True)
+
+class SincronizacionOut(BaseModel):
+    copiadas: dict[str, int]
+    fuentes: list[EstadoSincronizacionOut]
+
+# --- Schemas de la caché de reportes ---
+class CacheEstadisticas(BaseModel):
+    entradas: int
+    hits: int
+    misses: int
+    stale: int
+
+class CacheInvalidada(BaseModel):
+    invalidadas: int
+
+# --- Schemas de los trabajos de reportes en segundo plano ---
+class TipoReporte(str, Enum):
+    ganancias_mensuales = "ganancias-mensuales"
+    top_productos_vendidos = "top-productos-vendidos"
+    dias_concurridos = "dias-concurridos"
+    mozo_del_mes = "mozo-del-mes"
+    dashboard = "dashboard"
+
+class EstadoTrabajo(str, Enum):
+    pendiente = "pendiente"
+    en_curso = "en_curso"
+    completado = "completado"
+    error = "error"
+
+class ParametrosGanancias(BaseModel):
+    año: int
+
+class ParametrosTopProductos(BaseModel):
+    pass
+
+class ParametrosDiasConcurridos(BaseModel):
+    fecha_desde: date
+    fecha_hasta: date
+
+class ParametrosMozoDelMes(BaseModel):
+    año: int
+    mes: conint(ge=1, le=12)
+
+class ParametrosDashboard(BaseModel):
+    desde: date
+    hasta: date
+
+class TrabajoCreate(BaseModel):
+    reporte: TipoReporte
+    parametros: dict[str, Any] = Field(default_factory=dict)
+
+class TrabajoOut(BaseModel):
+    id: int
+    reporte: TipoReporte
+    parametros: dict[str, Any]
+    estado: EstadoTrabajo
+    resultado: Any | None = None
+    error: str | None = None
+    creado_en: datetime
+    iniciado_en: datetime | None = None
+    terminado_en: datetime | None = None
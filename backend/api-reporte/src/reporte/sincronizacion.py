@@ -0,0 +1,273 @@
+"""
+Sincronización de las tablas de hechos locales desde comandas, facturación y reservas.
+
+- Incremental: pide solo las filas con id mayor a la marca de agua de cada
+  fuente (`?id__gt=<ultimo_id>&order_by=id`).
+- Reconciliación: vuelve a copiar las filas de los últimos
+  REPORTE_RECONCILIACION_DIAS días para tomar los cambios de estado
+  (pendiente -> pagada, anulaciones, etc.), que no cambian el id.
+- Completa: vuelve a copiar todo (primera carga o reparación manual).
+
+Los reportes leen solo de las tablas locales; si un servicio está caído se
+sigue respondiendo con lo último sincronizado. Al terminar de copiar cada fuente
+se recalculan, una vez cada uno, los sketches diarios de los días que cambiaron
+(ver `aproximados`).
+
+Uso (desde la carpeta del servicio):
+
+    python -m src.reporte.sincronizacion [--completa]
+"""
+import argparse
+import asyncio
+import logging
+from datetime import date, datetime, timedelta, timezone
+
+from sqlalchemy import delete, insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+
+from ..config import settings
+from . import aproximados, models
+from .cache import cache_reportes
+from .fetcher import iterar_paginas
+
+logger = logging.getLogger(__name__)
+
+FUENTES = ("comandas", "facturas", "reservas")
+
+
+def _ahora() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def _upsert(db: Session, modelo, filas: list[dict]) -> None:
+    if not filas:
+        return
+    stmt = sqlite_insert(modelo)
+    columnas = [c.name for c in modelo.__table__.columns if c.name != "id"]
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["id"],
+        set_={columna: stmt.excluded[columna] for columna in columnas},
+    )
+    db.execute(stmt, filas)
+
+
+def guardar_comandas(db: Session, comandas: list[dict]) -> int:
+    """Upsert de comandas y reemplazo de sus detalles, sin hacer commit"""
+    filas, detalles = [], []
+    for comanda in comandas:
+        lineas = comanda.get("detalles_comanda") or []
+        total = comanda.get("total")
+        if total is None:
+            total = sum(d["cantidad"] * d["precio_unitario"] for d in lineas)
+        filas.append({
+            "id": comanda["id"],
+            "id_mesa": comanda["id_mesa"],
+            "id_mozo": comanda["id_mozo"],
+            "fecha": date.fromisoformat(comanda["fecha"]),
+            "estado": comanda["estado"],
+            "total": total,
+        })
+        detalles += [
+            {
+                "id": d["id"],
+                "id_comanda": comanda["id"],
+                "id_producto": d["id_producto"],
+                "cantidad": d["cantidad"],
+                "precio_unitario": d["precio_unitario"],
+            }
+            for d in lineas
+        ]
+    _upsert(db, models.ComandaHecho, filas)
+    if filas:
+        db.execute(
+            delete(models.DetalleComandaHecho)
+            .where(models.DetalleComandaHecho.id_comanda.in_([f["id"] for f in filas]))
+            .execution_options(synchronize_session=False)
+        )
+    if detalles:
+        db.execute(insert(models.DetalleComandaHecho), detalles)
+    return len(filas)
+
+
+def guardar_facturas(db: Session, facturas: list[dict]) -> int:
+    """Upsert de facturas, sin hacer commit"""
+    filas = [
+        {
+            "id": f["id"],
+            "id_comanda": f["id_comanda"],
+            "fecha_emision": datetime.fromisoformat(f["fecha_emision"]),
+            "total": f["total"],
+            "monto_seña": f.get("monto_seña") or 0.0,
+            "medio_pago": f["medio_pago"],
+            "estado": f["estado"],
+        }
+        for f in facturas
+    ]
+    _upsert(db, models.FacturaHecho, filas)
+    return len(filas)
+
+
+def guardar_reservas(db: Session, reservas: list[dict]) -> int:
+    """Upsert de reservas (solo lo que usan los reportes), sin hacer commit"""
+    filas = [
+        {
+            "id": r["id"],
+            "id_cliente": r["id_cliente"],
+            "fecha": date.fromisoformat(r["fecha"]),
+            "baja": r.get("baja", False),
+        }
+        for r in reservas
+    ]
+    _upsert(db, models.ReservaHecho, filas)
+    return len(filas)
+
+
+def _origen(fuente: str) -> tuple[str, str, dict, callable]:
+    if fuente == "comandas":
+        # include_archived: las comandas archivadas siguen contando para los reportes
+        return f"{settings.COMANDA_API_URL}/comanda/", "comandas", {"include_archived": "true"}, guardar_comandas
+    if fuente == "reservas":
+        return f"{settings.RESERVAS_API_URL}/reserva/", "reservas", {}, guardar_reservas
+    return f"{settings.FACTURACION_API_URL}/factura/", "facturación", {}, guardar_facturas
+
+
+def estado_fuente(db: Session, fuente: str) -> models.EstadoSincronizacion:
+    estado = db.get(models.EstadoSincronizacion, fuente)
+    if estado is None:
+        estado = models.EstadoSincronizacion(fuente=fuente, ultimo_id=0)
+        db.add(estado)
+        db.flush()
+    return estado
+
+
+# --- Trabajo con la base: sincrónico, con sesión propia y fuera del event loop (asyncio.to_thread) ---
+
+def _marca_de_agua(bind, fuente: str) -> int:
+    with Session(bind=bind) as db:
+        ultimo_id = estado_fuente(db, fuente).ultimo_id
+        db.commit()
+        return ultimo_id
+
+
+def _guardar_lote(bind, fuente: str, lote: list[dict]) -> tuple[int, set[date]]:
+    """Guarda el lote. Devuelve las filas y los días cuyos sketches cambian"""
+    guardar = _origen(fuente)[3]
+    with Session(bind=bind) as db:
+        dias = aproximados.dias_de_lote(db, fuente, lote)
+        filas = guardar(db, lote)
+        db.commit()  # un commit por lote para no retener el lock de escritura
+    return filas, dias
+
+
+def _recalcular_sketches(bind, fuente: str, dias: set[date]) -> None:
+    if not dias:
+        return
+    with Session(bind=bind) as db:
+        aproximados.recalcular(db, fuente, sorted(dias))
+        db.commit()
+
+
+def _avanzar_marca(bind, fuente: str, id_maximo: int, reconciliado: bool = False) -> None:
+    with Session(bind=bind) as db:
+        estado = estado_fuente(db, fuente)
+        estado.ultimo_id = max(estado.ultimo_id, id_maximo)
+        estado.sincronizado_en = _ahora()
+        if reconciliado:
+            estado.reconciliado_en = estado.sincronizado_en
+        db.commit()
+
+
+def _volcar_latencias(bind) -> int:
+    with Session(bind=bind) as db:
+        return aproximados.registro_latencias.volcar(db)
+
+
+async def _copiar(bind, fuente: str, params: dict) -> tuple[int, int]:
+    """Copia todas las páginas que devuelve la fuente con `params`. Devuelve (filas, id máximo)"""
+    url, servicio, params_base, _ = _origen(fuente)
+    filas, id_maximo = 0, 0
+    # Un día que aparece en varios lotes se recalcula una sola vez, al final
+    dias: set[date] = set()
+    try:
+        async for lote in iterar_paginas(url, servicio, {**params_base, **params, "order_by": "id"}):
+            copiadas, dias_lote = await asyncio.to_thread(_guardar_lote, bind, fuente, lote)
+            filas += copiadas
+            dias |= dias_lote
+            id_maximo = max([id_maximo] + [item["id"] for item in lote])
+    finally:
+        # También si una página falla: los lotes ya guardados quedan con sus sketches al día
+        await asyncio.to_thread(_recalcular_sketches, bind, fuente, dias)
+    return filas, id_maximo
+
+
+async def sincronizar_incremental(bind, fuente: str) -> int:
+    ultimo_id = await asyncio.to_thread(_marca_de_agua, bind, fuente)
+    filas, id_maximo = await _copiar(bind, fuente, {"id__gt": ultimo_id})
+    # La marca de agua avanza solo si se copiaron todas las páginas
+    await asyncio.to_thread(_avanzar_marca, bind, fuente, id_maximo)
+    return filas
+
+
+async def reconciliar(bind, fuente: str, dias: int | None = None) -> int:
+    """Vuelve a copiar las filas de los últimos `dias` días (todas si dias es None)"""
+    params = {}
+    if dias is not None:
+        desde = (date.today() - timedelta(days=dias)).isoformat()
+        params = {"fecha_emision__gte": desde} if fuente == "facturas" else {"fecha__gte": desde}
+    filas, id_maximo = await _copiar(bind, fuente, params)
+    await asyncio.to_thread(_avanzar_marca, bind, fuente, id_maximo, reconciliado=True)
+    return filas
+
+
+async def sincronizar(bind, reconciliacion: bool = False, completa: bool = False) -> dict[str, int]:
+    """Sincroniza todas las fuentes sobre el engine `bind`. Devuelve las filas copiadas por fuente"""
+    copiadas = {}
+    for fuente in FUENTES:
+        if completa:
+            copiadas[fuente] = await reconciliar(bind, fuente)
+            continue
+        copiadas[fuente] = await sincronizar_incremental(bind, fuente)
+        if reconciliacion:
+            copiadas[fuente] += await reconciliar(bind, fuente, settings.REPORTE_RECONCILIACION_DIAS)
+
+    # Los períodos cerrados solo pueden cambiar con una copia completa
+    if completa:
+        cache_reportes.invalidar()
+    elif any(copiadas.values()):
+        cache_reportes.invalidar_abiertas()
+    return copiadas
+
+
+async def ciclo_sincronizacion(bind) -> None:
+    """Tarea de fondo: incremental cada REPORTE_SYNC_SEGUNDOS y reconciliación periódica"""
+    ultima_reconciliacion = None
+    while True:
+        ahora = asyncio.get_running_loop().time()
+        reconciliacion = (
+            ultima_reconciliacion is None
+            or ahora - ultima_reconciliacion >= settings.REPORTE_RECONCILIACION_SEGUNDOS
+        )
+        try:
+            # Antes de sincronizar, para no depender de que los otros servicios respondan
+            await asyncio.to_thread(_volcar_latencias, bind)
+            await sincronizar(bind, reconciliacion=reconciliacion)
+            if reconciliacion:
+                ultima_reconciliacion = ahora
+        except Exception:
+            # Servicio caído u otro error: se reintenta en el próximo ciclo
+            logger.exception("Error sincronizando datos de reportes")
+        await asyncio.sleep(settings.REPORTE_SYNC_SEGUNDOS)
+
+
+if __name__ == "__main__":
+    from ..database import engine
+
+    parser = argparse.ArgumentParser(description="Sincroniza las tablas de hechos de reportes")
+    parser.add_argument("--completa", action="store_true", help="Vuelve a copiar todas las filas")
+    parser.add_argument("--reconciliar", action="store_true", help="Vuelve a copiar los últimos días")
+    args = parser.parse_args()
+
+    models.Base.metadata.create_all(bind=engine)
+    copiadas = asyncio.run(sincronizar(engine, reconciliacion=args.reconciliar, completa=args.completa))
+    print(f"Filas copiadas: {copiadas}")
@@ -0,0 +1,245 @@
+"""
+Estructuras probabilísticas de memoria constante para los reportes aproximados.
+
+- HyperLogLog: cantidad de elementos distintos (error relativo 1.04 / sqrt(2^p)).
+- CountMinSketch: frecuencias con sobreestimación acotada por ε·N con
+  probabilidad 1 - δ, más los candidatos a más frecuentes (heavy hitters).
+- TDigest: cuantiles, con más precisión en los extremos.
+
+Todas se combinan con `merge` (así se guardan por día y se suman al consultar)
+y se serializan a JSON con `a_dict` / `desde_dict`.
+"""
+import base64
+import hashlib
+import math
+
+import numpy as np
+
+
+def _hash64(valor, salt: bytes = b"") -> int:
+    return int.from_bytes(hashlib.blake2b(str(valor).encode(), digest_size=8, salt=salt).digest(), "big")
+
+
+def _a_base64(array: np.ndarray) -> str:
+    return base64.b64encode(array.tobytes()).decode()
+
+
+def _desde_base64(texto: str, dtype) -> np.ndarray:
+    return np.frombuffer(base64.b64decode(texto), dtype=dtype).copy()
+
+
+class HyperLogLog:
+    def __init__(self, precision: int = 12):
+        self.precision = precision
+        self.registros = np.zeros(1 << precision, dtype=np.uint8)
+
+    def agregar(self, valor) -> None:
+        x = _hash64(valor)
+        bits_resto = 64 - self.precision
+        indice = x >> bits_resto
+        resto = x & ((1 << bits_resto) - 1)
+        rango = bits_resto - resto.bit_length() + 1
+        if rango > self.registros[indice]:
+            self.registros[indice] = rango
+
+    def merge(self, otro: "HyperLogLog") -> None:
+        np.maximum(self.registros, otro.registros, out=self.registros)
+
+    def estimar(self) -> float:
+        m = len(self.registros)
+        alfa = 0.7213 / (1 + 1.079 / m)
+        estimado = alfa * m * m / np.sum(np.ldexp(1.0, -self.registros.astype(np.int64)))
+        ceros = int(np.count_nonzero(self.registros == 0))
+        if estimado <= 2.5 * m and ceros:
+            # Rango chico: conteo lineal
+            estimado = m * math.log(m / ceros)
+        return float(estimado)
+
+    @property
+    def error_relativo(self) -> float:
+        """Desvío estándar relativo de la estimación"""
+        return 1.04 / math.sqrt(len(self.registros))
+
+    def a_dict(self) -> dict:
+        return {"precision": self.precision, "registros": _a_base64(self.registros)}
+
+    @classmethod
+    def desde_dict(cls, datos: dict) -> "HyperLogLog":
+        hll = cls(datos["precision"])
+        hll.registros = _desde_base64(datos["registros"], np.uint8)
+        return hll
+
+
+class CountMinSketch:
+    def __init__(self, epsilon: float = 0.01, delta: float = 0.01, candidatos: int = 32):
+        self.epsilon = epsilon
+        self.delta = delta
+        self.ancho = math.ceil(math.e / epsilon)
+        self.profundidad = math.ceil(math.log(1 / delta))
+        self.tabla = np.zeros((self.profundidad, self.ancho), dtype=np.int64)
+        self.total = 0
+        # Claves con mayor frecuencia estimada; se recalculan al combinar
+        self.max_candidatos = candidatos
+        self.candidatos: dict[int, int] = {}
+
+    def _columnas(self, clave) -> list[int]:
+        return [_hash64(clave, salt=bytes([fila])) % self.ancho for fila in range(self.profundidad)]
+
+    def estimar(self, clave) -> int:
+        return int(min(self.tabla[fila, columna] for fila, columna in enumerate(self._columnas(clave))))
+
+    def agregar(self, clave, cantidad: int = 1) -> None:
+        for fila, columna in enumerate(self._columnas(clave)):
+            self.tabla[fila, columna] += cantidad
+        self.total += cantidad
+        self.candidatos[clave] = self.estimar(clave)
+        self._recortar_candidatos()
+
+    def _recortar_candidatos(self) -> None:
+        if len(self.candidatos) > self.max_candidatos:
+            mayores = sorted(self.candidatos.items(), key=lambda kv: (-kv[1], kv[0]))[:self.max_candidatos]
+            self.candidatos = dict(mayores)
+
+    def merge(self, otro: "CountMinSketch") -> None:
+        if self.tabla.shape != otro.tabla.shape:
+            raise ValueError("Solo se pueden combinar sketches con el mismo epsilon y delta")
+        self.tabla += otro.tabla
+        self.total += otro.total
+        claves = self.candidatos.keys() | otro.candidatos.keys()
+        self.candidatos = {clave: self.estimar(clave) for clave in claves}
+        self._recortar_candidatos()
+
+    def mas_frecuentes(self, k: int) -> list[tuple[int, int]]:
+        """(clave, frecuencia estimada) de los k candidatos más frecuentes"""
+        return sorted(self.candidatos.items(), key=lambda kv: (-kv[1], kv[0]))[:k]
+
+    @property
+    def error_maximo(self) -> float:
+        """Sobreestimación máxima de cada frecuencia con probabilidad 1 - δ"""
+        return self.epsilon * self.total
+
+    def a_dict(self) -> dict:
+        return {
+            "epsilon": self.epsilon,
+            "delta": self.delta,
+            "max_candidatos": self.max_candidatos,
+            "total": self.total,
+            "tabla": _a_base64(self.tabla),
+            "candidatos": [[clave, valor] for clave, valor in self.candidatos.items()],
+        }
+
+    @classmethod
+    def desde_dict(cls, datos: dict) -> "CountMinSketch":
+        cms = cls(datos["epsilon"], datos["delta"], datos["max_candidatos"])
+        cms.tabla = _desde_base64(datos["tabla"], np.int64).reshape(cms.profundidad, cms.ancho)
+        cms.total = datos["total"]
+        cms.candidatos = {clave: valor for clave, valor in datos["candidatos"]}
+        return cms
+
+
+class TDigest:
+    """t-digest con función de escala k1 (centroides chicos cerca de q=0 y q=1)"""
+
+    def __init__(self, compresion: float = 100):
+        self.compresion = compresion
+        self.medias = np.empty(0)
+        self.pesos = np.empty(0)
+        self.minimo = math.inf
+        self.maximo = -math.inf
+        self._buffer: list[float] = []
+
+    @property
+    def cantidad(self) -> float:
+        self._comprimir()
+        return float(self.pesos.sum())
+
+    def agregar(self, valor: float) -> None:
+        self._buffer.append(valor)
+        self.minimo = min(self.minimo, valor)
+        self.maximo = max(self.maximo, valor)
+        if len(self._buffer) >= 10 * self.compresion:
+            self._comprimir()
+
+    def merge(self, otro: "TDigest") -> None:
+        otro._comprimir()
+        self._comprimir()
+        self._combinar(np.concatenate([self.medias, otro.medias]), np.concatenate([self.pesos, otro.pesos]))
+        self.minimo = min(self.minimo, otro.minimo)
+        self.maximo = max(self.maximo, otro.maximo)
+
+    def _comprimir(self) -> None:
+        if not self._buffer:
+            return
+        buffer = np.array(self._buffer)
+        self._buffer = []
+        self._combinar(np.concatenate([self.medias, buffer]), np.concatenate([self.pesos, np.ones(len(buffer))]))
+
+    def _combinar(self, medias: np.ndarray, pesos: np.ndarray) -> None:
+        if len(medias) == 0:
+            return
+        orden = np.argsort(medias, kind="stable")
+        medias, pesos = medias[orden], pesos[orden]
+        total = pesos.sum()
+
+        def k(q):
+            return self.compresion / (2 * math.pi) * math.asin(2 * q - 1)
+
+        def q_limite(q):
+            return (math.sin((k(q) + 1) * 2 * math.pi / self.compresion) + 1) / 2
+
+        nuevas_medias, nuevos_pesos = [medias[0]], [pesos[0]]
+        acumulado = 0.0
+        limite = q_limite(0.0) * total
+        for media, peso in zip(medias[1:], pesos[1:]):
+            if acumulado + nuevos_pesos[-1] + peso <= limite:
+                # Entra en el centroide actual
+                nuevas_medias[-1] += (media - nuevas_medias[-1]) * peso / (nuevos_pesos[-1] + peso)
+                nuevos_pesos[-1] += peso
+            else:
+                acumulado += nuevos_pesos[-1]
+                limite = q_limite(min(acumulado / total, 1.0)) * total
+                nuevas_medias.append(media)
+                nuevos_pesos.append(peso)
+        self.medias, self.pesos = np.array(nuevas_medias), np.array(nuevos_pesos)
+
+    def cuantil(self, q: float) -> tuple[float, float]:
+        """(valor estimado, error de rango): el cuantil real está en q ± error con alta probabilidad"""
+        self._comprimir()
+        if len(self.medias) == 0:
+            return math.nan, 0.0
+        total = self.pesos.sum()
+        objetivo = q * total
+        # Posición (en peso acumulado) del centro de cada centroide
+        centros = np.cumsum(self.pesos) - self.pesos / 2
+        i = int(np.searchsorted(centros, objetivo))
+        if i == 0:
+            valor = self.minimo + (self.medias[0] - self.minimo) * (objetivo / centros[0] if centros[0] else 1.0)
+            peso = self.pesos[0]
+        elif i == len(centros):
+            resto = total - centros[-1]
+            valor = self.medias[-1] + (self.maximo - self.medias[-1]) * ((objetivo - centros[-1]) / resto if resto else 1.0)
+            peso = self.pesos[-1]
+        else:
+            fraccion = (objetivo - centros[i - 1]) / (centros[i] - centros[i - 1])
+            valor = self.medias[i - 1] + (self.medias[i] - self.medias[i - 1]) * fraccion
+            peso = max(self.pesos[i - 1], self.pesos[i])
+        return float(min(max(valor, self.minimo), self.maximo)), float(peso / (2 * total))
+
+    def a_dict(self) -> dict:
+        self._comprimir()
+        return {
+            "compresion": self.compresion,
+            "medias": self.medias.tolist(),
+            "pesos": self.pesos.tolist(),
+            "minimo": self.minimo if self.pesos.size else None,
+            "maximo": self.maximo if self.pesos.size else None,
+        }
+
+    @classmethod
+    def desde_dict(cls, datos: dict) -> "TDigest":
+        digest = cls(datos["compresion"])
+        digest.medias = np.array(datos["medias"], dtype=float)
+        digest.pesos = np.array(datos["pesos"], dtype=float)
+        if datos["minimo"] is not None:
+            digest.minimo, digest.maximo = datos["minimo"], datos["maximo"]
+        return digest
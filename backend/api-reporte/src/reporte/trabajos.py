@@ -0,0 +1,183 @@
+"""
+Trabajos de reportes en segundo plano (POST /reporte/jobs).
+
+Cada trabajo se guarda en `trabajos_reporte` con su estado y resultado, y lo
+ejecuta una cola con REPORTE_JOBS_WORKERS tareas. Si ya hay un trabajo
+pendiente o en curso con el mismo reporte y parámetros se devuelve ese en lugar
+de encolar otro (el índice parcial `ux_trabajos_reporte_clave_activa` lo
+garantiza aun con requests concurrentes). Al iniciar el servicio se vuelven a
+encolar los que quedaron sin terminar.
+"""
+import asyncio
+import json
+import logging
+from datetime import datetime, timezone
+
+from fastapi import HTTPException
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import select, text, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from ..config import settings
+from . import models
+from .reportes import REPORTES
+
+logger = logging.getLogger(__name__)
+
+# Debe coincidir literalmente con el WHERE del índice parcial para que SQLite lo use
+ACTIVO_SQL = text("trabajos_reporte.estado IN ('pendiente', 'en_curso')")
+
+
+def _ahora() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def normalizar(reporte: str, parametros: dict) -> tuple[str, str]:
+    """Parámetros validados como JSON ordenado y la clave de deduplicación"""
+    modelo, _ = REPORTES[reporte]
+    validados = jsonable_encoder(modelo.model_validate(parametros))
+    parametros_json = json.dumps(validados, sort_keys=True)
+    return parametros_json, f"{reporte}:{parametros_json}"
+
+
+def crear_o_reutilizar(db: Session, reporte: str, parametros: dict) -> tuple[models.TrabajoReporte, bool]:
+    """Devuelve el trabajo activo idéntico o uno nuevo; el bool indica si hay que encolarlo.
+    Lanza ValidationError si los parámetros no corresponden al reporte."""
+    parametros_json, clave = normalizar(reporte, parametros)
+    activo = select(models.TrabajoReporte).where(models.TrabajoReporte.clave == clave, ACTIVO_SQL)
+
+    existente = db.scalar(activo)
+    if existente is not None:
+        return existente, False
+
+    trabajo = models.TrabajoReporte(
+        reporte=reporte, parametros=parametros_json, clave=clave, estado="pendiente", creado_en=_ahora()
+    )
+    db.add(trabajo)
+    try:
+        db.commit()
+    except IntegrityError:
+        # Otro request creó el mismo trabajo entre el SELECT y el INSERT
+        db.rollback()
+        return db.scalar(activo), False
+    db.refresh(trabajo)
+    return trabajo, True
+
+
+def a_salida(trabajo: models.TrabajoReporte) -> dict:
+    return {
+        "id": trabajo.id,
+        "reporte": trabajo.reporte,
+        "parametros": json.loads(trabajo.parametros),
+        "estado": trabajo.estado,
+        "resultado": json.loads(trabajo.resultado) if trabajo.resultado is not None else None,
+        "error": trabajo.error,
+        "creado_en": trabajo.creado_en,
+        "iniciado_en": trabajo.iniciado_en,
+        "terminado_en": trabajo.terminado_en,
+    }
+
+
+def _iniciar(db: Session, id_trabajo: int) -> models.TrabajoReporte | None:
+    """Pasa el trabajo a en_curso; None si ya no está pendiente"""
+    trabajo = db.get(models.TrabajoReporte, id_trabajo)
+    if trabajo is None or trabajo.estado != "pendiente":
+        return None
+    trabajo.estado = "en_curso"
+    trabajo.iniciado_en = _ahora()
+    db.commit()
+    return trabajo
+
+
+def _terminar(db: Session, trabajo: models.TrabajoReporte, resultado=None, error: str | None = None) -> None:
+    if error is None:
+        trabajo.resultado = json.dumps(jsonable_encoder(resultado))
+        trabajo.estado = "completado"
+    else:
+        trabajo.estado, trabajo.error = "error", error
+    trabajo.terminado_en = _ahora()
+    db.commit()
+
+
+async def ejecutar(id_trabajo: int, bind) -> None:
+    """
+    Corre un trabajo pendiente y guarda el resultado o el error. Nada bloquea el
+    event loop de los workers: el reporte se calcula en el pool de procesos o en
+    un thread (ver `reportes`), y la lectura y escritura del trabajo van a un thread.
+    """
+    # Sin expirar tras el commit: leer reporte y parámetros no vuelve a consultar desde el loop
+    with Session(bind=bind, expire_on_commit=False) as db:
+        trabajo = await asyncio.to_thread(_iniciar, db, id_trabajo)
+        if trabajo is None:
+            return
+
+        modelo, calcular = REPORTES[trabajo.reporte]
+        try:
+            resultado = await calcular(db, modelo.model_validate(json.loads(trabajo.parametros)))
+        except HTTPException as e:
+            await asyncio.to_thread(_terminar, db, trabajo, error=str(e.detail))
+        except Exception as e:
+            # Error inesperado: queda registrado en el trabajo en lugar de perderse en el worker
+            await asyncio.to_thread(db.rollback)
+            await asyncio.to_thread(_terminar, db, trabajo, error=str(e))
+        else:
+            await asyncio.to_thread(_terminar, db, trabajo, resultado)
+
+
+class ColaTrabajos:
+    def __init__(self):
+        self._cola: asyncio.Queue | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._workers: list[asyncio.Task] = []
+
+    def _asegurar_workers(self) -> asyncio.Queue:
+        """Crea la cola y los workers en el loop actual la primera vez que se usan"""
+        loop = asyncio.get_running_loop()
+        if self._cola is None or self._loop is not loop:
+            self._loop = loop
+            self._cola = asyncio.Queue()
+            self._workers = [loop.create_task(self._worker()) for _ in range(settings.REPORTE_JOBS_WORKERS)]
+        return self._cola
+
+    def encolar(self, id_trabajo: int, bind) -> None:
+        self._asegurar_workers().put_nowait((id_trabajo, bind))
+
+    async def _worker(self) -> None:
+        cola = self._cola
+        while True:
+            id_trabajo, bind = await cola.get()
+            try:
+                await ejecutar(id_trabajo, bind)
+            except Exception:
+                logger.exception("Error ejecutando el trabajo de reporte %s", id_trabajo)
+            finally:
+                cola.task_done()
+
+    def reanudar(self, session_factory) -> int:
+        """Vuelve a encolar los trabajos que quedaron sin terminar (p. ej. por un reinicio)"""
+        with session_factory() as db:
+            db.execute(
+                update(models.TrabajoReporte)
+                .where(models.TrabajoReporte.estado == "en_curso")
+                .values(estado="pendiente", iniciado_en=None)
+            )
+            db.commit()
+            ids = db.scalars(
+                select(models.TrabajoReporte.id)
+                .where(models.TrabajoReporte.estado == "pendiente")
+                .order_by(models.TrabajoReporte.id)
+            ).all()
+            bind = db.get_bind()
+        for id_trabajo in ids:
+            self.encolar(id_trabajo, bind)
+        return len(ids)
+
+    async def detener(self) -> None:
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers, self._cola, self._loop = [], None, None
+
+
+cola_trabajos = ColaTrabajos()
@@ -1,39 +1,141 @@
 import pytest
 from fastapi.testclient import TestClient
-from unittest.mock import patch, AsyncMock, Mock
-from datetime import date
+from unittest.mock import patch, AsyncMock
+from datetime import date, datetime
+from urllib.parse import urlparse, parse_qs
+
+import httpx
 
 # --- Solución al problema de importación ---
 import sys
 from pathlib import Path
 sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
 
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.pool import StaticPool
+
 from src.main import app
+from src.database import Base, get_db
+from src.reporte import aproximados, nombres
+from src.reporte.cache import cache_reportes
+from src.reporte.models import FacturaHecho
+
+# --- Configuración de la Base de Datos de Prueba ---
+# Usamos una base de datos SQLite en memoria para los tests
+SQLALCHEMY_DATABASE_URL = "sqlite:///:memory:"
+
+engine = create_engine(
+    SQLALCHEMY_DATABASE_URL,
+    connect_args={"check_same_thread": False},
+    poolclass=StaticPool,  # Deshabilita el pooling de conexiones para SQLite en memoria
+)
+
+# Creamos una sesión de prueba
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+# --- Sobrescribir la Dependencia de la Base de Datos ---
+def override_get_db():
+    db = TestingSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+app.dependency_overrides[get_db] = override_get_db
 
 # --- Fixture de Pytest para el Cliente de Test ---
 @pytest.fixture()
 def client():
+    # Crea las tablas de hechos en la base de datos en memoria
+    Base.metadata.create_all(bind=engine)
+    cache_reportes.invalidar()
+    nombres.productos.invalidar()
+    nombres.mozos.invalidar()
+    aproximados.registro_latencias.invalidar()
     yield TestClient(app)
+    Base.metadata.drop_all(bind=engine)
+
+# --- Helpers para simular las APIs de comandas y facturación ---
+# Se parchea `httpx.AsyncClient.send`, que usan tanto `get` como `stream`
+
+def respuesta_paginada(items, pagina=1, paginas=1):
+    return httpx.Response(200, json={"items": items, "total": len(items), "page": pagina, "size": 100, "pages": paginas})
+
+def por_url(responder):
+    """side_effect de `send` a partir de una función que recibe la URL pedida"""
+    async def send(request, **kwargs):
+        response = responder(str(request.url))
+        if hasattr(response, "__await__"):
+            response = await response
+        response.request = request
+        return response
+    return send
+
+def comanda(id_, fecha, estado="pagada", id_mozo=1, detalles=()):
+    return {
+        "id": id_, "id_mesa": 1, "id_mozo": id_mozo, "fecha": fecha, "estado": estado,
+        "detalles_comanda": [
+            {"id": id_ * 100 + i, "id_producto": id_producto, "cantidad": cantidad, "precio_unitario": 10.0}
+            for i, (id_producto, cantidad) in enumerate(detalles)
+        ],
+    }
+
+def factura(id_, fecha_emision, total, estado="pagada"):
+    return {
+        "id": id_, "id_comanda": id_, "fecha_emision": fecha_emision, "total": total,
+        "monto_seña": 0.0, "medio_pago": "efectivo", "estado": estado,
+    }
+
+def urls_pedidas(mock_http):
+    """URLs de los requests hechos (`stream` pasa el request por nombre)"""
+    return [str((c.kwargs.get("request") or c.args[0]).url) for c in mock_http.call_args_list]
+
+def servicio_por_ids(url, registros):
+    """Responde `?id__in=...` con los registros pedidos y `/{id}` con uno o 404"""
+    if "id__in=" in url:
+        ids = parse_qs(urlparse(url).query)["id__in"][0].split(",")
+        return respuesta_paginada([registros[int(i)] for i in ids if int(i) in registros])
+    id_ = int(urlparse(url).path.rstrip("/").rsplit("/", 1)[1])
+    if id_ not in registros:
+        return httpx.Response(404, json={"detail": "No encontrado"})
+    return httpx.Response(200, json=registros[id_])
+
+def reserva(id_, fecha, id_cliente, baja=False):
+    return {
+        "id": id_, "fecha": fecha, "horario": "21:00:00", "cantidad_personas": 2,
+        "id_mesa": 1, "id_cliente": id_cliente, "baja": baja, "menu_reserva": None,
+    }
+
+def upstream(comandas=(), facturas=(), otros=None, reservas=()):
+    """side_effect que responde según la URL pedida"""
+    def responder(url):
+        if "/comanda/" in url:
+            return respuesta_paginada(list(comandas))
+        if "/factura/" in url:
+            return respuesta_paginada(list(facturas))
+        if "/reserva/" in url:
+            return respuesta_paginada(list(reservas))
+        if otros is None:
+            return servicio_por_ids(url, {})
+        return otros(url)
+    return por_url(responder)
 
 # --- Tests para el endpoint de Reportes ---
 
-@patch('httpx.AsyncClient.get', new_callable=AsyncMock)
-def test_reporte_ganancias_mensuales(mock_get, client):
+@patch('httpx.AsyncClient.send', new_callable=AsyncMock)
+def test_reporte_ganancias_mensuales(mock_http, client):
     """
     Test para verificar el reporte de ganancias mensuales.
     """
     # Mock de la respuesta de la API de facturación
-    mock_response = Mock()
-    mock_response.json.return_value = {
-        "items": [
-            {"estado": "pagada", "total": 1000.0, "fecha_emision": "2023-01-15"},
-            {"estado": "pagada", "total": 2000.0, "fecha_emision": "2023-01-20"},
-            {"estado": "pendiente", "total": 500.0, "fecha_emision": "2023-01-25"},  # No debería contar
-            {"estado": "pagada", "total": 1500.0, "fecha_emision": "2023-02-10"},
-        ]
-    }
-    mock_response.raise_for_status = Mock()
-    mock_get.return_value = mock_response
+    mock_http.side_effect = upstream(facturas=[
+        factura(1, "2023-01-15", 1000.0),
+        factura(2, "2023-01-20", 2000.0),
+        factura(3, "2023-01-25", 500.0, estado="pendiente"),  # No debería contar
+        factura(4, "2023-02-10", 1500.0),
+    ])
+    assert client.post("/reporte/sincronizar").status_code == 200
 
     response = client.get("/reporte/ganancias-mensuales/?año=2023")
     assert response.status_code == 200
@@ -44,50 +146,31 @@ def test_reporte_ganancias_mensuales(mock_get, client):
     assert data[1]["mes"] == 2  # Febrero
     assert data[1]["ganancia"] == 1500.0
 
-@patch('httpx.AsyncClient.get', new_callable=AsyncMock)
-def test_reporte_top_productos_vendidos(mock_get, client):
+@patch('httpx.AsyncClient.send', new_callable=AsyncMock)
+def test_reporte_top_productos_vendidos(mock_http, client):
     """
     Test para verificar el reporte de top productos vendidos.
     """
-    # Mock de la respuesta de la API de comandas
-    mock_comanda_response = Mock()
-    mock_comanda_response.json.return_value = {
-        "items": [
-            {
-                "estado": "pagada",
-                "detalles_comanda": [
-                    {"id_producto": 1, "cantidad": 2},
-                    {"id_producto": 2, "cantidad": 1}
-                ]
-            },
-            {
-                "estado": "facturada",
-                "detalles_comanda": [
-                    {"id_producto": 1, "cantidad": 3},
-                    {"id_producto": 3, "cantidad": 1}
-                ]
-            }
-        ]
+    # Mock de las respuestas de la API de productos (el 3 no está en el listado)
+    productos = {
+        1: {"id": 1, "nombre": "Pizza", "tipo": "plato"},
+        2: {"id": 2, "nombre": "Cerveza", "tipo": "bebida"},
     }
-    mock_comanda_response.raise_for_status = Mock()
 
-    # Mock de las respuestas de la API de productos
     def mock_get_product(url):
-        mock_resp = Mock()
-        mock_resp.raise_for_status = Mock()
-        if "productos/1" in url:
-            mock_resp.json.return_value = {"id": 1, "nombre": "Pizza", "tipo": "plato"}
-        elif "productos/2" in url:
-            mock_resp.json.return_value = {"id": 2, "nombre": "Cerveza", "tipo": "bebida"}
-        elif "productos/3" in url:
-            mock_resp.json.return_value = {"id": 3, "nombre": "Ensalada", "tipo": "plato"}
-        else:
-            mock_resp.status_code = 404
-            mock_resp.json.return_value = {}
-        return mock_resp
-
-    mock_get.side_effect = lambda url: mock_get_product(url) if "productos" in url else mock_comanda_response
+        return servicio_por_ids(url, productos)
+
+    mock_http.side_effect = upstream(
+        comandas=[
+            comanda(1, "2023-10-01", "pagada", detalles=[(1, 2), (2, 1)]),
+            comanda(2, "2023-10-02", "facturada", detalles=[(1, 3), (3, 1)]),
+            comanda(3, "2023-10-03", "pendiente", detalles=[(2, 9)]),  # No debería contar
+        ],
+        otros=mock_get_product,
+    )
+    assert client.post("/reporte/sincronizar").status_code == 200
 
+    mock_http.reset_mock()
     response = client.get("/reporte/top-productos-vendidos/")
     assert response.status_code == 200
     data = response.json()
@@ -95,27 +178,29 @@ def test_reporte_top_productos_vendidos(mock_get, client):
     assert data[0]["id_producto"] == 1
     assert data[0]["nombre"] == "Pizza"
     assert data[0]["cantidad_total"] == 5  # 2 + 3
+    # Los 404 quedan asociados al id pedido aunque la respuesta no traiga "id"
+    assert data[2]["nombre"] == "Producto ID 3 no encontrado"
+
+    # Un request en lote y uno individual para el que no vino en el lote
+    urls = urls_pedidas(mock_http)
+    assert len(urls) == 2
+    assert parse_qs(urlparse(urls[0]).query)["id__in"] == ["1,2,3"]
 
-@patch('httpx.AsyncClient.get', new_callable=AsyncMock)
-def test_reporte_dias_concurridos(mock_get, client):
+    # Los nombres quedan cacheados entre reportes
+    cache_reportes.invalidar()
+    mock_http.reset_mock()
+    assert client.get("/reporte/top-productos-vendidos/").json() == data
+    assert mock_http.call_count == 0
+
+@patch('httpx.AsyncClient.send', new_callable=AsyncMock)
+def test_reporte_dias_concurridos(mock_http, client):
     """
     Test para verificar el reporte de días concurridos.
     """
     # Mock de la respuesta de la API de comandas
-    mock_response = Mock()
-    mock_response.json.return_value = {
-        "items": [
-            {"fecha": "2023-10-01"},  # Domingo
-            {"fecha": "2023-10-02"},  # Lunes
-            {"fecha": "2023-10-02"},  # Lunes
-            {"fecha": "2023-10-03"},  # Martes
-            {"fecha": "2023-10-06"},  # Viernes
-            {"fecha": "2023-10-06"},  # Viernes
-            {"fecha": "2023-10-06"},  # Viernes
-        ]
-    }
-    mock_response.raise_for_status = Mock()
-    mock_get.return_value = mock_response
+    fechas = ["2023-10-01", "2023-10-02", "2023-10-02", "2023-10-03", "2023-10-06", "2023-10-06", "2023-10-06"]
+    mock_http.side_effect = upstream(comandas=[comanda(i, fecha) for i, fecha in enumerate(fechas, start=1)])
+    assert client.post("/reporte/sincronizar").status_code == 200
 
     response = client.get("/reporte/dias-concurridos/?fecha_desde=2023-10-01&fecha_hasta=2023-10-07")
     assert response.status_code == 200
@@ -125,41 +210,35 @@ def test_reporte_dias_concurridos(mock_get, client):
     assert data["domingo"] == 1
     assert data["martes"] == 1
     # Otros días deberían ser 0
+    assert data["sabado"] == 0
 
-@patch('httpx.AsyncClient.get', new_callable=AsyncMock)
-def test_reporte_mozo_del_mes(mock_get, client):
+@patch('httpx.AsyncClient.send', new_callable=AsyncMock)
+def test_reporte_mozo_del_mes(mock_http, client):
     """
     Test para verificar el reporte del mozo del mes.
     """
-    # Mock de la respuesta de la API de comandas
-    mock_comanda_response = Mock()
-    mock_comanda_response.json.return_value = {
-        "items": [
-            {"id_mozo": 1, "fecha": "2023-10-01"},
-            {"id_mozo": 1, "fecha": "2023-10-05"},
-            {"id_mozo": 2, "fecha": "2023-10-10"},
-            {"id_mozo": 1, "fecha": "2023-10-15"},
-            {"id_mozo": 3, "fecha": "2023-10-20"},
-        ]
+    # Mock de la respuesta de la API de mozos
+    mozos = {
+        1: {"id": 1, "nombre": "Juan", "apellido": "Pérez"},
+        2: {"id": 2, "nombre": "María", "apellido": "García"},
+        3: {"id": 3, "nombre": "Carlos", "apellido": "López"},
     }
-    mock_comanda_response.raise_for_status = Mock()
 
-    # Mock de la respuesta de la API de mozos
     def mock_get_mozo(url):
-        mock_resp = Mock()
-        mock_resp.raise_for_status = Mock()
-        if "mozo/1" in url:
-            mock_resp.json.return_value = {"id": 1, "nombre": "Juan", "apellido": "Pérez"}
-        elif "mozo/2" in url:
-            mock_resp.json.return_value = {"id": 2, "nombre": "María", "apellido": "García"}
-        elif "mozo/3" in url:
-            mock_resp.json.return_value = {"id": 3, "nombre": "Carlos", "apellido": "López"}
-        else:
-            mock_resp.status_code = 404
-            mock_resp.json.return_value = {}
-        return mock_resp
-
-    mock_get.side_effect = lambda url: mock_get_mozo(url) if "mozo" in url else mock_comanda_response
+        return servicio_por_ids(url, mozos)
+
+    mock_http.side_effect = upstream(
+        comandas=[
+            comanda(1, "2023-10-01", id_mozo=1),
+            comanda(2, "2023-10-05", id_mozo=1),
+            comanda(3, "2023-10-10", id_mozo=2),
+            comanda(4, "2023-10-15", id_mozo=1),
+            comanda(5, "2023-10-20", id_mozo=3),
+            comanda(6, "2023-11-02", id_mozo=2),  # Otro mes
+        ],
+        otros=mock_get_mozo,
+    )
+    assert client.post("/reporte/sincronizar").status_code == 200
 
     response = client.get("/reporte/mozo-del-mes/?año=2023&mes=10")
     assert response.status_code == 200
@@ -168,17 +247,639 @@ def test_reporte_mozo_del_mes(mock_get, client):
     assert data["nombre_completo"] == "Juan Pérez"
     assert data["cantidad_comandas"] == 3
 
-@patch('httpx.AsyncClient.get', new_callable=AsyncMock)
-def test_reporte_mozo_del_mes_sin_comandas(mock_get, client):
+def test_reporte_mozo_del_mes_sin_comandas(client):
     """
     Test para verificar el manejo cuando no hay comandas en el período.
     """
-    # Mock de respuesta vacía
-    mock_response = Mock()
-    mock_response.json.return_value = {"items": []}
-    mock_response.raise_for_status = Mock()
-    mock_get.return_value = mock_response
-
     response = client.get("/reporte/mozo-del-mes/?año=2023&mes=11")
     assert response.status_code == 404
-    assert "No se encontraron comandas" in response.json()["detail"]
\ No newline at end of file
+    assert "No se encontraron comandas" in response.json()["detail"]
+
+@patch('httpx.AsyncClient.send', new_callable=AsyncMock)
+def test_reporte_lee_todas_las_paginas_en_paralelo(mock_http, client):
+    """
+    Test para verificar que la sincronización lee todas las páginas del servicio (no solo
+    la primera), con el tamaño de página máximo y concurrencia acotada.
+    """
+    import asyncio
+    from urllib.parse import urlparse, parse_qs
+    from src.config import settings
+
+    paginas = 7
+    en_vuelo = {"actual": 0, "max": 0}
+    urls = []
+
+    async def respuesta_de_pagina(url):
+        if "/comanda/" in url or "/reserva/" in url:
+            return respuesta_paginada([])
+        urls.append(url)
+        pagina = int(parse_qs(urlparse(url).query)["page"][0])
+        en_vuelo["actual"] += 1
+        en_vuelo["max"] = max(en_vuelo["max"], en_vuelo["actual"])
+        await asyncio.sleep(0.01)
+        en_vuelo["actual"] -= 1
+
+        return respuesta_paginada([factura(pagina, f"2023-0{pagina}-15T12:00:00", 100.0)], pagina, paginas)
+
+    mock_http.side_effect = por_url(respuesta_de_pagina)
+
+    response = client.post("/reporte/sincronizar")
+    assert response.status_code == 200
+    assert response.json()["copiadas"]["facturas"] == paginas
+
+    response = client.get("/reporte/ganancias-mensuales/?año=2023")
+    assert sum(m["ganancia"] for m in response.json()) == 700.0  # 7 páginas, no solo la primera
+
+    assert sorted(int(parse_qs(urlparse(u).query)["page"][0]) for u in urls) == list(range(1, paginas + 1))
+    assert all(parse_qs(urlparse(u).query)["size"] == ["100"] for u in urls)
+    assert 1 < en_vuelo["max"] <= settings.UPSTREAM_CONCURRENCIA
+
+def test_parseo_incremental_de_respuestas():
+    """
+    Los items se arman a medida que llegan los bytes (aunque un chunk corte un
+    número o un carácter UTF-8) y se entregan en lotes; el resto queda en metadatos.
+    """
+    import asyncio
+    import json
+    from src.reporte.fetcher import parsear_items
+
+    items = [factura(i, "2023-01-15T12:00:00", 10.5 * i) for i in range(1, 6)]
+    cuerpo = json.dumps(
+        {"items": items, "total": 5, "page": 1, "size": 100, "pages": 3}, ensure_ascii=False
+    ).encode()
+
+    async def chunks():
+        for i in range(0, len(cuerpo), 7):
+            yield cuerpo[i:i + 7]
+
+    async def leer():
+        metadatos = {}
+        lotes = [lote async for lote in parsear_items(chunks(), metadatos, tamanio_lote=2)]
+        return lotes, metadatos
+
+    lotes, metadatos = asyncio.run(leer())
+    assert [len(lote) for lote in lotes] == [2, 2, 1]
+    assert [item for lote in lotes for item in lote] == items
+    assert isinstance(lotes[0][0]["total"], float) and isinstance(lotes[0][0]["id"], int)
+    assert metadatos == {"total": 5, "page": 1, "size": 100, "pages": 3}
+
+@patch('httpx.AsyncClient.send', new_callable=AsyncMock)
+def test_reporte_error_de_conexion_con_servicio(mock_http, client):
+    """
+    Test para verificar que un error de conexión al sincronizar devuelve 503,
+    y que los reportes siguen respondiendo con los datos locales.
+    """
+    mock_http.side_effect = upstream(comandas=[comanda(1, "2023-10-02")])
+    assert client.post("/reporte/sincronizar").status_code == 200
+
+    mock_http.side_effect = httpx.ConnectError("sin conexión")
+    response = client.post("/reporte/sincronizar")
+    assert response.status_code == 503
+    assert "API de comandas" in response.json()["detail"]
+
+    response = client.get("/reporte/dias-concurridos/?fecha_desde=2023-10-01&fecha_hasta=2023-10-07")
+    assert response.status_code == 200
+    assert response.json()["lunes"] == 1
+
+@patch('httpx.AsyncClient.send', new_callable=AsyncMock)
+def test_sincronizacion_incremental_y_reconciliacion(mock_http, client):
+    """
+    Test para verificar que la sincronización incremental pide solo ids nuevos
+    (marca de agua) y que la reconciliación toma los cambios de estado.
+    """
+    hoy = date.today().isoformat()
+    comandas = [comanda(1, hoy, "pendiente", detalles=[(1, 2)]), comanda(2, hoy, "pagada", detalles=[(2, 1)])]
+    mock_http.side_effect = upstream(comandas=comandas)
+    assert client.post("/reporte/sincronizar").json()["copiadas"]["comandas"] == 2
+
+    estados = {e["fuente"]: e for e in client.get("/reporte/sincronizacion").json()}
+    assert estados["comandas"]["ultimo_id"] == 2
+
+    # La comanda 1 se pagó y llegó la comanda 3
+    comandas = [comanda(1, hoy, "pagada", detalles=[(1, 2)]), comanda(3, hoy, "pagada", detalles=[(1, 1)])]
+    mock_http.reset_mock()
+    mock_http.side_effect = upstream(comandas=[comandas[1]])
+    client.post("/reporte/sincronizar")
+    url_comandas = next(url for url in urls_pedidas(mock_http) if "/comanda/" in url)
+    params = parse_qs(urlparse(url_comandas).query)
+    assert params["id__gt"] == ["2"]
+    assert params["include_archived"] == ["true"]
+    top = {p["id_producto"]: p["cantidad_total"] for p in client.get("/reporte/top-productos-vendidos/").json()}
+    assert top == {1: 1, 2: 1}  # la comanda 1 sigue pendiente en la copia local
+
+    mock_http.side_effect = upstream(comandas=comandas)
+    client.post("/reporte/sincronizar?reconciliar=true")
+    top = {p["id_producto"]: p["cantidad_total"] for p in client.get("/reporte/top-productos-vendidos/").json()}
+    assert top == {1: 3, 2: 1}
+    assert client.get("/reporte/sincronizacion").json()[0]["reconciliado_en"] is not None
+
+@patch('httpx.AsyncClient.send', new_callable=AsyncMock)
+def test_sincronizacion_no_bloquea_el_event_loop(mock_http, client):
+    """
+    La sincronización pagina en el event loop pero guarda cada lote, lee y avanza
+    la marca de agua y vuelca las latencias en threads.
+    """
+    import asyncio
+    import threading
+    from sqlalchemy import event
+    from src.reporte import sincronizacion
+
+    mock_http.side_effect = upstream(
+        comandas=[comanda(1, "2023-10-02", detalles=[(1, 2)]), comanda(2, "2023-10-03")],
+        facturas=[factura(1, "2023-10-02", 100.0)],
+        reservas=[reserva(1, "2023-10-02", id_cliente=7)],
+    )
+    aproximados.registro_latencias.registrar("GET /reporte/x", 5.0)
+    hilos = []
+
+    def registrar(*args):
+        hilos.append(threading.get_ident())
+
+    async def correr():
+        await asyncio.to_thread(sincronizacion._volcar_latencias, engine)
+        copiadas = await sincronizacion.sincronizar(engine, reconciliacion=True)
+        return copiadas, threading.get_ident()
+
+    event.listen(engine, "before_cursor_execute", registrar)
+    try:
+        copiadas, hilo_del_loop = asyncio.run(correr())
+    finally:
+        event.remove(engine, "before_cursor_execute", registrar)
+
+    assert copiadas["comandas"] == 4  # la reconciliación vuelve a copiar las mismas dos
+    assert hilos and hilo_del_loop not in hilos
+    estados = {e["fuente"]: e for e in client.get("/reporte/sincronizacion").json()}
+    assert estados["comandas"]["ultimo_id"] == 2
+    assert estados["comandas"]["reconciliado_en"] is not None
+
+@patch('httpx.AsyncClient.send', new_callable=AsyncMock)
+def test_sketches_se_recalculan_una_vez_por_copia(mock_http, client):
+    """
+    Los días que tocan varios lotes se recalculan una sola vez, al terminar de copiar la fuente.
+    """
+    paginas = 3
+
+    def responder(url):
+        if "/comanda/" not in url:
+            return respuesta_paginada([])
+        pagina = int(parse_qs(urlparse(url).query)["page"][0])
+        return respuesta_paginada(
+            [comanda(pagina, f"2023-10-0{1 + pagina % 2}", detalles=[(1, pagina)])], pagina, paginas
+        )
+
+    mock_http.side_effect = por_url(responder)
+    with patch.object(aproximados, "recalcular", wraps=aproximados.recalcular) as recalcular:
+        assert client.post("/reporte/sincronizar").json()["copiadas"]["comandas"] == paginas
+
+    llamadas = [c for c in recalcular.call_args_list if c.args[1] == "comandas"]
+    assert len(llamadas) == 1
+    assert list(llamadas[0].args[2]) == [date(2023, 10, 1), date(2023, 10, 2)]
+
+    data = client.get("/reporte/aproximado/top-productos?desde=2023-10-01&hasta=2023-10-02").json()
+    assert data["total_unidades"] == 1 + 2 + 3  # los sketches tienen los tres lotes
+
+def test_ciclo_de_sincronizacion_registra_errores(client, caplog):
+    """
+    Un error en el ciclo de sincronización queda en el log con su traceback y el ciclo sigue.
+    """
+    import asyncio
+    from src.reporte import sincronizacion
+
+    with patch.object(sincronizacion, "sincronizar", AsyncMock(side_effect=RuntimeError("servicio caído"))), \
+            patch.object(sincronizacion.asyncio, "sleep", AsyncMock(side_effect=asyncio.CancelledError)):
+        with pytest.raises(asyncio.CancelledError):
+            asyncio.run(sincronizacion.ciclo_sincronizacion(engine))
+    assert "Error sincronizando datos de reportes" in caplog.text
+    assert "RuntimeError: servicio caído" in caplog.text
+
+@patch('httpx.AsyncClient.send', new_callable=AsyncMock)
+def test_cache_de_reportes(mock_http, client):
+    """
+    Un período cerrado queda cacheado; uno abierto vencido se sirve y se
+    recalcula en segundo plano, y una sincronización con filas nuevas lo invalida.
+    """
+    hoy = date.today()
+    año, mes = hoy.year, hoy.month
+    mock_http.side_effect = upstream(facturas=[factura(1, "2023-01-15", 1000.0), factura(2, hoy.isoformat(), 50.0)])
+    assert client.post("/reporte/sincronizar").status_code == 200
+    assert client.get("/reporte/ganancias-mensuales/?año=2023").json()[0]["ganancia"] == 1000.0
+    # Período abierto, cacheado con TTL 0 para que venza enseguida
+    with patch("src.reporte.cache.settings.REPORTE_CACHE_TTL_SEGUNDOS", 0):
+        assert client.get(f"/reporte/ganancias-mensuales/?año={año}").json()[mes - 1]["ganancia"] == 50.0
+
+    # Cambios en la copia local sin pasar por la sincronización
+    with TestingSessionLocal() as db:
+        db.add_all([
+            FacturaHecho(id=3, id_comanda=3, fecha_emision=datetime(2023, 1, 20), total=500.0,
+                         medio_pago="efectivo", estado="pagada"),
+            FacturaHecho(id=4, id_comanda=4, fecha_emision=datetime.combine(hoy, datetime.min.time()), total=25.0,
+                         medio_pago="efectivo", estado="pagada"),
+        ])
+        db.commit()
+
+    # 2023 está cerrado: sigue la entrada cacheada
+    assert client.get("/reporte/ganancias-mensuales/?año=2023").json()[0]["ganancia"] == 1000.0
+
+    # Año actual vencido: se sirve el valor anterior y el siguiente pedido ya ve el recalculado
+    assert client.get(f"/reporte/ganancias-mensuales/?año={año}").json()[mes - 1]["ganancia"] == 50.0
+    assert cache_reportes.estadisticas()["stale"] == 1
+    assert client.get(f"/reporte/ganancias-mensuales/?año={año}").json()[mes - 1]["ganancia"] == 75.0
+
+    # Una sincronización con filas nuevas invalida solo los períodos abiertos
+    mock_http.side_effect = upstream(facturas=[factura(5, hoy.isoformat(), 10.0)])
+    assert client.post("/reporte/sincronizar").status_code == 200
+    assert client.get(f"/reporte/ganancias-mensuales/?año={año}").json()[mes - 1]["ganancia"] == 85.0
+    assert client.get("/reporte/ganancias-mensuales/?año=2023").json()[0]["ganancia"] == 1000.0
+
+    # Invalidación administrativa
+    response = client.delete("/reporte/cache?endpoint=ganancias-mensuales")
+    assert response.status_code == 200
+    assert response.json()["invalidadas"] == 2
+    assert client.get("/reporte/ganancias-mensuales/?año=2023").json()[0]["ganancia"] == 1500.0
+
+@patch('httpx.AsyncClient.send', new_callable=AsyncMock)
+def test_cache_descarta_la_entrada_menos_usada(mock_http, client):
+    """
+    Con REPORTE_CACHE_MAX_ENTRADAS entradas la caché descarta la usada hace más tiempo.
+    """
+    mock_http.side_effect = upstream(facturas=[factura(1, "2023-01-15", 1000.0)])
+    assert client.post("/reporte/sincronizar").status_code == 200
+
+    hits, misses = cache_reportes.hits, cache_reportes.misses
+    with patch("src.reporte.cache.settings.REPORTE_CACHE_MAX_ENTRADAS", 2):
+        for año in (2023, 2022, 2023, 2021):  # 2023 se vuelve a usar antes de que entre 2021
+            assert client.get(f"/reporte/ganancias-mensuales/?año={año}").status_code == 200
+        assert cache_reportes.estadisticas()["entradas"] == 2
+        assert (cache_reportes.hits - hits, cache_reportes.misses - misses) == (1, 3)
+
+        client.get("/reporte/ganancias-mensuales/?año=2023")
+        client.get("/reporte/ganancias-mensuales/?año=2022")  # fue descartada
+        assert (cache_reportes.hits - hits, cache_reportes.misses - misses) == (2, 4)
+        assert cache_reportes.estadisticas()["entradas"] == 2
+
+@patch('httpx.AsyncClient.send', new_callable=AsyncMock)
+def test_motor_columnar_coincide_con_sql(mock_http, client):
+    """
+    El motor columnar (NumPy) da los mismos resultados que las consultas SQL.
+    """
+    from src.reporte import columnar, consultas
+
+    mock_http.side_effect = upstream(
+        comandas=[
+            comanda(1, "2023-10-01", "pagada", id_mozo=2, detalles=[(1, 2), (7, 1)]),
+            comanda(2, "2023-10-02", "facturada", id_mozo=1, detalles=[(1, 3), (3, 4)]),
+            comanda(3, "2023-10-08", "pendiente", id_mozo=2, detalles=[(2, 9)]),
+            comanda(4, "2023-12-31", "pagada", id_mozo=3, detalles=[(3, 1)]),
+            comanda(5, "2024-01-01", "pagada", id_mozo=3, detalles=[(7, 4)]),
+        ],
+        facturas=[
+            factura(1, "2023-01-01T00:00:00", 100.0),
+            factura(2, "2023-06-15T18:30:00", 250.5),
+            factura(3, "2023-12-31T23:59:59", 75.0),
+            factura(4, "2023-12-31T10:00:00", 10.0, estado="pendiente"),
+            factura(5, "2024-01-01T00:00:00", 999.0),
+        ],
+    )
+    assert client.post("/reporte/sincronizar").status_code == 200
+
+    with TestingSessionLocal() as db:
+        for año in (2022, 2023, 2024):
+            assert columnar.ganancias_mensuales(db, año) == consultas.ganancias_mensuales(db, año)
+        assert columnar.top_productos(db, 5) == consultas.top_productos(db, 5)
+        for desde, hasta in ((date(2023, 10, 1), date(2023, 10, 7)), (date(2023, 1, 1), date(2024, 12, 31))):
+            assert columnar.comandas_por_dia_semana(db, desde, hasta) == consultas.comandas_por_dia_semana(db, desde, hasta)
+            assert columnar.comandas_por_mozo(db, desde, hasta) == consultas.comandas_por_mozo(db, desde, hasta)
+            assert columnar.dashboard(db, desde, hasta) == consultas.dashboard(db, desde, hasta)
+        assert columnar.comandas_por_mozo(db, date(2020, 1, 1), date(2020, 1, 31)) == []
+
+@patch('src.main.ciclo_sincronizacion', new_callable=AsyncMock)
+@patch('httpx.AsyncClient.send', new_callable=AsyncMock)
+def test_trabajos_de_reportes(mock_http, mock_ciclo, client):
+    """
+    Un reporte pedido como trabajo se calcula en segundo plano y su resultado
+    queda guardado; los trabajos idénticos activos se reutilizan.
+    """
+    import time
+    from src.reporte import trabajos
+
+    mock_http.side_effect = upstream(comandas=[
+        comanda(1, "2023-10-02"),  # Lunes
+        comanda(2, "2023-10-03"),  # Martes
+        comanda(3, "2023-10-09"),  # Lunes
+    ])
+    assert client.post("/reporte/sincronizar").status_code == 200
+
+    # Deduplicación: mismo reporte y parámetros (en otro orden) mientras está pendiente
+    with TestingSessionLocal() as db:
+        parametros = {"fecha_desde": "2023-10-01", "fecha_hasta": "2023-10-31"}
+        primero, nuevo = trabajos.crear_o_reutilizar(db, "dias-concurridos", parametros)
+        assert nuevo
+        segundo, nuevo = trabajos.crear_o_reutilizar(db, "dias-concurridos", dict(reversed(parametros.items())))
+        assert not nuevo and segundo.id == primero.id
+        id_primero = primero.id
+        primero.estado = "completado"
+        db.commit()
+
+    def esperar(cliente, id_trabajo):
+        for _ in range(100):
+            trabajo = cliente.get(f"/reporte/jobs/{id_trabajo}").json()
+            if trabajo["estado"] in ("completado", "error"):
+                return trabajo
+            time.sleep(0.02)
+        raise AssertionError("el trabajo no terminó")
+
+    # Con el lifespan activo para que la cola de trabajos viva entre requests
+    with TestClient(app) as cliente:
+        response = cliente.post("/reporte/jobs", json={
+            "reporte": "dias-concurridos",
+            "parametros": {"fecha_desde": "2023-10-01", "fecha_hasta": "2023-10-31"},
+        })
+        assert response.status_code == 202
+        assert response.json()["id"] != id_primero  # el anterior ya no está activo
+
+        trabajo = esperar(cliente, response.json()["id"])
+        assert trabajo["estado"] == "completado"
+        assert trabajo["resultado"]["lunes"] == 2
+        assert trabajo["resultado"]["martes"] == 1
+
+        # Un reporte que falla deja el error registrado
+        response = cliente.post("/reporte/jobs", json={"reporte": "mozo-del-mes", "parametros": {"año": 2020, "mes": 1}})
+        trabajo = esperar(cliente, response.json()["id"])
+        assert trabajo["estado"] == "error"
+        assert "No se encontraron comandas" in trabajo["error"]
+
+        # Parámetros inválidos para el reporte
+        response = cliente.post("/reporte/jobs", json={"reporte": "mozo-del-mes", "parametros": {"año": 2023, "mes": 13}})
+        assert response.status_code == 422
+
+    assert client.get("/reporte/jobs/9999").status_code == 404
+
+@patch('httpx.AsyncClient.send', new_callable=AsyncMock)
+def test_trabajo_no_bloquea_el_event_loop(mock_http, client):
+    """
+    Ninguna consulta de un trabajo (estado, cálculo del reporte y resultado) corre
+    en el thread del event loop de la cola.
+    """
+    import asyncio
+    import threading
+    from sqlalchemy import event
+    from src.reporte import trabajos
+
+    mock_http.side_effect = upstream(comandas=[comanda(1, "2023-10-02"), comanda(2, "2023-10-03")])
+    assert client.post("/reporte/sincronizar").status_code == 200
+    with TestingSessionLocal() as db:
+        trabajo, _ = trabajos.crear_o_reutilizar(
+            db, "dias-concurridos", {"fecha_desde": "2023-10-01", "fecha_hasta": "2023-10-31"}
+        )
+        id_trabajo = trabajo.id
+
+    hilos = []
+
+    def registrar(*args):
+        hilos.append(threading.get_ident())
+
+    async def correr():
+        await trabajos.ejecutar(id_trabajo, engine)
+        return threading.get_ident()
+
+    event.listen(engine, "before_cursor_execute", registrar)
+    try:
+        hilo_del_loop = asyncio.run(correr())
+    finally:
+        event.remove(engine, "before_cursor_execute", registrar)
+
+    assert hilos and hilo_del_loop not in hilos
+    trabajo = client.get(f"/reporte/jobs/{id_trabajo}").json()
+    assert trabajo["estado"] == "completado"
+    assert trabajo["resultado"]["lunes"] == 1
+
+def test_cola_de_trabajos_registra_errores(caplog):
+    """
+    Un error inesperado de un worker de la cola queda en el log con su traceback.
+    """
+    import asyncio
+    from src.reporte import trabajos
+
+    async def correr():
+        cola = trabajos.ColaTrabajos()
+        cola.encolar(42, engine)
+        await cola._cola.join()
+        await cola.detener()
+
+    with patch.object(trabajos, "ejecutar", AsyncMock(side_effect=RuntimeError("sin base"))):
+        asyncio.run(correr())
+    assert "Error ejecutando el trabajo de reporte 42" in caplog.text
+    assert "RuntimeError: sin base" in caplog.text
+
+@patch('httpx.AsyncClient.send', new_callable=AsyncMock)
+def test_dashboard(mock_http, client):
+    """
+    El dashboard devuelve los cuatro reportes del rango con una sola carga de
+    datos y un request por servicio para los nombres.
+    """
+    productos = {1: {"id": 1, "nombre": "Pizza", "tipo": "plato"}, 2: {"id": 2, "nombre": "Cerveza", "tipo": "bebida"}}
+    mozos = {1: {"id": 1, "nombre": "Juan", "apellido": "Pérez"}, 2: {"id": 2, "nombre": "María", "apellido": "García"}}
+
+    def otros(url):
+        return servicio_por_ids(url, productos if "/productos" in url else mozos)
+
+    mock_http.side_effect = upstream(
+        comandas=[
+            comanda(1, "2023-10-30", id_mozo=1, detalles=[(1, 2)]),  # Lunes
+            comanda(2, "2023-11-06", id_mozo=1, detalles=[(2, 5)]),  # Lunes
+            comanda(3, "2023-11-07", "pendiente", id_mozo=2, detalles=[(1, 9)]),  # Martes, no es venta
+            comanda(4, "2023-12-01", id_mozo=2, detalles=[(1, 1)]),  # Fuera de rango
+        ],
+        facturas=[
+            factura(1, "2023-10-30T20:00:00", 100.0),
+            factura(2, "2023-11-06T21:00:00", 250.0),
+            factura(3, "2023-11-07T21:00:00", 40.0, estado="pendiente"),
+            factura(4, "2023-12-01T12:00:00", 999.0),
+        ],
+        otros=otros,
+    )
+    assert client.post("/reporte/sincronizar").status_code == 200
+
+    mock_http.reset_mock()
+    response = client.get("/reporte/dashboard?desde=2023-10-15&hasta=2023-11-30")
+    assert response.status_code == 200
+    data = response.json()
+
+    assert data["ganancias_mensuales"] == [
+        {"año": 2023, "mes": 10, "ganancia": 100.0},
+        {"año": 2023, "mes": 11, "ganancia": 250.0},
+    ]
+    assert [(p["id_producto"], p["nombre"], p["cantidad_total"]) for p in data["top_productos"]] == [
+        (2, "Cerveza", 5), (1, "Pizza", 2),
+    ]
+    assert data["dias_concurridos"]["lunes"] == 2
+    assert data["dias_concurridos"]["martes"] == 1
+    assert [(m["nombre_completo"], m["cantidad_comandas"]) for m in data["ranking_mozos"]] == [
+        ("Juan Pérez", 2), ("María García", 1),
+    ]
+    # Un request en lote a productos y otro a mozos
+    assert mock_http.call_count == 2
+
+    # Con REPORTE_MOTOR=sql el dashboard sale de las consultas y da lo mismo
+    cache_reportes.invalidar()
+    with patch("src.reporte.reportes.settings.REPORTE_MOTOR", "sql"):
+        assert client.get("/reporte/dashboard?desde=2023-10-15&hasta=2023-11-30").json() == data
+
+    assert client.get("/reporte/dashboard?desde=2023-11-30&hasta=2023-10-15").status_code == 400
+
+def test_sketches():
+    """
+    Los sketches estiman dentro de sus cotas de error, se combinan (como los
+    días de un rango) y se serializan sin perder información.
+    """
+    import random
+    from src.reporte.sketches import CountMinSketch, HyperLogLog, TDigest
+
+    # HyperLogLog: 20.000 distintos repartidos en dos días que se solapan
+    dia_1, dia_2 = HyperLogLog(), HyperLogLog()
+    for i in range(12_000):
+        dia_1.agregar(i)
+    for i in range(8_000, 20_000):
+        dia_2.agregar(i)
+    dia_1.merge(HyperLogLog.desde_dict(dia_2.a_dict()))
+    assert abs(dia_1.estimar() - 20_000) <= 3 * dia_1.error_relativo * 20_000
+
+    # Count-Min Sketch: nunca subestima y no sobreestima más de ε·N
+    rng = random.Random(0)
+    reales = {}
+    dia_1, dia_2 = CountMinSketch(), CountMinSketch()
+    for sketch in (dia_1, dia_2):
+        for _ in range(5_000):
+            producto = min(int(rng.paretovariate(1.2)), 300)
+            sketch.agregar(producto)
+            reales[producto] = reales.get(producto, 0) + 1
+    dia_1.merge(CountMinSketch.desde_dict(dia_2.a_dict()))
+    assert dia_1.total == 10_000
+    for producto, cantidad in reales.items():
+        assert cantidad <= dia_1.estimar(producto) <= cantidad + dia_1.error_maximo
+    mas_vendidos = sorted(reales, key=lambda p: (-reales[p], p))[:3]
+    assert [p for p, _ in dia_1.mas_frecuentes(3)] == mas_vendidos
+
+    # t-digest: cuantiles dentro del error de rango informado
+    valores = [rng.expovariate(1 / 50) for _ in range(20_000)]
+    dia_1, dia_2 = TDigest(), TDigest()
+    for i, valor in enumerate(valores):
+        (dia_1 if i % 2 else dia_2).agregar(valor)
+    dia_1.merge(TDigest.desde_dict(dia_2.a_dict()))
+    ordenados = sorted(valores)
+    assert dia_1.cantidad == 20_000
+    for q in (0.5, 0.9, 0.99):
+        valor, error_rango = dia_1.cuantil(q)
+        rango_real = sum(v <= valor for v in ordenados) / len(ordenados)
+        assert abs(rango_real - q) <= max(error_rango, 0.005)
+    assert len(dia_1.medias) < 200  # memoria acotada por la compresión
+
+@patch('httpx.AsyncClient.send', new_callable=AsyncMock)
+def test_reportes_aproximados(mock_http, client):
+    """
+    Los sketches diarios se arman al sincronizar (y se recalculan si cambia un
+    día) y los endpoints aproximados combinan los días del rango.
+    """
+    reservas = [
+        reserva(1, "2023-05-02", id_cliente=1),
+        reserva(2, "2023-05-03", id_cliente=2),
+        reserva(3, "2023-05-20", id_cliente=1),  # mismo cliente otro día
+        reserva(4, "2023-05-21", id_cliente=3, baja=True),  # no cuenta
+        reserva(5, "2023-06-01", id_cliente=4),  # otro mes
+    ]
+    comandas = [
+        comanda(1, "2023-05-02", detalles=[(1, 3), (2, 1)]),
+        comanda(2, "2023-05-03", detalles=[(2, 5)]),
+        comanda(3, "2023-05-03", estado="pendiente", detalles=[(3, 9)]),  # no es venta
+    ]
+    productos = {1: {"id": 1, "nombre": "Milanesa", "tipo": "plato"}, 2: {"id": 2, "nombre": "Agua", "tipo": "bebida"}}
+    mock_http.side_effect = upstream(
+        comandas=comandas, reservas=reservas, otros=lambda url: servicio_por_ids(url, productos)
+    )
+    assert client.post("/reporte/sincronizar").json()["copiadas"]["reservas"] == 5
+
+    data = client.get("/reporte/aproximado/clientes-distintos?año=2023&mes=5").json()
+    assert data["clientes_distintos"] == 2
+    assert data["minimo"] <= 2 <= data["maximo"]
+    assert 0 < data["error_relativo"] < 0.05
+
+    data = client.get("/reporte/aproximado/top-productos?desde=2023-05-01&hasta=2023-05-31&limite=2").json()
+    assert [(p["id_producto"], p["nombre"], p["cantidad_estimada"]) for p in data["productos"]] == [
+        (2, "Agua", 6), (1, "Milanesa", 3)
+    ]
+    assert data["total_unidades"] == 9
+    assert data["error_maximo"] == pytest.approx(0.09)
+    assert data["confianza"] == 0.99
+
+    # La comanda 2 pasa a junio y la 3 se paga: la copia completa recalcula los días que cambiaron
+    comandas[1] = comanda(2, "2023-06-01", detalles=[(2, 5)])
+    comandas[2] = comanda(3, "2023-05-03", detalles=[(3, 9)])
+    mock_http.side_effect = upstream(comandas=comandas, otros=lambda url: servicio_por_ids(url, productos))
+    client.post("/reporte/sincronizar?completa=true")
+    data = client.get("/reporte/aproximado/top-productos?desde=2023-05-01&hasta=2023-05-31").json()
+    assert [(p["id_producto"], p["cantidad_estimada"]) for p in data["productos"]] == [(3, 9), (1, 3), (2, 1)]
+
+    assert client.get("/reporte/aproximado/top-productos?desde=2023-06-01&hasta=2023-05-01").status_code == 400
+
+    # Latencias por plantilla de ruta, con los requests hechos hasta ahora
+    hoy = date.today().isoformat()
+    data = client.get(f"/reporte/aproximado/latencias?desde={hoy}&hasta={hoy}").json()
+    rutas = {r["ruta"]: r for r in data}
+    assert rutas["GET /reporte/aproximado/top-productos"]["cantidad"] == 3
+    assert rutas["POST /reporte/sincronizar"]["cantidad"] == 2
+    cuantiles = rutas["POST /reporte/sincronizar"]["cuantiles"]
+    assert [c["cuantil"] for c in cuantiles] == [0.5, 0.9, 0.95, 0.99]
+    assert all(c["ms"] > 0 for c in cuantiles)
+    data = client.get(f"/reporte/aproximado/latencias?desde={hoy}&hasta={hoy}&ruta=POST /reporte/sincronizar").json()
+    assert [r["ruta"] for r in data] == ["POST /reporte/sincronizar"]
+
+@patch('httpx.AsyncClient.send', new_callable=AsyncMock)
+def test_agregacion_en_pool_de_procesos(mock_http, client, tmp_path):
+    """
+    Con el pool de procesos activo los reportes columnares cargan y agregan en
+    otro proceso, con su propia conexión a la base, y dan lo mismo que en un thread.
+    """
+    import sqlite3
+    from src.config import settings
+    from src.reporte.procesos import pool_agregaciones
+
+    mozos = {1: {"id": 1, "nombre": "Ana", "apellido": "Gómez"}, 2: {"id": 2, "nombre": "Luis", "apellido": "Pérez"}}
+    mock_http.side_effect = upstream(
+        comandas=[
+            comanda(1, "2023-10-02", id_mozo=1, detalles=[(1, 2), (2, 1)]),
+            comanda(2, "2023-10-03", id_mozo=2, detalles=[(2, 4)]),
+            comanda(3, "2023-10-09", id_mozo=2, detalles=[(3, 1)]),
+        ],
+        facturas=[factura(1, "2023-10-02T20:00:00", 150.0), factura(2, "2023-10-03T21:00:00", 90.0)],
+        otros=lambda url: servicio_por_ids(url, mozos if "/mozo" in url else {}),
+    )
+    assert client.post("/reporte/sincronizar").status_code == 200
+    urls = [
+        "/reporte/mozo-del-mes/?año=2023&mes=10",
+        "/reporte/top-productos-vendidos/",
+        "/reporte/dashboard?desde=2023-10-01&hasta=2023-10-31",
+    ]
+    # La base en memoria no se puede abrir desde otro proceso: corre en un thread
+    en_un_thread = [client.get(url).json() for url in urls]
+
+    # Copia a un archivo, que sí pueden abrir los procesos del pool
+    archivo = tmp_path / "reporte.db"
+    with sqlite3.connect(archivo) as destino:
+        engine.raw_connection().driver_connection.backup(destino)
+    engine_archivo = create_engine(f"sqlite:///{archivo}")
+
+    def get_db_archivo():
+        with Session(engine_archivo) as db:
+            yield db
+
+    cache_reportes.invalidar()
+    app.dependency_overrides[get_db] = get_db_archivo
+    # En este proceso la carga falla: si los reportes responden, cargaron en el pool
+    with patch.object(settings, "REPORTE_PROCESOS", 1), patch("src.reporte.columnar._cargar", side_effect=AssertionError):
+        try:
+            assert [client.get(url).json() for url in urls] == en_un_thread
+        finally:
+            pool_agregaciones.cerrar()
+            app.dependency_overrides[get_db] = override_get_db
+            engine_archivo.dispose()
+    assert en_un_thread[0]["nombre_completo"] == "Luis Pérez"